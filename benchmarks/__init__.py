@@ -0,0 +1,7 @@
+"""
+Benchmarks of the shaclAPI, which do not need an external SPARQL endpoint.
+
+The scenarios (the examples in examples/ and the test cases in tests/tc*) are executed through :func:`shaclapi.api.run_multiprocessing`
+against a SPARQL endpoint answering the queries with rdflib in the benchmarking process (see :class:`benchmarks.endpoint.LocalSPARQLEndpoint`).
+Run ``python -m benchmarks --help`` from the root of the repository for the options.
+"""
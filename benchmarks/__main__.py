@@ -0,0 +1,64 @@
+import argparse
+import logging
+import sys
+
+import shaclapi.logger as shaclapi_logger
+from benchmarks.harness import format_summary, run_benchmark, summarize, write_csv
+from benchmarks.scenarios import find_scenarios
+
+
+def parse_options(entries):
+    """Parses 'option=value,option=value' into a dictionary; the values are passed on as strings like the options of a POST request."""
+    options = {}
+    for entry in filter(None, entries.split(',')):
+        key, _, value = entry.partition('=')
+        options[key.strip()] = value.strip()
+    return options
+
+
+def parse_variant(entry):
+    """Parses 'name:option=value,...' into the name and the options of the variant."""
+    name, _, options = entry.partition(':')
+    return name, parse_options(options)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Runs the examples and test cases against a local SPARQL endpoint '
+                                     'and reports wall time, time to the first answer, throughput and memory.')
+    parser.add_argument('-s', '--scenario', action='append', help='fnmatch pattern of the scenarios to run, e.g., tests/tc1/* (default: all)')
+    parser.add_argument('-g', '--generated', action='append', default=[],
+                        help='directory with data and queries generated by python -m benchmarks.generator; its scenarios are named generated/<directory>/*')
+    parser.add_argument('-v', '--variant', action='append', type=parse_variant,
+                        help='variant of the configuration to compare, e.g., fused:fused_pipeline=True,use_pipes=False (default: the configuration of the scenario)')
+    parser.add_argument('-o', '--option', type=parse_options, default={}, help='options added to all requests, e.g., backend=travshacl')
+    parser.add_argument('-r', '--repetitions', type=int, default=3)
+    parser.add_argument('-w', '--warmup', type=int, default=1)
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='artificial latency of each request to the endpoint in seconds')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0, help='maximal random jitter added to the latency in seconds')
+    parser.add_argument('-d', '--data', action='append', help='data file served instead of the data of the scenarios (e.g., generated data)')
+    parser.add_argument('-e', '--endpoint', help='URL of a running SPARQL endpoint serving the data of the scenarios, used instead of the local endpoint')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the memory')
+    parser.add_argument('--csv', help='file to write the measurements of all repetitions to')
+    parser.add_argument('--list', action='store_true', help='list the scenarios and exit')
+    args = parser.parse_args(argv)
+
+    scenarios = find_scenarios(args.scenario, args.generated)
+    if args.list:
+        for scenario in scenarios:
+            print(scenario.name)
+        return 0
+
+    shaclapi_logger.setup(level=logging.ERROR)
+    logging.basicConfig(format='[%(asctime)s - %(levelname)s] %(name)s: %(msg)s')
+    logging.getLogger('benchmarks').setLevel(logging.INFO)
+    variants = {name: dict(args.option, **options) for name, options in args.variant or [('default', {})]}
+    rows = run_benchmark(scenarios, variants, args.repetitions, args.warmup, args.latency, args.jitter, args.data, not args.no_memory,
+                         endpoint_url=args.endpoint)
+    if args.csv:
+        write_csv(rows, args.csv)
+    print(format_summary(summarize(rows)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
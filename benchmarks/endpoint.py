@@ -0,0 +1,135 @@
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import rdflib
+from rdflib import Graph
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.plugins.sparql.aggregates import Counter
+from rdflib.plugins.sparql.sparql import NotBoundError
+
+from shaclapi.query import PARSER_LOCK
+
+logger = logging.getLogger(__name__)
+
+
+def _counter_use_row(self, row):
+    try:
+        return self.eval_row(row) not in self.seen
+    except NotBoundError:
+        # COUNT(DISTINCT ?var) over unbound values, e.g., of an OPTIONAL, as in the constraint queries of Trav-SHACL.
+        return False
+
+
+if int(rdflib.__version__.split('.')[0]) < 7:
+    # Backport of the fix of rdflib 7, older versions fail with a NotBoundError instead of not counting the unbound values.
+    Counter.use_row = _counter_use_row
+
+
+class LocalSPARQLEndpoint:
+    """
+    SPARQL endpoint answering queries over an rdflib graph; the HTTP server runs in a thread of the current process.
+
+    Each request is delayed by latency seconds plus a random jitter of up to jitter seconds before it is answered,
+    which imitates the network and the query processing of a remote endpoint. With the same seed the delays are reproducible.
+
+    Example
+    -------
+    with LocalSPARQLEndpoint(['examples/lubm/data/test_data.ttl'], latency=0.01) as endpoint:
+        run_multiprocessing({'external_endpoint': endpoint.url, ...})
+    """
+
+    def __init__(self, data=(), graph=None, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, seed=0):
+        self.graph = graph if graph is not None else Graph()
+        for file in data:
+            self.graph.parse(file)
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.number_of_requests = 0
+        self.server = None
+        self.thread = None
+        # The evaluation of rdflib is not thread-safe.
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}/sparql'.format(self.host, self.port)
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info('Serving {} triples at {}'.format(len(self.graph), self.url))
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def answer(self, query):
+        """Returns the content type and the serialized result of the query."""
+        with self.lock:
+            self.number_of_requests += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        with PARSER_LOCK:
+            # The endpoint usually runs in the process of the API, which parses queries in other threads, too.
+            query = prepareQuery(query)
+        with self.lock:
+            result = self.graph.query(query)
+            if result.type in ('CONSTRUCT', 'DESCRIBE'):
+                return 'text/turtle', result.serialize(format='turtle')
+            return 'application/sparql-results+json', result.serialize(format='json')
+
+
+def _handler(endpoint):
+    class SPARQLRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.answer(parse_qs(urlparse(self.path).query).get('query', [None])[0])
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf8')
+            if self.headers.get('Content-Type', '').startswith('application/sparql-query'):
+                self.answer(body)
+            else:
+                self.answer(parse_qs(body).get('query', [None])[0])
+
+        def answer(self, query):
+            if query is None:
+                self.send_error(400, 'The parameter query is missing')
+                return
+            try:
+                content_type, body = endpoint.answer(query)
+            except Exception as e:
+                logger.exception('Could not answer the query {}'.format(query))
+                self.send_error(400, repr(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return SPARQLRequestHandler
@@ -0,0 +1,209 @@
+"""
+Generator of synthetic LUBM-style data together with a matching shape schema (JSON and SHACL) and a workload of star-shaped queries.
+
+The shape schema is a tree: the target shape (FullProfessor) references fan_out shapes, each of them fan_out shapes and so on until depth.
+Each shape requires exactly one ub:name, at least one ub:email and, for each referenced shape, at least one instance valid
+against it via its own predicate (e.g. ub:worksFor for Department). Each instance links to links instances of each referenced shape.
+
+An instance is invalid because it has two names (direct violation) or because none of the instances it links to for one of the
+referenced shapes is valid (violation by reference). The fraction of invalid target instances is exactly invalid_ratio; the instances
+below the target level are invalid with probability invalid_ratio as well, as long as that does not change the validity of the target instance.
+The data is written as N-Triples while it is generated, hence, the memory needed does not depend on the number of triples.
+
+Run ``python -m benchmarks.generator --help`` for the options; the output directory can be passed to ``python -m benchmarks -g``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+UB = 'http://swat.cse.lehigh.edu/onto/univ-bench.owl#'
+DATA = 'http://example.com/'
+SHAPES = 'http://example.com/shapes/'
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+
+LEVEL_CLASSES = ['FullProfessor', 'Department', 'University', 'ResearchGroup']
+LEVEL_PREDICATES = ['worksFor', 'subOrganizationOf', 'affiliatedOrganizationOf', 'member']
+
+
+class ShapeNode:
+    """A shape of the generated schema: its name, the class of its targets, the predicate referencing it and the shapes it references."""
+
+    def __init__(self, level, path):
+        suffix = ''.join('_' + str(branch) for branch in path[1:])
+        self.level = level
+        self.name = (LEVEL_CLASSES[level] if level < len(LEVEL_CLASSES) else 'Organization' + str(level)) + suffix
+        self.predicate = (LEVEL_PREDICATES[level - 1] if level <= len(LEVEL_PREDICATES) else 'relatedTo' + str(level)) + suffix if level > 0 else None
+        self.children = []
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def build_schema(depth, fan_out):
+    """Returns the target shape of a tree of shapes with depth levels below the target shape and fan_out references per shape."""
+    def build(level, path):
+        node = ShapeNode(level, path)
+        if level < depth:
+            node.children = [build(level + 1, path + (branch, )) for branch in range(1, fan_out + 1)]
+        return node
+    return build(0, (0, ))
+
+
+def triples_per_target(shape, links):
+    """Returns the number of triples of a valid target instance including the instances it links to."""
+    return 3 + sum(links * (1 + triples_per_target(child, links)) for child in shape.children)
+
+
+class DataGenerator:
+    """Writes the instances of the shape tree as N-Triples and records the expected validation result of the target instances."""
+
+    def __init__(self, schema, links, invalid_ratio, seed=0):
+        self.schema = schema
+        self.links = links
+        self.invalid_ratio = invalid_ratio
+        self.random = random.Random(seed)
+        self.counters = {}
+        self.number_of_triples = 0
+        self.valid_targets = []
+        self.invalid_targets = []
+
+    def generate(self, file, number_of_targets):
+        for target in range(number_of_targets):
+            # Spreads the invalid targets evenly, such that exactly round(number_of_targets * invalid_ratio) are invalid.
+            invalid = int((target + 1) * self.invalid_ratio + 0.5) > int(target * self.invalid_ratio + 0.5)
+            iri = self.instance(file, self.schema, valid=not invalid)
+            (self.invalid_targets if invalid else self.valid_targets).append([iri, self.schema.name])
+
+    def instance(self, file, shape, valid):
+        """Writes an instance of the shape, which is valid or not, and the instances it links to; returns its IRI."""
+        index = self.counters.get(shape.name, 0)
+        self.counters[shape.name] = index + 1
+        iri = '{}{}-{}'.format(DATA, shape.name, index)
+        direct_violation = not valid and (not shape.children or self.random.random() < 0.5)
+        broken_child = None if valid or direct_violation else self.random.choice(shape.children)
+        self.write(file, iri, RDF_TYPE, '<' + UB + shape.name + '>')
+        self.write(file, iri, '<' + UB + 'name>', '"{}-{}"'.format(shape.name, index))
+        if direct_violation:
+            self.write(file, iri, '<' + UB + 'name>', '"{}-{} (duplicate)"'.format(shape.name, index))
+        self.write(file, iri, '<' + UB + 'email>', '"{}-{}@example.com"'.format(shape.name.lower(), index))
+        for child in shape.children:
+            for link in range(self.links):
+                if child is broken_child:
+                    child_valid = False
+                else:
+                    # At least the first instance is valid, if the instance depends on it.
+                    child_valid = link == 0 or self.random.random() >= self.invalid_ratio
+                self.write(file, iri, '<' + UB + child.predicate + '>', '<' + self.instance(file, child, child_valid) + '>')
+        return iri
+
+    def write(self, file, subject, predicate, object):
+        file.write('<{}> {} {} .\n'.format(subject, predicate, object))
+        self.number_of_triples += 1
+
+
+def shape_json(shape):
+    constraints = [{'path': 'ub:name', 'min': 1}, {'path': 'ub:name', 'max': 1}, {'path': 'ub:email', 'min': 1}]
+    constraints += [{'path': 'ub:' + child.predicate, 'min': 1, 'shape': child.name} for child in shape.children]
+    return {'name': shape.name,
+            'targetDef': {'query': 'SELECT ?x WHERE {?x a ub:' + shape.name + '}', 'class': 'ub:' + shape.name},
+            'prefix': {'ub': '<' + UB + '>', '': '<' + DATA + '>'},
+            'constraintDef': {'conjunctions': [constraints]}}
+
+
+def shape_ttl(shape):
+    lines = ['@prefix : <{}> .'.format(SHAPES),
+             '@prefix sh: <http://www.w3.org/ns/shacl#> .',
+             '@prefix ub: <{}> .'.format(UB),
+             '',
+             ':{} a sh:NodeShape ;'.format(shape.name),
+             '  sh:targetClass ub:{} ;'.format(shape.name),
+             '  sh:property [\n    sh:path ub:name ;\n    sh:minCount 1\n  ] ;',
+             '  sh:property [\n    sh:path ub:name ;\n    sh:maxCount 1\n  ] ;',
+             '  sh:property [\n    sh:path ub:email ;\n    sh:minCount 1\n  ]']
+    for child in shape.children:
+        lines[-1] += ' ;'
+        lines.append('  sh:property [\n    sh:path ub:{} ;\n    sh:qualifiedValueShape [\n      sh:node :{}\n    ] ;\n'
+                     '    sh:qualifiedMinCount 1\n  ]'.format(child.predicate, child.name))
+    lines[-1] += ' .'
+    return '\n'.join(lines) + '\n'
+
+
+def star_queries(schema, arms):
+    """
+    Returns star-shaped queries over the target class with 1 to arms triple patterns: the class, the email and the references of the target shape.
+    The name is not part of the queries, such that each target instance is contained once (invalid ones have two names).
+    """
+    patterns = ['?x ub:email ?email .'] + ['?x ub:{} ?{} .'.format(child.predicate, child.name.lower()) for child in schema.children]
+    queries = []
+    for number_of_arms in range(1, min(arms, len(patterns) + 1) + 1):
+        body = '\n'.join(['?x a ub:{} .'.format(schema.name)] + patterns[:number_of_arms - 1])
+        queries.append('PREFIX ub: <{}>\nSELECT ?x WHERE {{\n{}\n}}'.format(UB, body))
+    return queries
+
+
+def generate(directory, triples=10000, depth=2, fan_out=1, links=2, invalid_ratio=0.3, arms=3, seed=0):
+    """
+    Writes data.nt, the shape schema (shapes/json and shapes/ttl), config.json and the workload (test_definitions/*.json,
+    in the format of tests/tc*/test_definitions with the expected result) to the directory and returns a summary of the generated data.
+    """
+    if not 0 <= invalid_ratio <= 1:
+        raise ValueError('invalid_ratio needs to be between 0 and 1')
+    schema = build_schema(depth, fan_out)
+    number_of_targets = max(1, triples // triples_per_target(schema, links))
+    os.makedirs(directory, exist_ok=True)
+
+    generator = DataGenerator(schema, links, invalid_ratio, seed)
+    with open(os.path.join(directory, 'data.nt'), 'w', encoding='utf8', buffering=1 << 20) as f:
+        generator.generate(f, number_of_targets)
+
+    for schema_format, extension, render in (('json', '.json', lambda shape: json.dumps(shape_json(shape), indent=4)), ('ttl', '.ttl', shape_ttl)):
+        shape_directory = os.path.join(directory, 'shapes', schema_format)
+        os.makedirs(shape_directory, exist_ok=True)
+        for shape in schema.walk():
+            with open(os.path.join(shape_directory, shape.name + extension), 'w', encoding='utf8') as f:
+                f.write(render(shape))
+
+    config = {'outputDirectory': './output/', 'workInParallel': False, 'useSelectiveQueries': True, 'maxSplit': 256, 'ORDERBYinQueries': True,
+              'SHACL2SPARQLorder': False, 'outputs': False, 'backend': 'travshacl', 'output_format': 'test', 'write_stats': True}
+    with open(os.path.join(directory, 'config.json'), 'w', encoding='utf8') as f:
+        json.dump(config, f, indent=4)
+
+    definition_directory = os.path.join(directory, 'test_definitions')
+    os.makedirs(definition_directory, exist_ok=True)
+    expected = {'validTargets': generator.valid_targets, 'invalidTargets': generator.invalid_targets}
+    for number, query in enumerate(star_queries(schema, arms), start=1):
+        for schema_format, shape_format, target_shape in (('json', 'JSON', schema.name), ('ttl', 'SHACL', '<' + SHAPES + schema.name + '>')):
+            definition = {'schemaDir': os.path.join('shapes', schema_format), 'shapeFormat': shape_format, 'query': query,
+                          'targetShape': target_shape, 'config': 'config.json', 'result': expected}
+            with open(os.path.join(definition_directory, '{}_q{}.json'.format(schema_format, number)), 'w', encoding='utf8') as f:
+                json.dump(definition, f, indent=4)
+
+    summary = {'triples': generator.number_of_triples, 'targets': number_of_targets, 'valid_targets': len(generator.valid_targets),
+               'invalid_targets': len(generator.invalid_targets), 'shapes': sum(1 for _ in schema.walk()), 'instances': sum(generator.counters.values())}
+    with open(os.path.join(directory, 'summary.json'), 'w', encoding='utf8') as f:
+        json.dump(summary, f, indent=4)
+    return summary
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.generator', description='Generates LUBM-style data, a matching shape schema and star-shaped queries.')
+    parser.add_argument('directory')
+    parser.add_argument('-t', '--triples', type=int, default=10000, help='approximate number of triples (default: 10000)')
+    parser.add_argument('-d', '--depth', type=int, default=2, help='number of levels of shapes below the target shape (default: 2)')
+    parser.add_argument('-f', '--fan-out', type=int, default=1, help='number of shapes referenced by each shape (default: 1)')
+    parser.add_argument('-l', '--links', type=int, default=2, help='number of instances each instance links to per referenced shape (default: 2)')
+    parser.add_argument('-i', '--invalid-ratio', type=float, default=0.3, help='fraction of invalid target instances (default: 0.3)')
+    parser.add_argument('-a', '--arms', type=int, default=3, help='maximal number of triple patterns of the star-shaped queries (default: 3)')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    summary = generate(args.directory, args.triples, args.depth, args.fan_out, args.links, args.invalid_ratio, args.arms, args.seed)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
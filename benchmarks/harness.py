@@ -0,0 +1,140 @@
+import csv
+import logging
+import statistics
+import tempfile
+import time
+
+from benchmarks.endpoint import LocalSPARQLEndpoint
+
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = ['scenario', 'variant', 'repetition', 'status', 'correct', 'results', 'wall_time', 'ttft', 'throughput', 'peak_rss', 'peak_traced']
+
+
+def run_benchmark(scenarios, variants=None, repetitions=3, warmup=1, latency=0.0, jitter=0.0, data=None, measure_memory=True, output_directory=None,
+                  endpoint_url=None):
+    """
+    Executes each scenario (see :mod:`benchmarks.scenarios`) with each variant of the configuration through
+    :func:`shaclapi.api.run_multiprocessing` against a local SPARQL endpoint (see :class:`benchmarks.endpoint.LocalSPARQLEndpoint`)
+    and returns one row (see RESULT_FIELDS) per repetition.
+
+    variants maps the name of a variant to the options added to the request, e.g., {'fused': {'fused_pipeline': 'True'}}.
+    The endpoint serves the data of the scenario or, if given, the data files in data; scenarios without data are skipped.
+    If endpoint_url is given, the scenarios are executed against that endpoint instead, which needs to serve their data
+    (e.g., the data of :mod:`benchmarks.generator` at scales an rdflib graph cannot handle). The warmup executions are not measured. If measure_memory is turned on, the peak memory of the steps of the pipeline is measured
+    in an additional execution with the option trace_memory (tracing the memory slows down the execution).
+    """
+    variants = variants or {'default': {}}
+    output_directory = output_directory or tempfile.mkdtemp(prefix='shaclapi_benchmark_')
+    scenarios_per_data = {}
+    for scenario in scenarios:
+        scenario_data = tuple(data or scenario.data or ()) if endpoint_url is None else ()
+        if not scenario_data and endpoint_url is None:
+            logger.warning('Skipping {}, there is no data for it'.format(scenario.name))
+            continue
+        scenarios_per_data.setdefault(scenario_data, []).append(scenario)
+
+    rows = []
+    for scenario_data, data_scenarios in scenarios_per_data.items():
+        endpoint = LocalSPARQLEndpoint(scenario_data, latency=latency, jitter=jitter) if endpoint_url is None else ExternalEndpoint(endpoint_url)
+        with endpoint:
+            for scenario in data_scenarios:
+                for variant, options in variants.items():
+                    for _ in range(warmup):
+                        execute(scenario, endpoint, options, output_directory)
+                    variant_rows = []
+                    for repetition in range(1, repetitions + 1):
+                        row = execute(scenario, endpoint, options, output_directory)
+                        row.update(variant=variant, repetition=repetition)
+                        variant_rows.append(row)
+                    if measure_memory:
+                        memory = execute(scenario, endpoint, dict(options, trace_memory='True'), output_directory)
+                        for row in variant_rows:
+                            row.update(peak_rss=memory.get('peak_rss'), peak_traced=memory.get('peak_traced'))
+                    rows.extend(variant_rows)
+                    logger.info('{} ({}): {}'.format(scenario.name, variant, summarize(variant_rows)[0]))
+    return rows
+
+
+class ExternalEndpoint:
+    """An endpoint which is not started by the benchmark."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def execute(scenario, endpoint, options, output_directory):
+    """Executes the scenario once and returns its measurements."""
+    from shaclapi.api import run_multiprocessing
+    request = scenario.request(endpoint.url, dict(options, write_stats='True'), output_directory)
+    start = time.perf_counter()
+    output = run_multiprocessing(request)
+    wall_time = time.perf_counter() - start
+    row = {'scenario': scenario.name, 'wall_time': wall_time}
+    if isinstance(output, str):
+        logger.error('{} failed: {}'.format(scenario.name, output))
+        row.update(status='error', correct=False)
+        return row
+    answers = output.metrics.get('answers', {})
+    # The peaks of the steps executed in separate processes are reported separately; the largest one is used.
+    memory = [metrics['memory'] for metrics in output.metrics.values() if 'memory' in metrics]
+    row.update(status=output.status,
+               correct=scenario.check(output.output),
+               results=len(output.output) if isinstance(output.output, list) else answers.get('completeness'),
+               ttft=answers.get('ttft'),
+               throughput=answers.get('throughput'),
+               peak_rss=max((entry['peak_rss'] for entry in memory if entry['peak_rss'] is not None), default=None),
+               peak_traced=max((entry['peak_traced'] for entry in memory), default=None))
+    return row
+
+
+def summarize(rows):
+    """Returns one row per scenario and variant with the medians of the measurements of its repetitions."""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['scenario'], row.get('variant')), []).append(row)
+    summary = []
+    for (scenario, variant), group in groups.items():
+        entry = {'scenario': scenario, 'variant': variant, 'repetitions': len(group),
+                 'status': ','.join(sorted({row['status'] for row in group})),
+                 'correct': None if all(row.get('correct') is None for row in group) else all(row.get('correct') for row in group)}
+        for field in ('results', 'wall_time', 'ttft', 'throughput', 'peak_rss', 'peak_traced'):
+            values = [row[field] for row in group if row.get(field) is not None]
+            entry[field] = statistics.median(values) if values else None
+        summary.append(entry)
+    return summary
+
+
+def write_csv(rows, file, fields=RESULT_FIELDS):
+    with open(file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+SUMMARY_COLUMNS = ['scenario', 'variant', 'status', 'correct', 'results', 'wall_time', 'ttft', 'throughput', 'peak_rss']
+
+
+def format_summary(summary, columns=SUMMARY_COLUMNS):
+    """Returns the given columns of the summary as a plain text table."""
+    table = [columns] + [[_format(entry[column], column) for column in columns] for entry in summary]
+    widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)) for row in table)
+
+
+def _format(value, column):
+    if value is None:
+        return '-'
+    if column == 'peak_rss':
+        return '{:.1f} MiB'.format(value / (1 << 20))
+    if column in ('results', 'inputs', 'outputs', 'speed'):
+        return '{:g}'.format(value)
+    if isinstance(value, float):
+        return '{:.4f}'.format(value)
+    return str(value)
@@ -0,0 +1,155 @@
+"""
+Replays the input streams of the join recorded with the option record_join_inputs (see :class:`shaclapi.joinRecording.JoinInputRecorder`)
+into a join operator, hence, changes of the join can be benchmarked in isolation with the workload of real requests.
+
+The items are fed with the recorded timing, accelerated by speed (0 feeds all items as fast as possible).
+The latency of an output is the time since the last input item with the same instance was fed.
+
+Run ``python -m benchmarks.replay --help`` for the options.
+"""
+import argparse
+import queue
+import statistics
+import sys
+import threading
+import time
+
+from benchmarks.harness import format_summary, write_csv
+from shaclapi.joinRecording import LEFT, read_recording
+from shaclapi.memoryTracing import MemoryTracer
+from shaclapi.multiprocessing.Xgjoin.Xgjoin import Xgjoin
+from shaclapi.multiprocessing.Xgoptional.Xgoptional import Xgoptional
+
+JOINS = {
+    'xgoptional': lambda memory_size: Xgoptional(['var', 'instance', 'id'], ['instance', 'validation'], memory_size),
+    'xgjoin': lambda memory_size: Xgjoin(['instance'], memory_size)
+}
+
+REPLAY_FIELDS = ['recording', 'join', 'speed', 'repetition', 'inputs', 'outputs', 'recorded_time', 'wall_time', 'first_output', 'throughput',
+                 'latency_median', 'latency_p95', 'latency_max', 'peak_rss', 'peak_traced']
+
+
+def replay(items, join='xgoptional', speed=1.0, memory_size=100000000, measure_memory=True):
+    """
+    Feeds the recorded items (see :func:`shaclapi.joinRecording.read_recording`) into a new instance of the join (a key of JOINS)
+    and returns the measurements: the number of input and output items, the wall time of the join, the time to the first output,
+    the throughput (outputs per second), the median, 95th percentile and maximum of the latency to the output and, if measure_memory
+    is turned on, the peak memory while joining (tracing the memory slows down the join).
+
+    The join is executed in the calling thread (the operators use signals, which are only available in the main thread);
+    the items are fed and the output is consumed by separate threads.
+    """
+    left, right, output = queue.Queue(), queue.Queue(), queue.Queue()
+    fed = {}  # instance -> time the last item with the instance was fed
+    outputs = []  # (time, latency)
+    start = time.perf_counter()
+
+    def feed():
+        finished_streams = set()
+        for stream, seconds, item in items:
+            if speed:
+                delay = start + seconds / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if item == 'EOF':
+                finished_streams.add(stream)
+            else:
+                fed[item.get('instance')] = time.perf_counter()
+            (left if stream == LEFT else right).put(item)
+        # Incomplete recordings, e.g., of cancelled requests, are finished.
+        for stream, receiver in enumerate((left, right)):
+            if stream not in finished_streams:
+                receiver.put('EOF')
+
+    def consume():
+        result = output.get()
+        while result != 'EOF':
+            now = time.perf_counter()
+            fed_time = fed.get(result.get('instance'))
+            outputs.append((now - start, now - fed_time if fed_time is not None else None))
+            result = output.get()
+
+    feeder = threading.Thread(target=feed, name='replay_feeder', daemon=True)
+    consumer = threading.Thread(target=consume, name='replay_consumer', daemon=True)
+    memory_tracer = MemoryTracer() if measure_memory else None
+    join_instance = JOINS[join](memory_size)
+    if memory_tracer is not None:
+        memory_tracer.start()
+    consumer.start()
+    feeder.start()
+    try:
+        join_instance.execute(left, right, output)
+    finally:
+        output.put('EOF')
+        wall_time = time.perf_counter() - start
+        memory = memory_tracer.stop() if memory_tracer is not None else {}
+    feeder.join()
+    consumer.join()
+
+    latencies = sorted(latency for _, latency in outputs if latency is not None)
+    return {'join': join, 'speed': speed,
+            'inputs': sum(1 for _, _, item in items if item != 'EOF'),
+            'outputs': len(outputs),
+            'recorded_time': items[-1][1] if items else 0.0,
+            'wall_time': wall_time,
+            'first_output': outputs[0][0] if outputs else None,
+            'throughput': len(outputs) / wall_time if wall_time > 0 else None,
+            'latency_median': statistics.median(latencies) if latencies else None,
+            'latency_p95': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+            'latency_max': latencies[-1] if latencies else None,
+            'peak_rss': memory.get('peak_rss'),
+            'peak_traced': memory.get('peak_traced')}
+
+
+def run_replays(recordings, joins=('xgoptional', ), speeds=(1.0, ), repetitions=3, memory_size=100000000, measure_memory=True):
+    """Replays each recording (file) into each join at each speed and returns one row (see REPLAY_FIELDS) per repetition."""
+    rows = []
+    for recording in recordings:
+        items = read_recording(recording)
+        for join in joins:
+            for speed in speeds:
+                for repetition in range(1, repetitions + 1):
+                    row = replay(items, join, speed, memory_size, measure_memory)
+                    row.update(recording=recording, repetition=repetition)
+                    rows.append(row)
+    return rows
+
+
+def summarize(rows):
+    """Returns one row per recording, join and speed with the medians of the measurements of its repetitions."""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['recording'], row['join'], row['speed']), []).append(row)
+    summary = []
+    for (recording, join, speed), group in groups.items():
+        entry = {'recording': recording, 'join': join, 'speed': speed, 'repetitions': len(group)}
+        for field in REPLAY_FIELDS[4:]:
+            values = [row[field] for row in group if row.get(field) is not None]
+            entry[field] = statistics.median(values) if values else None
+        summary.append(entry)
+    return summary
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replay', description='Replays recorded input streams of the join (see the option '
+                                     'record_join_inputs) into the join operators and reports throughput, latency to the output and memory.')
+    parser.add_argument('recording', nargs='+')
+    parser.add_argument('-j', '--join', action='append', choices=sorted(JOINS), help='join operator (default: xgoptional)')
+    parser.add_argument('-x', '--speed', action='append', type=float,
+                        help='speed-up of the recorded timing, 0 feeds the items as fast as possible (default: 1, i.e., the original timing)')
+    parser.add_argument('-r', '--repetitions', type=int, default=3)
+    parser.add_argument('-m', '--memory-size', type=int, default=100000000, help='number of tuples the join keeps in main memory')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the memory')
+    parser.add_argument('--csv', help='file to write the measurements of all repetitions to')
+    args = parser.parse_args(argv)
+
+    rows = run_replays(args.recording, args.join or ['xgoptional'], args.speed or [1.0], args.repetitions, args.memory_size, not args.no_memory)
+    if args.csv:
+        write_csv(rows, args.csv, REPLAY_FIELDS)
+    print(format_summary(summarize(rows), ['recording', 'join', 'speed', 'inputs', 'outputs', 'wall_time', 'first_output', 'throughput',
+                                           'latency_median', 'latency_p95', 'peak_rss']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+import copy
+import json
+import os
+from fnmatch import fnmatch
+from glob import glob
+
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, 'examples')
+TESTS_DIRECTORY = os.path.join(REPOSITORY_DIRECTORY, 'tests')
+# The union of the data of the test cases tc1 to tc5, which is loaded into the endpoint of the tests.
+TEST_DATA = os.path.join(TESTS_DIRECTORY, 'setup', 'test_data', 'full_test_graph.ttl')
+
+# Entries of the test definitions, which are not options of the shaclAPI.
+_TEST_DEFINITION_ENTRIES = ('result', 'test_type', 'task', 'config')
+
+
+class Scenario:
+    """
+    A request to the shaclAPI together with the data it needs and, if known, the expected validation result.
+
+    params are the options of the request including the configuration (as dictionary); the paths are absolute, hence,
+    the scenario can be executed from any working directory. expected is the expected output of the output format 'test'.
+    """
+
+    def __init__(self, name, params, data, expected=None):
+        self.name = name
+        self.params = params
+        self.data = data
+        self.expected = expected
+
+    def request(self, endpoint_url, options=None, output_directory=None):
+        """Returns the options for :func:`shaclapi.api.run_multiprocessing` executing the scenario against the endpoint."""
+        params = copy.deepcopy(self.params)  # the configuration dictionary is modified by the shaclAPI
+        params.update(options or {})
+        params['external_endpoint'] = endpoint_url
+        if output_directory is not None:
+            params['config']['outputDirectory'] = output_directory
+        return params
+
+    def check(self, output):
+        """
+        Returns whether the valid and invalid targets of the output (of the output format 'test') are the expected ones,
+        None if there is no expected result.
+        """
+        if self.expected is None or not isinstance(output, dict):
+            return None
+        for key in ('validTargets', 'invalidTargets'):
+            if sorted(target[0] for target in output.get(key, [])) != sorted(target[0] for target in self.expected[key]):
+                return False
+        return True
+
+    def __repr__(self):
+        return 'Scenario({})'.format(self.name)
+
+
+def example_scenarios():
+    """
+    Returns a scenario for each example in examples/. The data of an example is read from its data directory;
+    examples without data (i.e., examples using a public endpoint) have no data.
+    """
+    scenarios = []
+    for config_file in sorted(glob(os.path.join(EXAMPLES_DIRECTORY, '*', 'config.json'))):
+        example_directory = os.path.dirname(config_file)
+        with open(config_file, 'r', encoding='utf8') as f:
+            config = _absolute_paths(json.load(f))
+        data = sorted(glob(os.path.join(example_directory, 'data', '*.ttl'))) or None
+        scenarios.append(Scenario('examples/' + os.path.basename(example_directory), {'config': config}, data))
+    return scenarios
+
+
+def test_case_scenarios():
+    """Returns a scenario for each test definition of the test cases tests/tc*; their data is the data of all test cases."""
+    scenarios = []
+    for definition_file in sorted(glob(os.path.join(TESTS_DIRECTORY, 'tc*', 'test_definitions', '*.json'))):
+        with open(definition_file, 'r', encoding='utf8') as f:
+            definition = json.load(f)
+        with open(os.path.join(REPOSITORY_DIRECTORY, definition['config']), 'r', encoding='utf8') as f:
+            config = _absolute_paths(json.load(f))
+        params = _absolute_paths({key: value for key, value in definition.items() if key not in _TEST_DEFINITION_ENTRIES})
+        params['config'] = config
+        name = os.path.relpath(definition_file, TESTS_DIRECTORY).replace(os.sep + 'test_definitions' + os.sep, '/')[:-len('.json')]
+        scenarios.append(Scenario('tests/' + name, params, [TEST_DATA], definition.get('result')))
+    return scenarios
+
+
+def generated_scenarios(directory):
+    """
+    Returns a scenario for each query of the workload generated by :func:`benchmarks.generator.generate` in the directory;
+    the names start with generated/ followed by the name of the directory.
+    """
+    directory = os.path.abspath(directory)
+    scenarios = []
+    for definition_file in sorted(glob(os.path.join(directory, 'test_definitions', '*.json'))):
+        with open(definition_file, 'r', encoding='utf8') as f:
+            definition = json.load(f)
+        with open(os.path.join(directory, definition['config']), 'r', encoding='utf8') as f:
+            config = json.load(f)
+        params = _absolute_paths({key: value for key, value in definition.items() if key not in _TEST_DEFINITION_ENTRIES}, directory)
+        params['config'] = config
+        name = 'generated/{}/{}'.format(os.path.basename(directory), os.path.basename(definition_file)[:-len('.json')])
+        scenarios.append(Scenario(name, params, [os.path.join(directory, 'data.nt')], definition.get('result')))
+    return scenarios
+
+
+def find_scenarios(patterns=None, generated=()):
+    """
+    Returns the scenarios whose names match one of the (fnmatch) patterns, e.g., 'tests/tc1/*' or 'examples/lubm'; all if no pattern is given.
+    The scenarios generated into the directories in generated (see :func:`generated_scenarios`) are included.
+    """
+    scenarios = example_scenarios() + test_case_scenarios()
+    for directory in generated:
+        scenarios += generated_scenarios(directory)
+    if not patterns:
+        return scenarios
+    return [scenario for scenario in scenarios if any(fnmatch(scenario.name, pattern) for pattern in patterns)]
+
+
+def _absolute_paths(options, directory=REPOSITORY_DIRECTORY):
+    for key in ('schemaDir', 'schema_directory'):
+        if key in options and not os.path.isabs(options[key]):
+            options[key] = os.path.normpath(os.path.join(directory, options[key]))
+    return options
@@ -1,3 +1,4 @@
+import json
 import logging
 from flask import Flask, request, Response
 from shaclapi import logger as shaclapi_logger
@@ -14,9 +15,16 @@ logger = logging.getLogger(__name__)
 
 # Due to the processes starting, when importing something from shaclapi.api, its necessary to call shaclapi_logger.setup(...) before otherwise logging from the processes do not work.
 import shaclapi.api as api
+from shaclapi.coalescing import RequestCoalescer
+from shaclapi.jobs import JOB_MANAGER, JobNotFinished
+from shaclapi.metrics import METRICS
+from shaclapi.responseCache import RESPONSE_CACHE
 
 app = Flask(__name__)
 
+# Identical concurrent requests to /multiprocessing are only executed once.
+COALESCER = RequestCoalescer(response_cache=RESPONSE_CACHE)
+
 
 @app.route('/multiprocessing', methods=['POST'])
 def route_multiprocessing():
@@ -26,28 +34,73 @@ def route_multiprocessing():
         - external_endpoint
         - schemaDir
     See app/config.py for a full list of available arguments!
+    Identical requests arriving while the first one is executed share its execution.
+    The header X-Metrics contains a JSON summary of the metrics of each step of the pipeline.
     """
-    api_output = api.run_multiprocessing(request.form)
+    api_output = COALESCER.run_multiprocessing(request.form.to_dict())
     if type(api_output) != str:
-        return Response(api_output.to_json(), mimetype='application/json')
+        headers = {'X-Result-Status': api_output.status}
+        if api_output.metrics is not None:
+            headers['X-Metrics'] = json.dumps(api_output.metrics, separators=(',', ':'))
+        return Response(api_output.iter_json(), mimetype='application/json', headers=headers)
     else:
         return Response(api_output, mimetype='text/plain')
 
 
+@app.route('/profile', methods=['POST'])
+def route_profile():
+    """
+    Executes the request like /multiprocessing with the option profile turned on and returns the result together with the profiles:
+    for each step of the pipeline (and for all steps merged) the top functions by cumulative time and the collapsed stacks for flame graphs.
+    """
+    from flask import jsonify
+    params = request.form.to_dict()
+    params['profile'] = True
+    api_output = api.run_multiprocessing(params)
+    if type(api_output) == str:
+        return Response(api_output, mimetype='text/plain')
+    return jsonify({'status': api_output.status, 'result': api_output.output, 'profile': api_output.profile})
+
+
 @app.route('/validation', methods=['POST'])
 def route_validation():
     """Use the heuristics implemented and activated in the given configuration, to run the
     validation over the reduced SHACL shape schema. Returns the validation results per instance
     as well as the number of valid and invalid instances per shape.
 
+    With stream_results the validation results are streamed as newline delimited JSON; with store_results they are stored
+    on the server and can be fetched page by page from /validation/results/<handle>.
+
     Returns
     -------
     flask.Response
         The response containing the validation results.
     """
+    from flask import jsonify, stream_with_context
+    from shaclapi.config import Config
+    config = Config.from_request_form(request.form)
+    if config.stream_results:
+        results = (json.dumps(result) + '\n' for result in api.stream_validation(request.form))
+        return Response(stream_with_context(results), mimetype='application/x-ndjson')
+    elif config.store_results:
+        return jsonify(api.store_validation_results(request.form))
     return api.validation_and_statistics(request.form)
 
 
+@app.route('/validation/results/<handle>', methods=['GET'])
+def route_validation_results(handle):
+    """Returns a page of the validation results stored by /validation with store_results.
+    The page starts at the (optional) parameter cursor and contains at most limit (default 1000) results.
+    """
+    from flask import jsonify
+    try:
+        return jsonify(api.get_validation_results(handle, request.args.get('cursor'), request.args.get('limit', 1000)))
+    except KeyError:
+        return jsonify({'error': 'Unknown handle {}'.format(handle)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
 @app.route('/reduce', methods=['POST'])
 def reduced_schema_only():
     from flask import jsonify
@@ -62,6 +115,101 @@ def reduced_schema_only():
         return jsonify({'result': [], 'error': str(emsg)})
 
 
+@app.route('/reduce/batch', methods=['POST'])
+def reduced_schema_batch():
+    """Reduces the SHACL shape schema for several target shapes at once (the parameter targetShape can be repeated).
+    If no target shape is given, the reduced shape schema is computed for each shape in the shape schema.
+
+    Returns
+    -------
+    flask.Response
+        The reduced shape schemas per target shape and the pairwise overlap of the reduced shape schemas.
+    """
+    from flask import jsonify
+    try:
+        params = request.form.to_dict()
+        params.pop('targetShape', None)
+        params['target_shape'] = request.form.getlist('targetShape') + request.form.getlist('target_shape') or None
+        return jsonify(api.batch_reduce_shape_schema(params))
+    except Exception:
+        import sys
+        import traceback
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        emsg = repr(traceback.format_exception(exc_type, exc_value, exc_traceback))
+        return jsonify({'shapes': {}, 'overlap': {}, 'error': str(emsg)})
+
+
+@app.route('/jobs', methods=['POST'])
+def route_submit_job():
+    """Submits a job with the same arguments as /multiprocessing. The job is executed in the background; its id is returned immediately."""
+    from flask import jsonify
+    job = JOB_MANAGER.submit(request.form.to_dict())
+    return jsonify({'id': job.id, 'status': job.status}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def route_job_status(job_id):
+    """Returns the status of the job, the number of results spooled so far and the progress of each step of the pipeline."""
+    from flask import jsonify
+    try:
+        return jsonify(JOB_MANAGER.status(job_id))
+    except KeyError:
+        return jsonify({'error': 'Unknown job {}'.format(job_id)}), 404
+
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def route_job_results(job_id):
+    """Returns a page of the results spooled so far, starting at the (optional) parameter cursor and containing at most limit (default 1000) results.
+    next_cursor is None after the last result of a finished job.
+    """
+    from flask import jsonify
+    try:
+        results, next_cursor = JOB_MANAGER.page(job_id, request.args.get('cursor'), int(request.args.get('limit', 1000)))
+        return jsonify({'results': results, 'next_cursor': next_cursor})
+    except KeyError:
+        return jsonify({'error': 'Unknown job {}'.format(job_id)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def route_job_stream(job_id):
+    """Streams the results of the job as newline delimited JSON as soon as they are spooled until the job is finished."""
+    from flask import jsonify, stream_with_context
+    try:
+        JOB_MANAGER.get(job_id)
+    except KeyError:
+        return jsonify({'error': 'Unknown job {}'.format(job_id)}), 404
+    results = (json.dumps(result) + '\n' for result in JOB_MANAGER.stream(job_id, request.args.get('cursor')))
+    return Response(stream_with_context(results), mimetype='application/x-ndjson')
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def route_job_result(job_id):
+    """Returns the final result of the job in the same format as /multiprocessing."""
+    from flask import jsonify
+    try:
+        job = JOB_MANAGER.get(job_id)
+        return Response(json.dumps(JOB_MANAGER.result(job_id)), mimetype='application/json', headers={'X-Result-Status': job.status})
+    except KeyError:
+        return jsonify({'error': 'Unknown job {}'.format(job_id)}), 404
+    except JobNotFinished as e:
+        return jsonify({'error': str(e)}), 409
+
+
+@app.route('/cache', methods=['DELETE'])
+def route_purge_cache():
+    """Removes all entries of the response cache used by /multiprocessing with use_response_cache."""
+    from flask import jsonify
+    return jsonify({'purged': RESPONSE_CACHE.purge()})
+
+
+@app.route('/metrics', methods=['GET'])
+def route_metrics():
+    """Returns the metrics of the steps of the pipeline aggregated over all requests in the Prometheus text format."""
+    return Response(METRICS.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/', methods=['GET'])
 def hello_world():
     return 'Hello World'
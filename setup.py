@@ -18,7 +18,7 @@ setup(
     author_email='philipp.rohde@tib.eu',
     url='https://github.com/SDM-TIB/shaclAPI',
     download_url='https://github.com/SDM-TIB/shaclAPI/archive/refs/tags/v' + VERSION + '.tar.gz',
-    packages=find_packages(exclude='tests'),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     install_requires=[
         'SPARQLWrapper>=2.0.0',
         'requests>=2.32.0',
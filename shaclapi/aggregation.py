@@ -0,0 +1,58 @@
+class ValidationCounts:
+    """
+    Counts the valid and invalid validation results per shape without keeping the results themselves.
+
+    If group_by is given (a query variable like ?x), the counts of each shape are additionally grouped by the
+    instance bound to that variable in the result mapping.
+
+    The result mappings (see :meth:`add_mapping`) are counted per target: only the validation results of the target shapes
+    of the target variables in target_shape ({'?x': [shape, ...]} or {'UNDEF': [shape, ...]}, see :py:mod:`shaclapi.config`)
+    are counted. Each target is counted once per result mapping, hence, the query needs to return each target (and group)
+    only once, see :meth:`shaclapi.query.Query.as_distinct_query`. The memory used only grows with the number of shapes and groups.
+    """
+
+    def __init__(self, group_by=None, target_shape=None):
+        self.group_by = group_by
+        self.target_shape = target_shape
+        self.counts = {}
+
+    def add(self, shape, valid, group=None):
+        if self.group_by is not None:
+            shape_counts = self.counts.setdefault(shape, {})
+            counts = shape_counts.setdefault(group, [0, 0])
+        else:
+            counts = self.counts.setdefault(shape, [0, 0])
+        counts[0 if valid else 1] += 1
+
+    def add_mapping(self, mapping):
+        """
+        Adds the validation results of a result mapping, i.e., a list of bindings like
+        {'instance': ..., 'validation': (shape, valid, reason), 'var': ...} as collected by the post-processing.
+        """
+        group = None
+        if self.group_by is not None:
+            group = next((binding['instance'] for binding in mapping if '?' + binding['var'] == self.group_by), None)
+        for binding in mapping:
+            validation = binding.get('validation')
+            if validation and self.is_target(binding['var'], validation[0]):
+                self.add(validation[0], validation[1], group)
+
+    def is_target(self, var, shape):
+        """Returns whether the shape is a target shape of the variable; without target_shape every shape is counted."""
+        if self.target_shape is None:
+            return True
+        if '?' + var in self.target_shape:
+            return shape in self.target_shape['?' + var]
+        # Without a known target variable, the target shapes apply to all variables.
+        return shape in self.target_shape.get('UNDEF', [])
+
+    def summary(self):
+        """
+        Returns the counts as {shape: {'valid': ..., 'invalid': ...}} or, if grouped, as {shape: {instance: {'valid': ..., 'invalid': ...}}}.
+        """
+        def to_dict(counts):
+            return {'valid': counts[0], 'invalid': counts[1]}
+
+        if self.group_by is not None:
+            return {shape: {str(group): to_dict(counts) for group, counts in groups.items()} for shape, groups in self.counts.items()}
+        return {shape: to_dict(counts) for shape, counts in self.counts.items()}
@@ -0,0 +1,66 @@
+import time
+from array import array
+
+
+class AnswerTrace:
+    """
+    Records the time at which each answer is produced.
+
+    The timestamps are kept in an array in the recording process and shipped once to the statistics queue
+    at the end of the task (see :meth:`ship`), instead of sending a message per answer.
+    """
+
+    TOPIC = 'answer_trace'
+
+    def __init__(self):
+        self.timestamps = array('d')
+
+    def record(self):
+        self.timestamps.append(time.time())
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def ship(self, stats_queue):
+        stats_queue.put({'topic': self.TOPIC, 'timestamps': self.timestamps})
+
+
+def dief_at_t(trace, t):
+    """
+    Returns dief@t, the area under the answer trace (number of answers over time) until time t; higher is better.
+    trace is the sorted list of the answer times relative to the start of the request.
+    """
+    points = [(answer_time, answer) for answer, answer_time in enumerate(trace, start=1) if answer_time <= t]
+    if not points:
+        return 0.0
+    points.append((t, len(points)))
+    return _area(points)
+
+
+def dief_at_k(trace, k):
+    """
+    Returns dief@k, the area under the answer trace (time over number of answers) until the k-th answer; lower is better.
+    trace is the sorted list of the answer times relative to the start of the request.
+    """
+    return _area([(answer, answer_time) for answer, answer_time in enumerate(trace[:k], start=1)])
+
+
+def _area(points):
+    # Trapezoidal rule (like the diefpy implementation of the metrics).
+    return sum((x2 - x1) * (y1 + y2) / 2 for (x1, y1), (x2, y2) in zip(points, points[1:]))
+
+
+def trace_metrics(trace, total_time, t=None, k=None):
+    """
+    Returns the metrics of the answer trace (answer times relative to the start of the request):
+    time to the first answer (ttft), time of the last answer, number of answers (completeness), answers per second
+    with respect to the total execution time, dief@t (t defaults to the total execution time) and dief@k (k defaults to all answers).
+    """
+    t = total_time if t is None else t
+    k = len(trace) if k is None else k
+    return {'ttft': trace[0] if trace else None,
+            'last_answer_time': trace[-1] if trace else None,
+            'completeness': len(trace),
+            'throughput': len(trace) / total_time if total_time > 0 else None,
+            'dief@t': dief_at_t(trace, t),
+            'dief@k': dief_at_k(trace, k)}
@@ -9,15 +9,25 @@ import json
 import logging
 import os
 import re
-
+import threading
+import time
+from collections import OrderedDict
+from functools import reduce
+from queue import Queue
+
+from shaclapi import metrics, profiling, tracing
+from shaclapi.aggregation import ValidationCounts
 from shaclapi.config import Config
-from shaclapi.multiprocessing.contactSource import contactSource
-from shaclapi.multiprocessing.functions import mp_validate, mp_xjoin, mp_post_processing, mp_output_completion
-from shaclapi.multiprocessing.runner import Runner
+from shaclapi.metrics import METRICS
+from shaclapi.multiprocessing.CancellationToken import CancellationToken, RequestCancelled
+from shaclapi.multiprocessing.contactSource import contactSource, count_results
+from shaclapi.multiprocessing.functions import drain, mp_validate, mp_xjoin, mp_post_processing, mp_output_completion
+from shaclapi.multiprocessing.runner import InProcessRunner, Runner
 from shaclapi.output import Output
 from shaclapi.query import Query
 from shaclapi.reduction import prepare_validation
-from shaclapi.reduction.ValidationResultTransmitter import ValidationResultTransmitter
+from shaclapi.reduction.ValidationResultTransmitter import CountingResultTransmitter, ValidationResultTransmitter
+from shaclapi.resultStore import VALIDATION_RESULT_STORE
 from shaclapi.statsCalculation import StatsCalculation
 
 logger = logging.getLogger(__name__)
@@ -32,6 +42,7 @@ query.namespace_manager.namespaces()
 # Query      ––> /
 
 # Dataprocessing Queues/Pipes --> 'EOF' is written by the runner class after function to execute finished
+# The queues between the steps hold at most queue_capacity items; a full queue blocks its sender (backpressure up to the download in contactSource).
 
 # Name                      | Sender - Threads          | Receiver - Threads        | Queue/Pipe    | Description
 # ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
@@ -42,13 +53,19 @@ query.namespace_manager.namespaces()
 # result_queue              | OUTPUT_COMPLETION_RUNNER  | -                         | Pipe          | Formatted results
 
 # Queues to collect statistics: --> {'topic':...., '':....}
-# stats_out_queue           | ALL_RUNNER                | Main Thread               | Queue         | one time statistics per run --> known number of statistics (also contains exception notifications in case a runner catches an exception)
-# timestamp_queue           | POST_PROCESSING_RUNNER    | Main Thread               | Pipe          | variable number of result timestamps per run --> close with 'EOF' by queue_output_to_table
+# stats_out_queue           | ALL_RUNNER                | Main Thread               | Queue         | one time statistics per run --> known number of statistics (also contains exception notifications in case a runner catches an exception
+#                                                                                                         and the answer trace of the OUTPUT_COMPLETION_RUNNER, if write_stats is turned on)
+
+# Optional Queues/Pipes:
+# target_instance_queue     | CONTACT_SOURCE_RUNNER     | VALIDATION_RUNNER         | Pipe          | Chunks of target instances (only if sideways_information_passing is turned on)
+
+# With the fused pipeline (see fused_pipeline) the same chain is executed by the FUSED_RUNNERS in threads of the calling process
+# connected by in-process queues (the validation may still be executed by the VALIDATION_RUNNER, see fused_validation).
 
 VALIDATION_RUNNER = Runner(mp_validate, number_of_out_queues=1)
 CONTACT_SOURCE_RUNNER = Runner(contactSource, number_of_out_queues=1)
 XJOIN_RUNNER = Runner(mp_xjoin, number_of_out_queues=1)
-POST_PROCESSING_RUNNER = Runner(mp_post_processing, number_of_out_queues=2)
+POST_PROCESSING_RUNNER = Runner(mp_post_processing, number_of_out_queues=1)
 OUTPUT_COMPLETION_RUNNER = Runner(mp_output_completion, number_of_out_queues=1)
 
 # Starting the processes of the runners
@@ -58,6 +75,34 @@ XJOIN_RUNNER.start_process()
 POST_PROCESSING_RUNNER.start_process()
 OUTPUT_COMPLETION_RUNNER.start_process()
 
+RUNNERS = {
+    'mp_validate': VALIDATION_RUNNER,
+    'contactSource': CONTACT_SOURCE_RUNNER,
+    'mp_xjoin': XJOIN_RUNNER,
+    'mp_post_processing': POST_PROCESSING_RUNNER,
+    'mp_output_completion': OUTPUT_COMPLETION_RUNNER
+}
+
+# Runners of the fused pipeline: the tasks are executed in threads of the calling process (see fused_pipeline).
+# The backends keep global state (e.g., the SPARQLEndpoint of Trav-SHACL), hence, only one validation is executed in this process at a time.
+FUSED_RUNNERS = {
+    'mp_validate': InProcessRunner(mp_validate, number_of_out_queues=1, exclusive=True),
+    'contactSource': InProcessRunner(contactSource, number_of_out_queues=1),
+    'mp_xjoin': InProcessRunner(mp_xjoin, number_of_out_queues=1),
+    'mp_post_processing': InProcessRunner(mp_post_processing, number_of_out_queues=1),
+    'mp_output_completion': InProcessRunner(mp_output_completion, number_of_out_queues=1)
+}
+
+# Number of results of the previous executions of a query; used to decide whether to use the fused pipeline.
+RESULT_SIZE_ESTIMATES = OrderedDict()
+RESULT_SIZE_LOCK = threading.Lock()
+
+# Seconds to wait for the tasks to stop after a request exceeded its timeout; afterwards the processes of the remaining tasks are restarted.
+CANCELLATION_GRACE_PERIOD = 5
+
+# Maximal number of validation results buffered for a client of stream_validation.
+STREAM_BUFFER_SIZE = 10000
+
 
 def get_result_queue():
     """Convenience function to get a multiprocessing queue object, which can be used as a result_queue in :func:`shaclapi.api.run_multiprocessing`.
@@ -70,7 +115,7 @@ def get_result_queue():
     return OUTPUT_COMPLETION_RUNNER.get_new_out_queues(use_pipes=False)[0]
 
 
-def run_multiprocessing(pre_config, result_queue=None):
+def run_multiprocessing(pre_config, result_queue=None, stats_callback=None):
     """Main function of the shaclAPI: Given a dictionary of configuration keys (properties in :py:mod:`shaclapi.config`) with the configured values, the shaclAPI starts the parallel execution of the SHACL validation during SPARQL query execution, while applying the activated heuristics.
 
     The following directed graph demonstrates the principal procedure. (Nodes represent tasks/processes and edges represent queues for colaboration):
@@ -78,6 +123,8 @@ def run_multiprocessing(pre_config, result_queue=None):
     .. image:: procedure.png
        :align: center
 
+    If a result_queue is given (see :func:`get_result_queue`), the results are put into the queue and the returned output is None.
+    The optional stats_callback is called with the :class:`shaclapi.statsCalculation.StatsCalculation` of the request, e.g., to report its progress.
     """
     # Parse Config from POST Request and Config File
     config = Config.from_request_form(pre_config)
@@ -93,122 +140,188 @@ def run_multiprocessing(pre_config, result_queue=None):
     # Setup Stats Calculation
     statsCalc = StatsCalculation(test_identifier=config.test_identifier, approach_name=os.path.basename(config.config) if '{' not in config.config else 'dict_passed_to_shaclAPI')
     statsCalc.globalCalculationStart()
-
-    # Set up the multiprocessing queue, which will give the final output.
-    if result_queue is not None:
-        QUEUE_OUTPUT = True
-    else:
-        result_queue = OUTPUT_COMPLETION_RUNNER.get_new_out_queues(config.use_pipes)[0]
-        QUEUE_OUTPUT = False
-
-    # Preparing the multiprocessing queues
-    # 1. Create new queues for the given request
-    stats_out_queue = CONTACT_SOURCE_RUNNER.get_new_queue()
-    contact_source_out_queues = CONTACT_SOURCE_RUNNER.get_new_out_queues(config.use_pipes)
-    validation_out_queues = VALIDATION_RUNNER.get_new_out_queues(config.use_pipes)
-    xjoin_out_queues = XJOIN_RUNNER.get_new_out_queues(config.use_pipes)
-    post_processing_out_queues = POST_PROCESSING_RUNNER.get_new_out_queues(config.use_pipes)
-    output_completion_out_queues = (result_queue, )
-
-    # 2. Extract Out Queues
-    transformed_query_queue = contact_source_out_queues[0]  # pylint: disable=unbalanced-tuple-unpacking
-    val_queue = validation_out_queues[0]  # pylint: disable=unbalanced-tuple-unpacking
-    joined_results_queue = xjoin_out_queues[0]
-    final_result_queue, timestamp_queue = post_processing_out_queues  # pylint: disable=unbalanced-tuple-unpacking
-
-    # 3. Collect the sender parts of the queues.
-    contact_source_out_connections = tuple((queue_adapter.sender for queue_adapter in contact_source_out_queues))
-    validation_out_connections = tuple((queue_adapter.sender for queue_adapter in validation_out_queues))
-    xjoin_out_connections = tuple((queue_adapter.sender for queue_adapter in xjoin_out_queues))
-    post_processing_out_connections = tuple((queue_adapter.sender for queue_adapter in post_processing_out_queues))
-    output_completion_out_connections = tuple((queue_adapter.sender for queue_adapter in output_completion_out_queues))
-
-    # 4. Collect the receiver parts of the queues.
-    contact_source_in_connections = tuple()
-    validation_in_connections = tuple()
-    xjoin_in_connections = (transformed_query_queue.receiver, val_queue.receiver)
-    post_processing_in_connections = (joined_results_queue.receiver, )
-    output_completion_in_connections = (final_result_queue.receiver, )
-
-    # Setup of the validation result transmitting strategy (SHACL engine --> API).
-    # This allows to process SHACL validation results as soon as they arrive.
-    result_transmitter = ValidationResultTransmitter(output_queue=val_queue.sender, first_val_time_queue=stats_out_queue)
+    if stats_callback is not None:
+        stats_callback(statsCalc)
 
     # Parse query_string into a corresponding Query Object
     query = Query.prepare_query(config.query)
     query_starshaped = query.make_starshaped()
 
-    collect_all_validation_results = config.collect_all_validation_results
-
-    # Sanitizing the input  
-    if query_starshaped is None:
-        if not collect_all_validation_results and not isinstance(config.target_shape, dict):
-            collect_all_validation_results = True
-            logger.warning('Running in blocking mode as the target variable(s) could not be identified!')
-        if config.replace_target_query and not isinstance(config.target_shape, dict):
-            config.replace_target_query = False
-            logger.warning('Can only replace target query if query is star-shaped!')
-    else:
-        query = query_starshaped
-
-    if config.target_shape is None:
-        if not collect_all_validation_results:
-            collect_all_validation_results = True
-            logger.warning('Running in blocking mode as the target shape is not given!')
-        if config.replace_target_query:
-            config.replace_target_query = False
-            logger.warning('Can only replace target query if target shape is given!')
-        if config.prune_shape_network:
-            config.prune_shape_network = False
-            logger.warning('Can only prune shape schema if target shape is given!')
-        if config.start_with_target_shape:
-            config.start_with_target_shape = False
-            logger.warning('Can only start with target shape if target shape is given!')
-
-    if not isinstance(config.target_shape, dict):  # Unify target shape -> {?var: list of shapes}
-        config.target_shape = unify_target_shape(config.target_shape, query_starshaped)
-
-    # The information we need depends on the output format:
-    if config.output_format == 'test' or (not config.reasoning):
-        query_to_be_executed = query.copy()
-    else:
-        query_to_be_executed = query.as_result_query()
-
-    statsCalc.taskCalculationStart()
-
-    # Start Processing Pipeline e.g. assigning each process a new task.
-    # 1. Get the Data
-    contact_source_task_description = (config.external_endpoint, query_to_be_executed.query_string, -1)
-    CONTACT_SOURCE_RUNNER.new_task(contact_source_in_connections, contact_source_out_connections, contact_source_task_description, stats_out_queue, config.run_in_serial)
-
-    validation_task_description = (config, query_to_be_executed.copy(), result_transmitter)
-    VALIDATION_RUNNER.new_task(validation_in_connections, validation_out_connections, validation_task_description, stats_out_queue, config.run_in_serial)
+    # Small requests are executed in this process (see fused_pipeline).
+    runners = _select_runners(config, query)
+    try:
+        contact_source_runner = runners['contactSource']
+        validation_runner = runners['mp_validate']
+        xjoin_runner = runners['mp_xjoin']
+        post_processing_runner = runners['mp_post_processing']
+        output_completion_runner = runners['mp_output_completion']
+
+        # Set up the multiprocessing queue, which will give the final output.
+        if result_queue is not None:
+            QUEUE_OUTPUT = True
+        else:
+            result_queue = output_completion_runner.get_new_out_queues(config.use_pipes)[0]
+            QUEUE_OUTPUT = False
+
+        # Preparing the multiprocessing queues
+        # 1. Create new queues for the given request (the validation may run in a separate process, even if the other tasks do not)
+        # The queues between the steps are bounded, such that a slow step holds back the previous ones.
+        stats_out_queue = validation_runner.get_new_queue()
+        contact_source_out_queues = contact_source_runner.get_new_out_queues(config.use_pipes, config.queue_capacity)
+        validation_out_queues = validation_runner.get_new_out_queues(config.use_pipes, config.queue_capacity)
+        xjoin_out_queues = xjoin_runner.get_new_out_queues(config.use_pipes, config.queue_capacity)
+        post_processing_out_queues = post_processing_runner.get_new_out_queues(config.use_pipes, config.queue_capacity)
+        output_completion_out_queues = (result_queue, )
+
+        # 2. Extract Out Queues
+        transformed_query_queue = contact_source_out_queues[0]  # pylint: disable=unbalanced-tuple-unpacking
+        val_queue = validation_out_queues[0]  # pylint: disable=unbalanced-tuple-unpacking
+        joined_results_queue = xjoin_out_queues[0]
+        final_result_queue = post_processing_out_queues[0]  # pylint: disable=unbalanced-tuple-unpacking
+
+        # 3. Collect the sender parts of the queues.
+        contact_source_out_connections = tuple((queue_adapter.sender for queue_adapter in contact_source_out_queues))
+        validation_out_connections = tuple((queue_adapter.sender for queue_adapter in validation_out_queues))
+        xjoin_out_connections = tuple((queue_adapter.sender for queue_adapter in xjoin_out_queues))
+        post_processing_out_connections = tuple((queue_adapter.sender for queue_adapter in post_processing_out_queues))
+        output_completion_out_connections = tuple((queue_adapter.sender for queue_adapter in output_completion_out_queues))
+
+        # 4. Collect the receiver parts of the queues.
+        contact_source_in_connections = tuple()
+        validation_in_connections = tuple()
+        xjoin_in_connections = (transformed_query_queue.receiver, val_queue.receiver)
+        post_processing_in_connections = (joined_results_queue.receiver, )
+        output_completion_in_connections = (final_result_queue.receiver, )
+
+        # The cancellation token allows the tasks to stop as soon as the request is finished early.
+        cancellation_token = CancellationToken(validation_runner.get_new_event())
+
+        # The execution stops after the first max_results results
+        max_results = min((k for k in (config.max_results, query.limit) if k is not None), default=None)
+        aggregate = config.output_format == 'aggregate'
+        if aggregate and max_results is not None:
+            max_results = None
+            logger.warning('The output format aggregate counts all results; max_results and the LIMIT of the query are ignored!')
+
+        collect_all_validation_results = config.collect_all_validation_results
+
+        # Sanitizing the input  
+        if query_starshaped is None:
+            if not collect_all_validation_results and not isinstance(config.target_shape, dict):
+                collect_all_validation_results = True
+                logger.warning('Running in blocking mode as the target variable(s) could not be identified!')
+            if config.replace_target_query and not isinstance(config.target_shape, dict):
+                config.replace_target_query = False
+                logger.warning('Can only replace target query if query is star-shaped!')
+        else:
+            query = query_starshaped
+
+        if config.target_shape is None:
+            if not collect_all_validation_results:
+                collect_all_validation_results = True
+                logger.warning('Running in blocking mode as the target shape is not given!')
+            if config.replace_target_query:
+                config.replace_target_query = False
+                logger.warning('Can only replace target query if target shape is given!')
+            if config.prune_shape_network:
+                config.prune_shape_network = False
+                logger.warning('Can only prune shape schema if target shape is given!')
+            if config.start_with_target_shape:
+                config.start_with_target_shape = False
+                logger.warning('Can only start with target shape if target shape is given!')
+
+        if not isinstance(config.target_shape, dict):  # Unify target shape -> {?var: list of shapes}
+            config.target_shape = unify_target_shape(config.target_shape, query_starshaped)
+
+        # Setup of the validation result transmitting strategy (SHACL engine --> API).
+        # This allows to process SHACL validation results as soon as they arrive.
+        result_transmitter = ValidationResultTransmitter(output_queue=val_queue.sender, first_val_time_queue=stats_out_queue, cancellation_token=cancellation_token,
+                                                         polarity=config.result_polarity, target_shapes=reduce(lambda a, b: a + b, config.target_shape.values()))
+
+        # The information we need depends on the output format:
+        if config.output_format == 'test' or (not config.reasoning):
+            query_to_be_executed = query.copy()
+        else:
+            query_to_be_executed = query.as_result_query()
+        if aggregate and 'UNDEF' not in config.target_shape:
+            # The targets are counted per result mapping, hence, each target (and group) needs to be part of a single result.
+            distinct_variables = list(config.target_shape.keys())
+            if config.aggregate_group_by is not None and config.aggregate_group_by not in distinct_variables:
+                distinct_variables.append(config.aggregate_group_by)
+            query_to_be_executed = query_to_be_executed.as_distinct_query(distinct_variables)
+
+        statsCalc.taskCalculationStart()
+
+        # Cancel the request, if it exceeds the timeout
+        timed_out = threading.Event()
+        if config.timeout is not None:
+            timeout_timer = threading.Timer(config.timeout, _cancel_after_timeout, args=(cancellation_token, config.timeout, timed_out))
+            timeout_timer.daemon = True
+            timeout_timer.start()
+            deadline = statsCalc.task_start_time + config.timeout + CANCELLATION_GRACE_PERIOD
+        else:
+            timeout_timer = None
+            deadline = None
+
+        # Instrumentation of the tasks (see shaclapi.multiprocessing.runner.run_task)
+        task_options = {'profile': config.profile, 'trace_memory': config.trace_memory, 'trace': statsCalc.test_name if config.trace_spans else None}
+        tracer = tracing.Tracer(statsCalc.test_name) if config.trace_spans else tracing.NULL_TRACER
+        tracer.complete('prepare', 'request', statsCalc.global_start_time, statsCalc.task_start_time, fused=runners is FUSED_RUNNERS)
+
+        # Start Processing Pipeline e.g. assigning each process a new task.
+        # 1. Get the Data
+        contact_source_task_description = (config.external_endpoint, query_to_be_executed.query_string, -1)
+        validation_task_description = (config, query_to_be_executed.copy(), result_transmitter)
+        if config.sideways_information_passing and 'UNDEF' not in config.target_shape:
+            # The contactSource passes the instances of the target variables to the validation.
+            target_instance_queue = validation_runner.get_new_channel(config.use_pipes)
+            contact_source_task_description += (target_instance_queue.sender, list(config.target_shape.keys()), config.target_instance_chunk_size)
+            validation_task_description += (target_instance_queue.receiver, )
+        contact_source_runner.new_task(contact_source_in_connections, contact_source_out_connections, contact_source_task_description, stats_out_queue, config.run_in_serial, cancellation_token, task_options)
+
+        validation_runner.new_task(validation_in_connections, validation_out_connections, validation_task_description, stats_out_queue, config.run_in_serial, cancellation_token, task_options)
+    except BaseException:
+        # The reservation of the in-process validation runner (see _select_runners) is only released by its task, which was not started.
+        if isinstance(runners['mp_validate'], InProcessRunner):
+            runners['mp_validate'].release()
+        raise
 
     # 2. Join the Data
-    xjoin_task_description = (config,)
-    XJOIN_RUNNER.new_task(xjoin_in_connections, xjoin_out_connections, xjoin_task_description, stats_out_queue, config.run_in_serial)
+    if config.record_join_inputs:
+        recording_file = os.path.join(os.path.abspath(config.output_directory), 'recordings', str(statsCalc.test_name) + '.ndjson.gz')
+    else:
+        recording_file = None
+    xjoin_task_description = (config, recording_file)
+    xjoin_runner.new_task(xjoin_in_connections, xjoin_out_connections, xjoin_task_description, stats_out_queue, config.run_in_serial, cancellation_token, task_options)
 
     # 3. Post-Processing: Restore missing vars (these one which could not find a join partner (literals etc.))
-    post_processing_task_description = (query_to_be_executed.PV, config.target_shape, query_to_be_executed.target_var, collect_all_validation_results)
-    POST_PROCESSING_RUNNER.new_task(post_processing_in_connections, post_processing_out_connections, post_processing_task_description, stats_out_queue, config.run_in_serial)
+    post_processing_task_description = (query_to_be_executed.PV, config.target_shape, query_to_be_executed.target_var, collect_all_validation_results, aggregate, config.aggregate_group_by,
+                                        config.result_polarity is not None)
+    post_processing_runner.new_task(post_processing_in_connections, post_processing_out_connections, post_processing_task_description, stats_out_queue, config.run_in_serial, cancellation_token, task_options)
 
     # 4. Transform to Outputformat
-    output_completion_task_description = (query.copy(), config.target_shape, config.output_format == 'test')
-    OUTPUT_COMPLETION_RUNNER.new_task(output_completion_in_connections, output_completion_out_connections, output_completion_task_description, stats_out_queue, config.run_in_serial)
+    output_completion_task_description = (query.copy(), config.target_shape, config.output_format == 'test', max_results, stats_out_queue if config.write_stats else None)
+    output_completion_runner.new_task(output_completion_in_connections, output_completion_out_connections, output_completion_task_description, stats_out_queue, config.run_in_serial, cancellation_token, task_options)
 
     if config.write_stats:
         # matrix_file = os.path.join(os.path.abspath(config.output_directory), 'matrix.csv')
-        # trace_file = os.path.join(os.path.abspath(config.output_directory), 'trace.csv')
         stats_file = os.path.join(os.path.abspath(config.output_directory), 'stats.csv')
     else:
         # matrix_file = None
-        # trace_file = None
         stats_file = None
 
     try:
-        # statsCalc.receive_and_write_trace(trace_file, timestamp_queue.receiver)
-        statsCalc.receive_global_stats(stats_out_queue, using_output_completion_runner=True)
-        statsCalc.write_matrix_and_stats_files(None, stats_file)
+        unfinished_tasks = statsCalc.receive_global_stats(stats_out_queue, using_output_completion_runner=True, deadline=deadline)
+        if unfinished_tasks:
+            _restart_runners(unfinished_tasks, runners, cancellation_token)
+            if 'mp_output_completion' in unfinished_tasks:
+                result_queue.sender.put('EOF')
+                statsCalc.globalCalculationFinished()
+        statsCalc.write_matrix_and_stats_files(None, stats_file, config.dief_t, config.dief_k)
+        if config.write_trace:
+            statsCalc.write_trace(os.path.join(os.path.abspath(config.output_directory), 'trace.csv'))
+        if config.trace_memory and config.write_stats:
+            statsCalc.write_memory(os.path.join(os.path.abspath(config.output_directory), 'memory.csv'))
     except Exception as e:
         import sys
         import traceback
@@ -217,23 +330,110 @@ def run_multiprocessing(pre_config, result_queue=None):
         logger.exception(str(emsg))
         result_queue.sender.put('EOF')
         return emsg
+    finally:
+        if timeout_timer is not None:
+            timeout_timer.cancel()
+
+    # The token is also cancelled by the output completion after max_results results, which may run in this process (see fused_pipeline).
+    status = 'timeout' if timed_out.is_set() else 'finished'
+
+    # The metrics of the stages are aggregated for /metrics and summarized for the response.
+    stage_times = statsCalc.stage_times()
+    METRICS.add_request(status, statsCalc.global_end_time - statsCalc.global_start_time, statsCalc.stage_metrics, stage_times)
+    metrics_summary = metrics.summary(statsCalc.stage_metrics, stage_times)
+    for stage, memory in statsCalc.memory.items():
+        metrics_summary.setdefault(stage, {})['memory'] = memory
+    if config.write_stats:
+        metrics_summary['answers'] = statsCalc.metrics(config.dief_t, config.dief_k)
 
     if not QUEUE_OUTPUT:
-        next_result = result_queue.receiver.get()
-        output = []
-        if config.output_format == 'test':
-            while next_result != 'EOF':
-                output = next_result
-                next_result = result_queue.receiver.get()
-                logger.info(len(output['validTargets']), len(output['invalidTargets']))
-        else:
-            while next_result != 'EOF':
-                output += [next_result]
-                next_result = result_queue.receiver.get()
+        with tracer.span('collect results', 'request'):
+            output = Output.from_results(iter(result_queue.receiver.get, 'EOF'), config.output_format, status)
         logger.debug('Finished collecting results!')
-        return Output(output)
+        if status == 'finished' and isinstance(output.output, list):
+            _remember_number_of_results((config.external_endpoint, config.query), len(output.output))
     else:
-        return None
+        output = Output(None, status)
+    output.metrics = metrics_summary
+    if config.trace_spans:
+        tracer.complete('request', 'request', statsCalc.global_start_time, time.time(), request_id=statsCalc.test_name, status=status)
+        tracer.name_thread('shaclapi')
+        tracing.export(tracer.events + statsCalc.trace_events, os.path.join(os.path.abspath(config.output_directory), 'traces', str(statsCalc.test_name) + '.json'), statsCalc.test_name)
+    if config.profile:
+        output.profile = profiling.report(statsCalc.profiles, os.path.join(os.path.abspath(config.output_directory), 'profile', str(statsCalc.test_name)))
+    return output
+
+
+def _cancel_after_timeout(cancellation_token, timeout, timed_out):
+    logger.warning('The request exceeded the timeout of {} seconds and is cancelled!'.format(timeout))
+    timed_out.set()
+    cancellation_token.cancel()
+
+
+def _restart_runners(unfinished_tasks, runners, cancellation_token):
+    """
+    Restarts the processes of the runners, which did not finish their task after the request was cancelled.
+    The tasks executed in threads of this process (see fused_pipeline) are stopped by closing their channels instead.
+    """
+    for task in unfinished_tasks:
+        if task not in runners:
+            continue
+        if isinstance(runners[task], InProcessRunner):
+            if not runners[task].stop_task(cancellation_token):
+                logger.warning('Task {} did not stop after the request was cancelled and its channels were closed; '
+                               'its thread stops as soon as its current operation returns!'.format(task))
+        else:
+            logger.warning('Task {} did not stop after the request was cancelled; restarting its process!'.format(task))
+            runners[task].stop_process()
+            runners[task].start_process()
+
+
+def _select_runners(config, query):
+    """
+    Returns the runners executing the tasks of the request: the runners of the fused pipeline, if fused_pipeline is turned on
+    or if it is 'auto' and the estimated number of results does not exceed fused_pipeline_threshold; otherwise the runners
+    with their own processes.
+    """
+    fused = config.fused_pipeline
+    if fused == 'auto':
+        estimated_results = _estimate_number_of_results(config, query)
+        fused = estimated_results is not None and estimated_results <= config.fused_pipeline_threshold
+        logger.info('Estimated {} results; {} the fused pipeline'.format(estimated_results, 'using' if fused else 'not using'))
+    if not fused:
+        return RUNNERS
+    runners = dict(FUSED_RUNNERS)
+    if not config.fused_validation:
+        runners['mp_validate'] = VALIDATION_RUNNER
+    elif not FUSED_RUNNERS['mp_validate'].reserve():
+        logger.info('Another request is validating in this process; using the validation process')
+        runners['mp_validate'] = VALIDATION_RUNNER
+    return runners
+
+
+def _estimate_number_of_results(config, query):
+    """
+    Returns the number of results of the last execution of the query or, if the query was not executed yet,
+    the number of results given by a COUNT query (see :func:`shaclapi.multiprocessing.contactSource.count_results`).
+    """
+    key = (config.external_endpoint, config.query)
+    with RESULT_SIZE_LOCK:
+        if key in RESULT_SIZE_ESTIMATES:
+            RESULT_SIZE_ESTIMATES.move_to_end(key)
+            return RESULT_SIZE_ESTIMATES[key]
+    number_of_results = count_results(config.external_endpoint, query)
+    if number_of_results is not None:
+        if query.limit is not None:
+            number_of_results = min(number_of_results, query.limit)
+        _remember_number_of_results(key, number_of_results)
+    return number_of_results
+
+
+def _remember_number_of_results(key, number_of_results):
+    with RESULT_SIZE_LOCK:
+        RESULT_SIZE_ESTIMATES[key] = number_of_results
+        RESULT_SIZE_ESTIMATES.move_to_end(key)
+        while len(RESULT_SIZE_ESTIMATES) > 1024:
+            RESULT_SIZE_ESTIMATES.popitem(last=False)
 
 
 def _make_list(x):
@@ -283,6 +483,59 @@ def only_reduce_shape_schema(pre_config):
     return node_order
 
 
+def batch_reduce_shape_schema(pre_config):
+    """Reduces the given SHACL shape schema for several target shapes at once.
+
+    The SHACL shape schema is parsed only once. Afterwards, the reduced shape schema
+    is computed for each of the target shapes (see :func:`only_reduce_shape_schema`).
+    If no target shape is given, all shapes of the shape schema are used as target shapes.
+    Additionally, the overlap of the reduced shape schemas is computed for each pair of
+    target shapes (see :func:`overlap_reduced_schemas`).
+
+    Returns
+    -------
+    dict
+        The reduced shape schemas per target shape and the pairwise overlap matrix.
+        JSON structure:
+
+        .. code-block:: none
+
+           {
+               shapes: {
+                   shape1: [shape1, shape3, ...],
+                   shape2: [shape2, ...],
+                   ...
+               },
+               overlap: {
+                   shape1: {shape1: 1.0, shape2: 0.5, ...},
+                   shape2: {shape1: 0.5, shape2: 1.0, ...},
+                   ...
+               }
+           }
+
+    """
+    reduced_schemas, index = _reduce_shape_schema_per_target(pre_config)
+    overlap = {
+        shape_one: {
+            shape_two: index.overlap(index.reachable_from(shape_one), index.reachable_from(shape_two))
+            for shape_two in reduced_schemas
+        }
+        for shape_one in reduced_schemas
+    }
+    return {'shapes': reduced_schemas, 'overlap': overlap}
+
+
+def _reduce_shape_schema_per_target(pre_config):
+    """Parses the shape schema once and returns the reduced shape schema per target shape as well as the reachability index."""
+    from shaclapi.reduction.travshacl.ReducedShapeParser import ReducedShapeParser
+    from TravSHACL.core.GraphTraversal import GraphTraversal
+    config = Config.from_request_form(pre_config)
+    if config.target_shape is not None:
+        config.target_shape = unify_target_shape(config.target_shape, None)
+    shape_parser = ReducedShapeParser(None, GraphTraversal.DFS, config)
+    return shape_parser.parse_reduced_schemas(config.schema_directory, config.schema_format, True, 256, False)
+
+
 def overlap_reduced_schemas(pre_config, shape_one, shape_two):
     """Computes the percentage of overlap for two reduced shape schemas.
 
@@ -297,28 +550,12 @@ def overlap_reduced_schemas(pre_config, shape_one, shape_two):
         The percentage of overlap in both reduced shape schemas based on
         the minimal number of shapes in the input shape schemas.
     """
-    config_one = pre_config
-    if not isinstance(shape_one, list):
-        shape_one = [shape_one]
-    reduced_schema_one = set()
-    for shape in shape_one:
-        config_one['target_shape'] = shape
-        [reduced_schema_one.add(node) for node in only_reduce_shape_schema(config_one)]
-
-    config_two = pre_config
-    if not isinstance(shape_two, list):
-        shape_two = [shape_two]
-    reduced_schema_two = set()
-    for shape in shape_two:
-        config_two['target_shape'] = shape
-        [reduced_schema_two.add(node) for node in only_reduce_shape_schema(config_two)]
-
-    # max_size = max(len(reduced_schema_one), len(reduced_schema_two))
-    min_size = min(len(reduced_schema_one), len(reduced_schema_two))
-    intersection = set(reduced_schema_one).intersection(set(reduced_schema_two))
-    inter_size = len(intersection)
-
-    return float(inter_size / min_size) if min_size > 0 else 0
+    shape_one = _make_list(shape_one)
+    shape_two = _make_list(shape_two)
+    pre_config.pop('targetShape', None)
+    pre_config['target_shape'] = shape_one + shape_two
+    _, index = _reduce_shape_schema_per_target(pre_config)
+    return index.overlap(index.reduce(shape_one), index.reduce(shape_two))
 
 
 def validation_and_statistics(pre_config):
@@ -353,20 +590,22 @@ def validation_and_statistics(pre_config):
               ...
           }
 
+       With the output format 'aggregate' only the counts are returned, i.e., {shape1: {valid: ..., invalid: ...}, ...}.
+       The validation results are counted as they arrive, hence, the memory used does not depend on the number of instances.
+
     """
     from multiprocessing import Queue
     config = Config.from_request_form(pre_config)
-    queue = Queue()
-    result_transmitter = ValidationResultTransmitter(output_queue=queue)
-
-    query = config.query
-    if query is not None:
-        query = Query.prepare_query(config.query)
-        query_starshaped = query.make_starshaped()
-        config.target_shape = unify_target_shape(config.target_shape, query_starshaped)
+    if config.output_format == 'aggregate':
+        counts = ValidationCounts()
+        result_transmitter = CountingResultTransmitter(counts)
+    else:
+        queue = Queue()
+        result_transmitter = ValidationResultTransmitter(output_queue=queue)
 
-    shape_schema = prepare_validation(config, Query(config.query) if query is not None else None, result_transmitter)
-    shape_schema.validate(config.start_with_target_shape)
+    _validate(config, result_transmitter)
+    if config.output_format == 'aggregate':
+        return counts.summary()
     queue.put('EOF')
 
     val_results = {}
@@ -385,3 +624,101 @@ def validation_and_statistics(pre_config):
     queue.close()
     queue.cancel_join_thread()
     return val_results
+
+
+def _validate(config, result_transmitter):
+    """
+    Runs the validation of the (reduced) shape schema given by the configuration, sending the results to the result transmitter.
+    The validation is executed in the calling thread; it waits until no other validation is executed in this process (see FUSED_RUNNERS).
+    """
+    query = config.query
+    if query is not None:
+        query = Query.prepare_query(config.query)
+        query_starshaped = query.make_starshaped()
+        config.target_shape = unify_target_shape(config.target_shape, query_starshaped)
+
+    validation_runner = FUSED_RUNNERS['mp_validate']
+    validation_runner.reserve(blocking=True)
+    try:
+        shape_schema = prepare_validation(config, Query(config.query) if query is not None else None, result_transmitter)
+        shape_schema.validate(config.start_with_target_shape)
+    finally:
+        validation_runner.release()
+
+
+def _validate_into_queue(config, result_transmitter, queue):
+    try:
+        _validate(config, result_transmitter)
+    except RequestCancelled:
+        logger.info('Streaming validation cancelled')
+    except Exception as e:
+        logger.exception('Streaming validation failed')
+        queue.put({'error': repr(e)})
+    finally:
+        queue.put('EOF')
+
+
+def stream_validation(pre_config):
+    """Same as :func:`validation_and_statistics`, but the validation results are yielded as soon as they arrive.
+
+    The validation runs in a separate thread. It is blocked, if more than STREAM_BUFFER_SIZE results are not yet consumed,
+    and cancelled, if the generator is closed before all results are consumed (e.g., because the client disconnected).
+
+    Yields
+    ------
+    dict
+       One dictionary per validation result: {instance: ..., shape: ..., valid: True/False}.
+       If the validation fails, the last dictionary is {error: ...}.
+    """
+    config = Config.from_request_form(pre_config)
+    results = Queue(maxsize=STREAM_BUFFER_SIZE)
+    cancellation_token = CancellationToken(threading.Event(), check_interval=0)
+    result_transmitter = ValidationResultTransmitter(output_queue=results, cancellation_token=cancellation_token)
+    threading.Thread(target=_validate_into_queue, args=(config, result_transmitter, results), daemon=True).start()
+
+    item = results.get()
+    try:
+        while item != 'EOF':
+            if 'error' in item:
+                yield item
+            else:
+                yield {'instance': item['instance'], 'shape': item['validation'][0], 'valid': item['validation'][1]}
+            item = results.get()
+    finally:
+        if item != 'EOF':
+            cancellation_token.cancel()
+            drain(results, item)
+
+
+def store_validation_results(pre_config):
+    """Runs the validation and stores the validation results on the server (see :class:`shaclapi.resultStore.ResultStore`).
+
+    Returns
+    -------
+    dict
+       The handle to page through the results with :func:`get_validation_results`, the number of results and the per-shape counts:
+       {handle: ..., size: ..., shapes: {shape1: {valid: ..., invalid: ...}, ...}}
+    """
+    counts = ValidationCounts()
+
+    def count(results):
+        for result in results:
+            if 'error' in result:
+                raise Exception(result['error'])
+            counts.add(result['shape'], result['valid'])
+            yield result
+
+    handle = VALIDATION_RESULT_STORE.create(count(stream_validation(pre_config)))
+    return {'handle': handle, 'size': VALIDATION_RESULT_STORE.size(handle), 'shapes': counts.summary()}
+
+
+def get_validation_results(handle, cursor=None, limit=1000):
+    """Returns a page of the validation results stored with :func:`store_validation_results`.
+
+    Returns
+    -------
+    dict
+       {results: [{instance: ..., shape: ..., valid: ...}, ...], next_cursor: ...}; next_cursor is None after the last page.
+    """
+    results, next_cursor = VALIDATION_RESULT_STORE.page(handle, cursor, int(limit))
+    return {'results': results, 'next_cursor': next_cursor}
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import threading
+
+from shaclapi.config import Config
+from shaclapi.output import StreamedOutput
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_hash(config_dict):
+    """
+    Returns a hash of the effective configuration, which does not depend on the order of the options.
+    The option config is ignored, because the options of the configuration file are already part of the effective configuration.
+    """
+    options = {option: value for option, value in config_dict.items() if option != 'config'}
+    return hashlib.sha256(json.dumps(options, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+
+class ResultBroadcast:
+    """
+    Passes the output of a single request on to all identical requests waiting for it.
+    """
+
+    def __init__(self):
+        self.finished = False
+        self.output = None
+        self.condition = threading.Condition()
+
+    def finish(self, output):
+        """Marks the request as finished; output is the return value of :func:`shaclapi.api.run_multiprocessing`."""
+        with self.condition:
+            self.finished = True
+            self.output = output
+            self.condition.notify_all()
+
+    def wait(self):
+        """Waits until the request is finished and returns its output."""
+        with self.condition:
+            while not self.finished:
+                self.condition.wait()
+        return self.output
+
+
+class RequestCoalescer:
+    """
+    Executes identical concurrent requests of :func:`shaclapi.api.run_multiprocessing` only once.
+
+    Requests are identical, if the hashes (see :func:`canonical_hash`) of their effective configurations are equal.
+    The first request starts the execution, all requests arriving before it finishes wait for it and share its output.
+    Requests only arrive concurrently, if the server handles requests in several threads (e.g. flask run, but not the single
+    synchronous worker configured in gunicorn.conf.py).
+    If a response cache (see :class:`shaclapi.responseCache.ResponseCache`) is given, requests with the option use_response_cache
+    are answered from the cache if possible and their finished results are added to the cache.
+    """
+
+    def __init__(self, run=None, response_cache=None):
+        # Only replaced in tests; defaults to shaclapi.api.run_multiprocessing
+        self.run = run
+        self.response_cache = response_cache
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def run_multiprocessing(self, pre_config):
+        """Same as :func:`shaclapi.api.run_multiprocessing`, but attaches to an identical request in flight, if there is one."""
+        config = Config.from_request_form(dict(pre_config))
+        cache_key = None
+        if self.response_cache is not None and config.use_response_cache:
+            cache_key = self.response_cache.key(config)
+            results = self.response_cache.get(cache_key)
+            if results is not None:
+                return StreamedOutput(results, config.output_format)
+
+        key = canonical_hash(config.config_dict)
+        with self.lock:
+            broadcast = self.in_flight.get(key)
+            is_leader = broadcast is None
+            if is_leader:
+                broadcast = ResultBroadcast()
+                self.in_flight[key] = broadcast
+        if is_leader:
+            threading.Thread(target=self._execute, args=(key, pre_config, broadcast, cache_key), daemon=True).start()
+        else:
+            logger.info('Attaching to the identical request {} in flight'.format(key))
+
+        return broadcast.wait()
+
+    def _execute(self, key, pre_config, broadcast, cache_key=None):
+        from shaclapi import api
+        run = self.run or api.run_multiprocessing
+        # Without a result queue, the results are collected from the queue of the runner of the output completion,
+        # which is a queue of this process, if the pipeline is fused.
+        try:
+            output = run(pre_config)
+        except Exception as e:
+            logger.exception('Request {} failed'.format(key))
+            output = repr(e)
+        if cache_key is not None and not isinstance(output, str) and output.status == 'finished':
+            # The output formats 'test' and 'aggregate' only keep the last result (see Output.from_results).
+            results = output.output if isinstance(output.output, list) else [output.output]
+            try:
+                self.response_cache.put(cache_key, results)
+            except OSError:
+                logger.exception('Could not cache the results of request {}'.format(key))
+        with self.lock:
+            del self.in_flight[key]
+        broadcast.finish(output)
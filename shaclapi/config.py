@@ -43,6 +43,10 @@ class Config:
             raise Exception('It is not possible to not prune the shape network but removing constraints (impling pruning the shape network...)')
         if self.use_pipes and self.run_in_serial:
             raise Exception('Pipes can only hold a limited amount of data and can therefore not be used in serial mode.')
+        if self.only_valid and self.only_invalid:
+            raise Exception('Only one of the options only_valid and only_invalid can be turned on.')
+        if not 1 <= self.validation_shards <= 16:
+            raise Exception('validation_shards needs to be between 1 and 16')
 
     # ------------------------------- required configuration options -------------------------------------------
     @property
@@ -259,10 +263,70 @@ class Config:
     @property
     def output_format(self):
         """
-        Which output format the shaclAPI should use. This can be 'test' or 'simple'.
+        Which output format the shaclAPI should use. This can be 'test', 'simple' or 'aggregate'.
+        The output format 'aggregate' only returns the number of valid and invalid targets per target shape (see :class:`shaclapi.aggregation.ValidationCounts`).
         """
         return self.config_dict.get('output_format', 'simple')
 
+    @property
+    def fused_pipeline(self):
+        """
+        Whether all tasks are executed in the calling process (connected by in-process queues) instead of the processes of the runners.
+        This avoids the overhead of the inter-process communication for small requests.
+        With 'auto' the fused pipeline is used, if the estimated number of results does not exceed fused_pipeline_threshold.
+        """
+        fused_pipeline = self.config_dict.get('fused_pipeline', False)
+        return 'auto' if fused_pipeline == 'auto' else self.entry_to_bool(fused_pipeline)
+
+    @property
+    def fused_pipeline_threshold(self):
+        """
+        Maximal estimated number of results for which the fused pipeline is used, if fused_pipeline is 'auto'.
+        The estimate is the number of results of the previous execution of the query or the result of a COUNT query.
+        """
+        return int(self.config_dict.get('fused_pipeline_threshold', 1000))
+
+    @property
+    def fused_validation(self):
+        """
+        Whether the validation is executed in the calling process as well, when the fused pipeline is used.
+        Otherwise, the validation is executed in the process of its runner. Only one validation is executed in the calling process
+        at a time; concurrent requests are validated in the process of the runner (requests of /validation wait instead).
+        """
+        return self.entry_to_bool(self.config_dict.get('fused_validation', True))
+
+    @property
+    def use_response_cache(self):
+        """
+        Whether /multiprocessing may answer the request from the response cache and adds the results to the cache.
+        Cached results are invalidated if the shape schema changes or after one hour.
+        """
+        return self.entry_to_bool(self.config_dict.get('use_response_cache', False))
+
+    @property
+    def stream_results(self):
+        """
+        Whether /validation streams the validation results as newline delimited JSON as soon as they arrive.
+        """
+        return self.entry_to_bool(self.config_dict.get('stream_results', False))
+
+    @property
+    def store_results(self):
+        """
+        Whether /validation stores the validation results on the server and only returns a handle to page through them.
+        """
+        return self.entry_to_bool(self.config_dict.get('store_results', False))
+
+    @property
+    def aggregate_group_by(self):
+        """
+        Query variable by which the counts of the output format 'aggregate' are grouped, e.g. ?x.
+        """
+        group_by = self.config_dict.get('aggregate_group_by', None)
+        if group_by is not None and not group_by.startswith('?'):
+            group_by = '?' + group_by
+        return group_by
+
     @property
     def memory_size(self):
         """
@@ -270,6 +334,112 @@ class Config:
         """
         return int(self.config_dict.get('memory_size', 100000000))
 
+    @property
+    def cache_shape_schema(self):
+        """
+        Whether to keep the parsed shape schema in memory and reuse it for subsequent requests.
+        The shape files are parsed again if one of them changed.
+        """
+        return self.entry_to_bool(self.config_dict.get('cache_shape_schema', True))
+
+    @property
+    def validate_components_in_parallel(self):
+        """
+        Whether to validate target shapes with disjoint reduced shape schemas in separate processes.
+        Only applies if the shape schema is pruned and there is more than one target shape.
+        """
+        return self.entry_to_bool(self.config_dict.get('validate_components_in_parallel', False))
+
+    @property
+    def validation_shards(self):
+        """
+        Number of processes validating the instances of the target shape. The instances are assigned to the processes by the hash of their IRI.
+        Only applies if there is exactly one target shape with a target query. At most 16 shards are supported.
+        Shards without targets (counted at the endpoint beforehand) are not validated.
+        """
+        return int(self.config_dict.get('validation_shards', 1))
+
+    @property
+    def validation_shard(self):
+        """
+        The shard of the target shape instances to be validated. This option is set by the shaclAPI for each process of a sharded validation.
+        """
+        shard = self.config_dict.get('validation_shard', None)
+        return int(shard) if shard is not None else None
+
+    @validation_shard.setter
+    def validation_shard(self, shard):
+        self.config_dict['validation_shard'] = shard
+
+    @property
+    def sideways_information_passing(self):
+        """
+        Whether the distinct instances of the target variables received from the SPARQL endpoint are passed in chunks to the validation.
+        The target queries of the target shapes are restricted to these instances, instead of evaluating the query a second time (see :attr:`replace_target_query`).
+        """
+        return self.entry_to_bool(self.config_dict.get('sideways_information_passing', False))
+
+    @property
+    def target_instance_chunk_size(self):
+        """
+        Number of target instances passed at once to the validation, if :attr:`sideways_information_passing` is turned on.
+        """
+        return int(self.config_dict.get('target_instance_chunk_size', 1000))
+
+    @property
+    def target_instances(self):
+        """
+        The instances of the target shapes to be validated per query variable. This option is set by the shaclAPI for each chunk of target instances (see :attr:`sideways_information_passing`).
+        """
+        return self.config_dict.get('target_instances', None)
+
+    @target_instances.setter
+    def target_instances(self, target_instances):
+        self.config_dict['target_instances'] = target_instances
+
+    @property
+    def max_results(self):
+        """
+        The maximal number of results to be returned. As soon as these results are produced, the remaining tasks are cancelled.
+        If the query has a LIMIT, the smaller of both numbers is used.
+        """
+        max_results = self.config_dict.get('max_results', None)
+        return int(max_results) if max_results is not None else None
+
+    @property
+    def timeout(self):
+        """
+        Wall-clock time in seconds after which the request is cancelled. The results produced until then are returned.
+        """
+        timeout = self.config_dict.get('timeout', None)
+        return float(timeout) if timeout is not None else None
+
+    @property
+    def only_valid(self):
+        """
+        Whether only mappings with valid target instances are returned. Invalid validation results are dropped as early as possible.
+        """
+        return self.entry_to_bool(self.config_dict.get('only_valid', False))
+
+    @property
+    def only_invalid(self):
+        """
+        Whether only mappings with invalid target instances are returned. Valid validation results are dropped as early as possible.
+        """
+        return self.entry_to_bool(self.config_dict.get('only_invalid', False))
+
+    @property
+    def result_polarity(self):
+        """
+        True if only valid results are wanted (:attr:`only_valid`), False if only invalid results are wanted (:attr:`only_invalid`) and None otherwise.
+        """
+        if self.only_valid:
+            return True
+        elif self.only_invalid:
+            return False
+        else:
+            return None
+
     @property
     def prune_shape_network(self):
         """
@@ -323,6 +493,71 @@ class Config:
         """
         return self.entry_to_bool(self.config_dict.get('write_stats', True))
 
+    @property
+    def profile(self):
+        """
+        Whether to profile each step of the pipeline with cProfile and a stack sampler. The profiles are written to
+        profile/<test_identifier> in the output directory (pstats files and collapsed stacks for flame graphs).
+        """
+        return self.entry_to_bool(self.config_dict.get('profile', False))
+
+    @property
+    def trace_memory(self):
+        """
+        Whether to trace the memory used by each step of the pipeline with tracemalloc. Peak resident set size, peak traced memory
+        and top allocation sites of each step are part of the metrics and written to memory.csv in the output directory (only if write_stats is turned on).
+        """
+        return self.entry_to_bool(self.config_dict.get('trace_memory', False))
+
+    @property
+    def trace_spans(self):
+        """
+        Whether to record spans of the steps of the pipeline (endpoint requests, validation phases per shape, join stages, output completion).
+        The spans of all processes are written to traces/<test_identifier>.json in the output directory in the Chrome trace event format.
+        """
+        return self.entry_to_bool(self.config_dict.get('trace_spans', False))
+
+    @property
+    def record_join_inputs(self):
+        """
+        Whether to record the items received by the join from the query and the validation with the time they were received.
+        The recording is written to recordings/<test_identifier>.ndjson.gz in the output directory and can be replayed with benchmarks.replay.
+        """
+        return self.entry_to_bool(self.config_dict.get('record_join_inputs', False))
+
+    @property
+    def write_trace(self):
+        """
+        Whether to write the time of each answer to trace.csv in the output directory (only if write_stats is turned on).
+        """
+        return self.write_stats and self.entry_to_bool(self.config_dict.get('write_trace', False))
+
+    @property
+    def dief_t(self):
+        """
+        Time (in seconds) until which dief@t is computed for stats.csv; defaults to the total execution time of the request.
+        """
+        return float(self.config_dict['dief_t']) if self.config_dict.get('dief_t') is not None else None
+
+    @property
+    def dief_k(self):
+        """
+        Number of answers until which dief@k is computed for stats.csv; defaults to all answers.
+        """
+        return int(self.config_dict['dief_k']) if self.config_dict.get('dief_k') is not None else None
+
+    @property
+    def queue_capacity(self):
+        """
+        Maximal number of items buffered in each queue between the steps of the pipeline (0 means unbounded).
+        A step producing faster than the next step consumes is blocked while the queue is full; this holds back
+        the download from the SPARQL endpoint, too. Pipes (see use_pipes) are bounded by the buffer of the operating system instead.
+        In serial mode (see run_in_serial) the queues are unbounded, since a step is only started once the previous one finished.
+        """
+        if self.run_in_serial:
+            return 0
+        return int(self.config_dict.get('queue_capacity', 10000))
+
     @property
     def query_extension_per_target_shape(self):
         """
@@ -0,0 +1,184 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from queue import Queue
+
+from shaclapi.config import Config
+from shaclapi.output import Output
+from shaclapi.resultStore import ResultStore
+
+logger = logging.getLogger(__name__)
+
+
+class JobNotFinished(Exception):
+    """
+    Raised when the final result of a job is requested before the job finished.
+    """
+    pass
+
+
+class Job:
+    """
+    A request of :func:`shaclapi.api.run_multiprocessing`, which is executed in the background.
+    The status of a job is 'queued', 'running', 'finished', 'timeout' (partial results, see the option timeout) or 'failed'.
+    """
+
+    def __init__(self, pre_config):
+        self.id = uuid.uuid4().hex
+        self.pre_config = pre_config
+        self.output_format = Config.from_request_form(dict(pre_config)).output_format
+        self.status = 'queued'
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.stats = None
+        self.metrics = None
+
+    @property
+    def done(self):
+        return self.status in ('finished', 'timeout', 'failed')
+
+    def set_stats(self, stats):
+        self.stats = stats
+
+
+class JobManager:
+    """
+    Executes the submitted jobs in a background thread and spools their results to disk (see :class:`shaclapi.resultStore.ResultStore`).
+
+    The jobs are executed one after another, because the runners of :py:mod:`shaclapi.api` are shared by all requests.
+    Finished jobs are evicted, if they finished more than max_age seconds ago or if the spooled results of all jobs
+    exceed max_bytes (oldest jobs first).
+    """
+
+    def __init__(self, store=None, max_age=3600, max_bytes=1 << 30, poll_interval=0.2, run=None, new_result_queue=None):
+        self.store = store or ResultStore(directory=os.path.join(tempfile.gettempdir(), 'shaclapi_jobs'), max_handles=None)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        # Only replaced in tests; defaults to shaclapi.api.run_multiprocessing and shaclapi.api.get_result_queue
+        self.run = run
+        self.new_result_queue = new_result_queue
+        self.jobs = OrderedDict()
+        self.pending = Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def submit(self, pre_config):
+        """Queues a new job for the given configuration and returns it immediately."""
+        job = Job(pre_config)
+        with self.lock:
+            self.jobs[job.id] = job
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._work, daemon=True)
+                self.worker.start()
+        self.pending.put(job)
+        self.evict()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs[job_id]
+
+    def status(self, job_id):
+        """Returns the status of the job including the number of spooled results and the progress of each step of the pipeline."""
+        job = self.get(job_id)
+        try:
+            number_of_results = self.store.size(job.id)
+        except KeyError:
+            number_of_results = 0
+        return {'id': job.id,
+                'status': job.status,
+                'error': job.error,
+                'submitted': job.submitted,
+                'started': job.started,
+                'finished': job.finished,
+                'results': number_of_results,
+                'progress': job.stats.progress() if job.stats is not None else None,
+                'metrics': job.metrics}
+
+    def page(self, job_id, cursor=None, limit=1000):
+        """
+        Returns the spooled results of the job starting at the cursor (see :meth:`shaclapi.resultStore.ResultStore.page`).
+        The results can be read while the job is running; the returned cursor is None after the last result of a finished job.
+        """
+        job = self.get(job_id)
+        try:
+            return self.store.page(job.id, cursor, limit)
+        except KeyError:
+            if job.done:
+                raise
+            return [], cursor or 0
+
+    def stream(self, job_id, cursor=None):
+        """Yields the results of the job as soon as they are spooled until the job is finished."""
+        job = self.get(job_id)
+        while True:
+            results, cursor = self.page(job_id, cursor)
+            yield from results
+            if cursor is None:
+                # All results are spooled; the status of the job is set right afterwards.
+                while not job.done:
+                    time.sleep(0.01)
+                return
+            if not results:
+                time.sleep(self.poll_interval)
+
+    def result(self, job_id):
+        """Returns the final result of the job in the same format as :func:`shaclapi.api.run_multiprocessing`."""
+        job = self.get(job_id)
+        if not job.done:
+            raise JobNotFinished('Job {} is {}'.format(job.id, job.status))
+        return Output.from_results(self.stream(job_id), job.output_format, job.status).output
+
+    def evict(self):
+        now = time.time()
+        with self.lock:
+            total_bytes = sum(self.store.bytes(job_id) for job_id in self.jobs)
+            for job in [job for job in self.jobs.values() if job.done]:
+                if now - job.finished > self.max_age or total_bytes > self.max_bytes:
+                    logger.debug('Evicting job {}'.format(job.id))
+                    total_bytes -= self.store.bytes(job.id)
+                    del self.jobs[job.id]
+                    self.store.remove(job.id)
+
+    def _work(self):
+        while True:
+            job = self.pending.get()
+            with self.lock:
+                if job.id not in self.jobs:
+                    continue
+            self._execute(job)
+            self.evict()
+
+    def _execute(self, job):
+        from shaclapi import api
+        run = self.run or api.run_multiprocessing
+        result_queue = (self.new_result_queue or api.get_result_queue)()
+        spooler = threading.Thread(target=self.store.create, args=(iter(result_queue.receiver.get, 'EOF'), job.id), daemon=True)
+        spooler.start()
+
+        job.started = time.time()
+        job.status = 'running'
+        try:
+            output = run(job.pre_config, result_queue, stats_callback=job.set_stats)
+            if isinstance(output, str):
+                status, job.error = 'failed', output
+            else:
+                status, job.metrics = output.status, output.metrics
+        except Exception as e:
+            logger.exception('Job {} failed'.format(job.id))
+            status, job.error = 'failed', repr(e)
+            result_queue.sender.put('EOF')
+        spooler.join()
+        job.finished = time.time()
+        job.status = status
+        logger.info('Job {} {} after {:.3f} seconds'.format(job.id, job.status, job.finished - job.started))
+
+
+JOB_MANAGER = JobManager()
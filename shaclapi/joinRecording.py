@@ -0,0 +1,63 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+LEFT = 0  # transformed_query_queue
+RIGHT = 1  # val_queue
+
+
+class JoinInputRecorder:
+    """
+    Records the items of the two input streams of the join (transformed_query_queue and val_queue, see :py:mod:`shaclapi.api`)
+    together with the time they were received by the join relative to the start of the recording.
+    The recording can be replayed into a join operator without a SPARQL endpoint (see benchmarks.replay).
+
+    The recording is stored gzip compressed, one JSON array [stream, seconds, item] per line, where stream is LEFT or RIGHT.
+    The 'EOF' of each stream is recorded as well. Values which are not JSON serializable are recorded as strings.
+    """
+
+    def __init__(self, file):
+        os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+        self.file = gzip.open(file, 'wt', encoding='utf8', compresslevel=1)
+        self.lock = threading.Lock()
+        self.number_of_items = 0
+        self.start = time.perf_counter()
+
+    def receiver(self, receiver, stream):
+        """Returns the receiver wrapped such that the received items are recorded as items of the stream."""
+        return RecordingReceiver(receiver, self, stream)
+
+    def record(self, stream, item):
+        line = json.dumps([stream, round(time.perf_counter() - self.start, 6), item], separators=(',', ':'), default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.number_of_items += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingReceiver:
+    """Receiving part of a channel, which records the received items with a :class:`JoinInputRecorder`."""
+
+    def __init__(self, receiver, recorder, stream):
+        self.receiver = receiver
+        self.recorder = recorder
+        self.stream = stream
+
+    def get(self, *args, **kwargs):
+        item = self.receiver.get(*args, **kwargs)
+        self.recorder.record(self.stream, item)
+        return item
+
+    def __getattr__(self, name):
+        return getattr(self.receiver, name)
+
+
+def read_recording(file):
+    """Returns the items of the recording as a list of (stream, seconds, item) ordered by the time they were received."""
+    with gzip.open(file, 'rt', encoding='utf8') as f:
+        return [tuple(json.loads(line)) for line in f]
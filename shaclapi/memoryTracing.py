@@ -0,0 +1,106 @@
+import os
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows; only the numbers of tracemalloc are reported
+    resource = None
+
+# tracemalloc traces the whole process; the tasks of the in-process runners share it (see shaclapi.multiprocessing.runner.InProcessRunner).
+_lock = threading.Lock()
+_active_tracers = 0
+_started_tracemalloc = False
+
+_IGNORED_FILES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>')
+
+
+class MemoryTracer:
+    """
+    Traces the memory used while a task is executed with tracemalloc.
+
+    A watcher thread takes a snapshot of the traced memory each time it grew by more than a quarter since the last snapshot,
+    hence, the top allocation sites are the ones of (approximately) the peak of the traced memory.
+    The peaks are the ones of the process; if tasks are executed by several threads of the same process, they include the memory of all of them.
+    """
+
+    def __init__(self, top=10, interval=0.05):
+        self.top = top
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.stopped = threading.Event()
+        self.watcher = None
+
+    def start(self):
+        global _active_tracers, _started_tracemalloc
+        with _lock:
+            if _active_tracers == 0:
+                _reset_peak_rss()
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _started_tracemalloc = True
+                tracemalloc.reset_peak()
+            _active_tracers += 1
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        """Stops tracing and returns {'peak_rss': bytes, 'peak_traced': bytes, 'top_allocations': [{'site', 'size', 'count'}, ...]}."""
+        global _active_tracers, _started_tracemalloc
+        self.stopped.set()
+        self.watcher.join()
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        if self.snapshot is None:
+            self._take_snapshot(tracemalloc.get_traced_memory()[0])
+        with _lock:
+            _active_tracers -= 1
+            if _active_tracers == 0 and _started_tracemalloc:
+                tracemalloc.stop()
+                _started_tracemalloc = False
+        return {'peak_rss': peak_rss(), 'peak_traced': peak_traced, 'top_allocations': self.top_allocations()}
+
+    def top_allocations(self):
+        """Returns the allocation sites (file:line) with the most memory in the snapshot at the peak."""
+        if self.snapshot is None:
+            return []
+        snapshot = self.snapshot.filter_traces([tracemalloc.Filter(False, file) for file in _IGNORED_FILES])
+        return [{'site': '{}:{}'.format(statistic.traceback[0].filename, statistic.traceback[0].lineno), 'size': statistic.size, 'count': statistic.count}
+                for statistic in snapshot.statistics('lineno')[:self.top]]
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.snapshot_size * 1.25:
+                self._take_snapshot(current)
+
+    def _take_snapshot(self, size):
+        try:
+            self.snapshot, self.snapshot_size = tracemalloc.take_snapshot(), size
+        except RuntimeError:  # tracemalloc was stopped by another thread
+            pass
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in bytes or None, if it is unknown (on Windows)."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is the peak since the start of the process (in kilobytes on Linux, in bytes on macOS).
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+
+def _reset_peak_rss():
+    # Linux allows to reset the peak resident set size, otherwise the peak of the runner processes is the one since their start.
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
@@ -0,0 +1,248 @@
+import bisect
+import threading
+import time
+
+SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+DEPTH_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+COUNTERS = {
+    'requests': 'Requests executed by the pipeline per status',
+    'items_in': 'Items received by a stage',
+    'items_out': 'Items sent by a stage',
+    'validation_results': 'Validation results produced by the validation',
+    'endpoint_requests': 'Requests sent to the SPARQL endpoint',
+    'endpoint_bytes': 'Bytes received from the SPARQL endpoint',
+    'join_spills': 'Number of times the join flushed a part of its tables to disk',
+    'join_spilled_items': 'Items flushed to disk by the join'
+}
+
+HISTOGRAMS = {
+    'item_seconds': (SECONDS_BUCKETS, 'Processing time per item received by a stage'),
+    'queue_depth': (DEPTH_BUCKETS, 'Sampled number of items waiting in the output queues of a stage'),
+    'endpoint_request_seconds': (SECONDS_BUCKETS, 'Time until the SPARQL endpoint started to answer a request'),
+    'stage_seconds': (SECONDS_BUCKETS, 'Execution time of a stage per request'),
+    'request_seconds': (SECONDS_BUCKETS, 'Execution time of a request')
+}
+
+# Number of items sent between two samples of the queue depth; asking a manager queue for its size is a round trip to the manager.
+QUEUE_DEPTH_SAMPLE_INTERVAL = 100
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets; counts[i] is the number of observations less than or equal to buckets[i]
+    and greater than the previous bucket, the last entry counts the observations greater than all buckets.
+    """
+
+    def __init__(self, buckets, counts=None, sum=0.0, count=0):
+        self.buckets = buckets
+        self.counts = list(counts) if counts is not None else [0] * (len(buckets) + 1)
+        self.sum = sum
+        self.count = count
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other['counts']):
+            self.counts[i] += count
+        self.sum += other['sum']
+        self.count += other['count']
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+
+class StageMetrics:
+    """
+    Counters and histograms of a single task. They are collected by the process (or thread) executing the task
+    and shipped once to the main process at the end of the task (see :func:`shaclapi.multiprocessing.runner.run_task`).
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.item_start = None
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(HISTOGRAMS[name][0])
+        histogram.observe(value)
+
+    def item_received(self):
+        self.item_start = time.perf_counter()
+
+    def item_finished(self):
+        # The processing of an item ends as soon as the stage asks for the next one.
+        if self.item_start is not None:
+            self.observe('item_seconds', time.perf_counter() - self.item_start)
+            self.item_start = None
+
+    def to_dict(self):
+        self.item_finished()
+        return {'counters': self.counters, 'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()}}
+
+
+class NullMetrics:
+    """Used, if no task is executed by the current thread; all measurements are discarded."""
+
+    def count(self, name, value=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+_local = threading.local()
+
+
+def current():
+    """Returns the metrics of the task executed by the current thread."""
+    return getattr(_local, 'metrics', None) or NULL_METRICS
+
+
+def activate(stage_metrics):
+    """Sets the metrics of the task executed by the current thread (None after the task)."""
+    _local.metrics = stage_metrics
+
+
+class MeteredReceiver:
+    """Receiving part of a channel, which counts the received items and measures the processing time per item."""
+
+    def __init__(self, receiver, stage_metrics):
+        self.receiver = receiver
+        self.stage_metrics = stage_metrics
+
+    def get(self, *args, **kwargs):
+        self.stage_metrics.item_finished()
+        item = self.receiver.get(*args, **kwargs)
+        if item != 'EOF':
+            self.stage_metrics.count('items_in')
+            self.stage_metrics.item_received()
+        return item
+
+    def __getattr__(self, name):
+        return getattr(self.receiver, name)
+
+
+class MeteredSender:
+    """Sending part of a channel, which counts the sent items and samples the number of items in the queue."""
+
+    def __init__(self, sender, stage_metrics):
+        self.sender = sender
+        self.stage_metrics = stage_metrics
+        self.can_sample = hasattr(sender, 'qsize')
+        self.items = 0
+
+    def put(self, item, *args, **kwargs):
+        self.sender.put(item, *args, **kwargs)
+        if item != 'EOF':
+            self.items += 1
+            self.stage_metrics.count('items_out')
+            if self.can_sample and self.items % QUEUE_DEPTH_SAMPLE_INTERVAL == 1:
+                try:
+                    self.stage_metrics.observe('queue_depth', self.sender.qsize())
+                except NotImplementedError:
+                    self.can_sample = False
+
+    def __getattr__(self, name):
+        return getattr(self.sender, name)
+
+
+def summary(stage_metrics, stage_times=None):
+    """
+    Returns a compact JSON serializable summary of the metrics of a request per stage:
+    the counters, the number, total and mean of the observations of each histogram and the execution time of the stage.
+    """
+    stage_times = stage_times or {}
+    result = {}
+    for stage in sorted(set(stage_metrics) | set(stage_times)):
+        metrics = stage_metrics.get(stage, {'counters': {}, 'histograms': {}})
+        entry = dict(metrics['counters'])
+        for name, histogram in metrics['histograms'].items():
+            entry[name] = {'count': histogram['count'], 'sum': histogram['sum'],
+                           'mean': histogram['sum'] / histogram['count'] if histogram['count'] else None}
+        entry['seconds'] = stage_times.get(stage)
+        result[stage] = entry
+    return result
+
+
+class MetricsRegistry:
+    """
+    Aggregates the metrics of all requests in the main process and renders them in the Prometheus text format.
+    """
+
+    def __init__(self, prefix='shaclapi'):
+        self.prefix = prefix
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.lock = threading.Lock()
+
+    def add_request(self, status, seconds, stage_metrics, stage_times):
+        """Adds the metrics of a finished request; stage_metrics maps each stage to :meth:`StageMetrics.to_dict`."""
+        with self.lock:
+            self._count('requests', (('status', status), ))
+            self._observe('request_seconds', (), seconds)
+            for stage, metrics in stage_metrics.items():
+                labels = (('stage', stage), )
+                for name, value in metrics['counters'].items():
+                    self._count(name, labels, value)
+                for name, histogram in metrics['histograms'].items():
+                    self._histogram(name, labels).merge(histogram)
+            for stage, stage_seconds in stage_times.items():
+                if stage_seconds is not None:
+                    self._observe('stage_seconds', (('stage', stage), ), stage_seconds)
+
+    def _count(self, name, labels, value=1):
+        self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def _histogram(self, name, labels):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(HISTOGRAMS[name][0])
+        return histogram
+
+    def _observe(self, name, labels, value):
+        self._histogram(name, labels).observe(value)
+
+    def prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                metric = '{}_{}_total'.format(self.prefix, name)
+                lines.append('# HELP {} {}'.format(metric, COUNTERS[name]))
+                lines.append('# TYPE {} counter'.format(metric))
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append('{}{} {}'.format(metric, _labels(labels), value))
+            for name in sorted({name for name, _ in self.histograms}):
+                metric = '{}_{}'.format(self.prefix, name)
+                lines.append('# HELP {} {}'.format(metric, HISTOGRAMS[name][1]))
+                lines.append('# TYPE {} histogram'.format(metric))
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda entry: entry[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(metric, _labels(labels + (('le', str(bound)), )), cumulative))
+                    lines.append('{}_sum{} {}'.format(metric, _labels(labels), histogram.sum))
+                    lines.append('{}_count{} {}'.format(metric, _labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+METRICS = MetricsRegistry()
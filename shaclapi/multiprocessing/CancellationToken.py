@@ -0,0 +1,34 @@
+import time
+
+
+class RequestCancelled(Exception):
+    """
+    Raised inside a task to stop its execution, after the request has been cancelled.
+    """
+    pass
+
+
+class CancellationToken:
+    """
+    Token shared by all tasks of a request, which allows to cancel the request cooperatively.
+    The tasks check the token in their loops and stop processing as soon as the request is cancelled.
+    The underlying event is a manager object; to keep the checks cheap, it is queried at most every check_interval seconds.
+    """
+
+    def __init__(self, event, check_interval=0.05):
+        self.event = event
+        self.check_interval = check_interval
+        self.cancelled = False
+        self.last_check = 0
+
+    def cancel(self):
+        self.cancelled = True
+        self.event.set()
+
+    def is_cancelled(self):
+        if not self.cancelled:
+            now = time.monotonic()
+            if now - self.last_check >= self.check_interval:
+                self.last_check = now
+                self.cancelled = self.event.is_set()
+        return self.cancelled
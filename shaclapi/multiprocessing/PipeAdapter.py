@@ -1,3 +1,5 @@
+import queue
+import time
 from multiprocessing import Pipe
 from queue import Empty
 
@@ -59,7 +61,67 @@ class PipeAdapter:
 
 
 class QueueAdapter:
-    def __init__(self, context):
-        queue = context.Queue()
+    """
+    Uses the same queue as sender and receiver. If maxsize is greater than 0, put blocks while the queue is full.
+    """
+    def __init__(self, context, maxsize=0):
+        queue = context.Queue(maxsize)
         self.sender = queue
         self.receiver = queue
+
+
+class ClosableQueue(queue.Queue):
+    """
+    Queue of the in-process runners (see InProcessRunner), which can be closed to release the threads blocked on it:
+    after the queue is closed, put discards the items and get returns 'EOF' as soon as the queue is empty.
+    A thread receiving from more than one queue can register an event with notify_on_put, which is set whenever an item is put.
+    """
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.closed = False
+        self.events = []
+
+    def notify_on_put(self, event):
+        with self.mutex:
+            self.events.append(event)
+
+    def close(self):
+        with self.mutex:
+            self.closed = True
+            self.not_full.notify_all()
+            self.not_empty.notify_all()
+            events = list(self.events)
+        for event in events:
+            event.set()
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if self.maxsize > 0:
+                deadline = time.monotonic() + timeout if timeout is not None else None
+                while self._qsize() >= self.maxsize and not self.closed:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if not block or (remaining is not None and remaining <= 0):
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+            if self.closed:
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            events = list(self.events)
+        for event in events:
+            event.set()
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            while not self._qsize():
+                if self.closed:
+                    return 'EOF'
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if not block or (remaining is not None and remaining <= 0):
+                    raise Empty
+                self.not_empty.wait(remaining)
+            item = self._get()
+            self.not_full.notify()
+            return item
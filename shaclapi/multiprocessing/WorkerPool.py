@@ -0,0 +1,140 @@
+import atexit
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """
+    A pool of persistent worker processes executing tasks of the same function.
+
+    The workers are started with the spawn context when they are needed first and are reused by later tasks, hence, starting the
+    interpreter and importing the shaclAPI is only paid once per worker. Spawning (instead of forking) is safe in multithreaded processes,
+    e.g., if the pipeline is executed in threads of the API process (see fused_pipeline in :py:mod:`shaclapi.config`).
+
+    The function is called as function(result_queue, *task) in the worker; it needs to put 'EOF' into the result_queue when it is done
+    and should report exceptions as {'exception': ...}.
+    """
+
+    def __init__(self, function, max_idle_workers=16):
+        self.context = mp.get_context('spawn')
+        self.function = function
+        self.max_idle_workers = max_idle_workers
+        self.idle_workers = []
+        self.lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def execute(self, tasks):
+        """
+        Executes each task (a tuple of arguments) in its own worker and yields the items put into the result queues by all of them
+        until each task is done. If the generator is closed before (e.g., because the request was cancelled), the workers still
+        executing a task are terminated instead of being reused.
+        """
+        workers = [self._acquire() for _ in tasks]
+        results = queue.Queue()
+        stopped = threading.Event()
+        threads = []
+        for worker, task in zip(workers, tasks):
+            worker.start_task(task)
+            thread = threading.Thread(target=worker.forward, args=(results, stopped), name='forward_' + self.function.__name__, daemon=True)
+            thread.start()
+            threads.append(thread)
+        try:
+            finished_tasks = 0
+            while finished_tasks < len(tasks):
+                item = results.get()
+                if item == 'EOF':
+                    finished_tasks += 1
+                else:
+                    yield item
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+            for worker in workers:
+                self._release(worker)
+
+    def shutdown(self):
+        with self.lock:
+            workers, self.idle_workers = self.idle_workers, []
+        for worker in workers:
+            worker.stop()
+
+    def _acquire(self):
+        with self.lock:
+            while self.idle_workers:
+                worker = self.idle_workers.pop()
+                if worker.process.is_alive():
+                    return worker
+        logger.info('Starting a worker process for {}'.format(self.function.__name__))
+        return _Worker(self.context, self.function)
+
+    def _release(self, worker):
+        if worker.busy or not worker.process.is_alive():
+            worker.terminate()
+            return
+        with self.lock:
+            if len(self.idle_workers) < self.max_idle_workers:
+                self.idle_workers.append(worker)
+                return
+        worker.stop()
+
+
+class _Worker:
+    def __init__(self, context, function):
+        self.task_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.process = context.Process(target=_work, args=(self.task_queue, self.result_queue, function), name=function.__name__, daemon=True)
+        self.process.start()
+        self.busy = False
+
+    def start_task(self, task):
+        self.busy = True
+        self.task_queue.put(task)
+
+    def forward(self, results, stopped):
+        """Forwards the items of the current task to results up to its 'EOF' (or until stopped is set)."""
+        while not stopped.is_set():
+            try:
+                item = self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    results.put({'exception': 'The worker process {} exited with {}'.format(self.process.pid, self.process.exitcode)})
+                    results.put('EOF')
+                    return
+                continue
+            if item == 'EOF':
+                self.busy = False
+            results.put(item)
+            if item == 'EOF':
+                return
+
+    def stop(self):
+        self.task_queue.put(None)
+        self.process.join(timeout=1)
+        self.terminate()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.task_queue.cancel_join_thread()
+        self.result_queue.cancel_join_thread()
+
+
+def _work(task_queue, result_queue, function):
+    parent = os.getppid()
+    while True:
+        try:
+            task = task_queue.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent:
+                return  # the process which started the worker is gone, e.g., its runner was restarted
+            continue
+        if task is None:
+            return
+        function(result_queue, *task)
@@ -9,20 +9,27 @@ The intermediate results are represented as queues.
 import json
 import logging
 import signal
+import threading
 from multiprocessing import Queue
 from os import remove
 from queue import Empty
 from tempfile import NamedTemporaryFile
-from time import time
+from time import sleep, time
 
+from shaclapi import metrics, tracing
 from .OperatorStructures import Record, RJTTail, FileDescriptor
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the next tuple, if the join is executed in a thread and both sources are blocked.
+NOTIFY_TIMEOUT = 0.1
+MIN_POLL_INTERVAL = 0.0005
+MAX_POLL_INTERVAL = 0.01
+
 
 class Xgoptional():
 
-    def __init__(self, vars_left, vars_right, memory_size):
+    def __init__(self, vars_left, vars_right, memory_size, result_filter=None):
         self.left_table = dict()
         self.right_table = dict()
         self.qresults = Queue()
@@ -46,6 +53,9 @@ class Xgoptional():
 
         self.leftcount = 0
         self.rightcount = 0
+
+        # Applied to each joined result before it is put into the output queue.
+        self.result_filter = result_filter
     
     def add_to_bag(self, item):
         try:
@@ -72,14 +82,14 @@ class Xgoptional():
     def instantiate(self, d):
         newvars_left = self.vars_left - set(d.keys())
         newvars_right = self.vars_right - set(d.keys())
-        return Xgoptional(newvars_left, newvars_right, self.memorySize)
+        return Xgoptional(newvars_left, newvars_right, self.memorySize, self.result_filter)
 
     def instantiateFilter(self, instantiated_vars, filter_str):
         newvars_left = self.vars_left - set(instantiated_vars)
         newvars_right = self.vars_right - set(instantiated_vars)
-        return Xgoptional(newvars_left, newvars_right, self.memorySize)
+        return Xgoptional(newvars_left, newvars_right, self.memorySize, self.result_filter)
 
-    def execute(self, left, right, out, processqueue=Queue()):
+    def execute(self, left, right, out, processqueue=Queue(), cancellation_token=None):
         # Executes the Xgoptional.
         self.left = left
         self.right = right
@@ -89,21 +99,39 @@ class Xgoptional():
         tuple1 = None
         tuple2 = None
 
-        # Create alarm to go to stage 2.
-        signal.signal(signal.SIGALRM, self.stage2)
+        # Create alarm to go to stage 2. Signals can only be used in the main thread; when executed in a thread
+        # (see InProcessRunner), stage 2 is skipped and the loop waits for the next tuple if both sources are blocked.
+        # In-process queues announce new tuples with an event, other sources are polled with growing intervals.
+        self.use_alarm = threading.current_thread() is threading.main_thread()
+        if self.use_alarm:
+            signal.signal(signal.SIGALRM, self.stage2)
+        tuples_available = threading.Event()
+        sources_notify = all(hasattr(source, 'notify_on_put') for source in (left, right))
+        if sources_notify:
+            for source in (left, right):
+                source.notify_on_put(tuples_available)
+        poll_interval = MIN_POLL_INTERVAL
 
         # Get the tuples from the queues.
+        stage1_start = time()
         while not(tuple1 == 'EOF') or not(tuple2 == 'EOF'):
 
+            # Stop joining, if the request was cancelled.
+            if cancellation_token is not None and cancellation_token.is_cancelled():
+                self.cancel(tuple1, tuple2)
+                return
+            received = False
+
             # Try to get and process tuple from left queue.
             if not(tuple1 == 'EOF'):
 
                 try:
                     tuple1 = self.left.get(block=False)
+                    received = True
                     if not(tuple1 == 'EOF'):
                         self.add_to_bag(tuple1)
                     self.leftcount += 1
-                    signal.alarm(self.timeoutSecondStage)
+                    self.set_alarm(self.timeoutSecondStage)
                     self.stage1(tuple1, self.left_table, self.right_table, self.vars_right)
                     self.memory_right += 1
                     # print('bag after stage 1:', self.bag)
@@ -121,8 +149,9 @@ class Xgoptional():
             if not(tuple2 == 'EOF'):  # Try to get and process tuple from right queue.
                 try:
                     tuple2 = self.right.get(block=False)
+                    received = True
                     self.rightcount += 1
-                    signal.alarm(self.timeoutSecondStage)
+                    self.set_alarm(self.timeoutSecondStage)
                     self.stage1(tuple2, self.right_table, self.left_table, self.vars_left)
                     self.memory_left += 1
                 except Empty:
@@ -138,12 +167,42 @@ class Xgoptional():
                     pass
             if len(self.left_table) + len(self.right_table) >= self.memorySize:
                 self.flushRJT()
+            if received or self.use_alarm:
+                poll_interval = MIN_POLL_INTERVAL
+            elif sources_notify:
+                tuples_available.wait(NOTIFY_TIMEOUT)  # The timeout allows to check for the cancellation of the request
+                tuples_available.clear()
+            else:
+                sleep(poll_interval)
+                poll_interval = min(2 * poll_interval, MAX_POLL_INTERVAL)
 
         # Turn off alarm to stage 2.
-        signal.alarm(0)
+        self.set_alarm(0)
+        tracing.current().complete('stage 1', 'join', stage1_start, time(), left=self.leftcount, right=self.rightcount)
         # print('Perform the last probes.')
         self.stage3()
 
+    def set_alarm(self, seconds):
+        if self.use_alarm:
+            signal.alarm(seconds)
+
+    def cancel(self, tuple1, tuple2):
+        # Drop the join state, finish the output and discard the remaining tuples, such that the sources are not blocked.
+        self.set_alarm(0)
+        logger.info('Join cancelled; dropping the join state')
+        self.left_table.clear()
+        self.right_table.clear()
+        self.bag.clear()
+        for resource in self.fileDescriptor_left:
+            remove(self.fileDescriptor_left[resource].file.name)
+        for resource in self.fileDescriptor_right:
+            remove(self.fileDescriptor_right[resource].file.name)
+        self.qresults.put('EOF')
+        while tuple1 != 'EOF':
+            tuple1 = self.left.get()
+        while tuple2 != 'EOF':
+            tuple2 = self.right.get()
+
     def stage1(self, tuple, tuple_rjttable, other_rjttable, vars):
         # Stage 1: While one of the sources is sending data.
         # print('stage 1')
@@ -171,6 +230,7 @@ class Xgoptional():
                 tail = RJTTail(record, probeTS)
                 other_rjttable[resource] = tail
 
+    @tracing.traced('stage 2', 'join')
     def stage2(self, signum, frame):
         # print('Stage 2: When both sources become blocked.')
         self.sourcesBlocked = True
@@ -200,6 +260,7 @@ class Xgoptional():
         self.lastSecondStageTS = time()
         self.secondStagesTS.append(self.lastSecondStageTS)
 
+    @tracing.traced('stage 3', 'join')
     def stage3(self):
         # Stage 3: When both sources sent all the data.
         # print('stage 3')
@@ -255,6 +316,11 @@ class Xgoptional():
         self.qresults.put('EOF')
         return
 
+    def produce(self, res):
+        if self.result_filter is not None:
+            res = self.result_filter(res)
+        self.qresults.put(res)
+
     def probe(self, tuple, resource, rjttable, vars):
         probeTS = time()
         # If the resource is in table, produce results.
@@ -270,7 +336,7 @@ class Xgoptional():
                     if isinstance(record.tuple, dict):
                         res = record.tuple.copy()
                         res.update(tuple)
-                        self.qresults.put(res)
+                        self.produce(res)
 
                         # Delete tuple from bag.
                         self.remove_from_bag(record.tuple)
@@ -305,7 +371,7 @@ class Xgoptional():
                 res = rjt1.tuple.copy()
                 tuple2_evaluated = eval(tuple2)
                 res.update(tuple2_evaluated)
-                self.qresults.put(res)
+                self.produce(res)
 
                 # Delete tuple from bag.
                 self.remove_from_bag(rjt1.tuple)
@@ -327,6 +393,7 @@ class Xgoptional():
 
         return probed
 
+    @tracing.traced('flush', 'join')
     def flushRJT(self):
         # Flush an RJT to secondary memory.
 
@@ -375,6 +442,9 @@ class Xgoptional():
 
         # Delete resource from main memory.
         del table[resource_to_flush]
+        stage_metrics = metrics.current()
+        stage_metrics.count('join_spills')
+        stage_metrics.count('join_spilled_items', len(tail_to_flush.records))
 
     def getVictim(self, table):
         # Selects a victim from a partition in main memory to flush.
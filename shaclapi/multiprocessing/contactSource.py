@@ -1,13 +1,54 @@
 __author__ = 'Gabriela Montoya, Kemele M. Endris, Julian Gercke'  # modified version uses requests instead of urllib
 
+import codecs
+import json
 import logging
+import re
+import time
 
 import requests
 
+from shaclapi import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
+BINDINGS_PATTERN = re.compile(r'"bindings"\s*:\s*\[')
+
+
+class TargetInstanceChunker:
+    """
+    Collects the distinct instances of the target variables and passes them in chunks to the target_instance_queue.
+
+    Example:
+        Output target_instance_queue:
+            {'?x': [instance1, instance2, ...], '?y': [...]}
+    """
+
+    def __init__(self, target_instance_queue, target_vars, chunk_size):
+        self.target_instance_queue = target_instance_queue
+        self.target_vars = target_vars
+        self.chunk_size = chunk_size
+        self.seen = {var: set() for var in target_vars}
+        self.chunk = {var: [] for var in target_vars}
+        self.chunk_length = 0
 
-def contactSource(queue, endpoint, query, limit=-1):
+    def add(self, var, instance):
+        var = '?' + var.lower()
+        if var in self.seen and instance not in self.seen[var]:
+            self.seen[var].add(instance)
+            self.chunk[var].append(instance)
+            self.chunk_length += 1
+            if self.chunk_length >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self.chunk_length > 0:
+            self.target_instance_queue.put(self.chunk)
+            self.chunk = {var: [] for var in self.target_vars}
+            self.chunk_length = 0
+
+
+def contactSource(queue, endpoint, query, limit=-1, target_instance_queue=None, target_vars=None, chunk_size=1000, cancellation_token=None):
     """
     Normal contactSource implementation but queue is filled with an output, which is in a format which is joinable
     with validation results. Queue_copy contains the normal result but with an ID.
@@ -23,6 +64,9 @@ def contactSource(queue, endpoint, query, limit=-1):
 
         Output queue_copy:
             {'query_result': {'var1': instance1, 'var2': instance2, 'var3': instance3}, 'id': UNIQUE_RESULT_ID}
+
+    If a target_instance_queue is given, the distinct IRIs bound to the target_vars are additionally passed to it in chunks (see TargetInstanceChunker).
+    If the request is cancelled (see cancellation_token), the download from the endpoint is aborted.
     """
     # Contacts the datasource (i.e. real endpoint).
     # Every tuple in the answer is represented as Python dictionaries
@@ -48,24 +92,31 @@ def contactSource(queue, endpoint, query, limit=-1):
     host_port = server.split(':')
     port = 80 if len(host_port) == 1 else host_port[1]
     card = 0
-    if limit == -1:
-        b, card = contactSourceAux(referer, server, path, port, query, queue)
-    else:
-        # Contacts the datasource (i.e. real endpoint) incrementally,
-        # retrieving partial result sets combining the SPARQL sequence
-        # modifiers LIMIT and OFFSET.
-
-        # Set up the offset.
-        offset = 0
-
-        while True:
-            query_copy = query + ' LIMIT ' + str(limit) + ' OFFSET ' + str(offset)
-            b, cardinality = contactSourceAux(referer, server, path, port, query_copy, queue, offset)
-            card += cardinality
-            if cardinality < limit:
-                break
+    chunker = TargetInstanceChunker(target_instance_queue, target_vars, chunk_size) if target_instance_queue is not None else None
+    try:
+        if limit == -1:
+            b, card = contactSourceAux(referer, server, path, port, query, queue, chunker=chunker, cancellation_token=cancellation_token)
+        else:
+            # Contacts the datasource (i.e. real endpoint) incrementally,
+            # retrieving partial result sets combining the SPARQL sequence
+            # modifiers LIMIT and OFFSET.
+
+            # Set up the offset.
+            offset = 0
 
-            offset = offset + limit
+            while True:
+                query_copy = query + ' LIMIT ' + str(limit) + ' OFFSET ' + str(offset)
+                b, cardinality = contactSourceAux(referer, server, path, port, query_copy, queue, offset, chunker, cancellation_token)
+                card += cardinality
+                if cardinality < limit or (cancellation_token is not None and cancellation_token.is_cancelled()):
+                    break
+
+                offset = offset + limit
+        if chunker is not None:
+            chunker.flush()
+    finally:
+        if target_instance_queue is not None:
+            target_instance_queue.put('EOF')
 
     # Close the queue
     # queue.put('EOF')
@@ -73,7 +124,7 @@ def contactSource(queue, endpoint, query, limit=-1):
     return b
 
 
-def contactSourceAux(referer, server, path, port, query, queue, first_id=0):
+def contactSourceAux(referer, server, path, port, query, queue, first_id=0, chunker=None, cancellation_token=None):
     # Setting variables to return.
     b = None
     reslist = 0
@@ -86,43 +137,124 @@ def contactSourceAux(referer, server, path, port, query, queue, first_id=0):
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36',
                'Accept': js}
     try:
-        r = requests.get(referer, params=params, headers=headers)
-        res = r.text
-        res = res.replace('false', 'False')
-        res = res.replace('true', 'True')
-        res = eval(res)
+        # The response is downloaded in chunks and parsed while downloading: the next chunk is only read, if the queue
+        # accepted the bindings of the previous one. Hence, a full (bounded) queue stops the download from the endpoint.
+        stage_metrics = metrics.current()
+        tracer = tracing.current()
+        request_start = time.perf_counter()
+        with tracer.span('endpoint request', 'endpoint', endpoint=referer):
+            r = requests.get(referer, params=params, headers=headers, stream=True)
+        stage_metrics.observe('endpoint_request_seconds', time.perf_counter() - request_start)
+        download_start = time.time()
+        stage_metrics.count('endpoint_requests')
+        res = {}
         reslist = 0
-        if type(res) == dict:
-            b = res.get('boolean', None)
-            if 'results' in res:
-                # print 'raw results from endpoint', res
-                id = first_id
-                for x in res['results']['bindings']:
-                    for key, props in x.items():
-                        # Handle typed-literals and language tags
-                        suffix = ''
-                        if props['type'] == 'typed-literal':
-                            if isinstance(props['datatype'], bytes):
-                                suffix = '^^<' + props['datatype'].decode('utf-8') + '>'
-                            else:
-                                suffix = '^^<' + props['datatype'] + '>'
-                        elif 'xml:lang' in props:
-                            suffix = '@' + props['xml:lang']
-                        try:
-                            if isinstance(props['value'], bytes):
-                                x[key] = props['value'].decode('utf-8') + suffix
-                            else:
-                                x[key] = props['value'] + suffix
-                        except:
-                            x[key] = props['value'] + suffix
-                        queue.put({'var': key, 'instance': x[key], 'id': id})
-                    logger.debug({'query_result': x, 'id': id})
-                    id = id + 1
-                    reslist += 1
-            else:
-                logger.warning('the source ' + str(server) + ' answered in ' + res.getheader('content-type') +
-                               ' format, instead of the JSON format required, then that answer will be ignored')
+        id = first_id
+        for x in iter_bindings(_count_bytes(r.iter_content(chunk_size=65536), stage_metrics), r.encoding or 'utf-8', res):
+            if cancellation_token is not None and cancellation_token.is_cancelled():
+                break
+            for key, props in x.items():
+                # Handle typed-literals and language tags
+                suffix = ''
+                if props['type'] == 'typed-literal':
+                    if isinstance(props['datatype'], bytes):
+                        suffix = '^^<' + props['datatype'].decode('utf-8') + '>'
+                    else:
+                        suffix = '^^<' + props['datatype'] + '>'
+                elif 'xml:lang' in props:
+                    suffix = '@' + props['xml:lang']
+                try:
+                    if isinstance(props['value'], bytes):
+                        x[key] = props['value'].decode('utf-8') + suffix
+                    else:
+                        x[key] = props['value'] + suffix
+                except:
+                    x[key] = props['value'] + suffix
+                queue.put({'var': key, 'instance': x[key], 'id': id})
+                if chunker is not None and props['type'] == 'uri':
+                    chunker.add(key, x[key])
+            logger.debug({'query_result': x, 'id': id})
+            id = id + 1
+            reslist += 1
+        r.close()
+        tracer.complete('endpoint download', 'endpoint', download_start, time.time(), endpoint=referer, results=reslist)
+        if cancellation_token is not None and cancellation_token.is_cancelled():
+            logger.info('Download from {} cancelled'.format(referer))
+            return b, reslist
+        b = res.get('boolean', None)
+        if 'results' not in res:
+            logger.warning('the source ' + str(server) + ' answered in ' + r.headers.get('content-type', 'an unknown') +
+                           ' format, instead of the JSON format required, then that answer will be ignored')
     except Exception as e:
         raise Exception('Exception while sending request to ', referer, 'msg:', e)
 
     return b, reslist
+
+
+def _count_bytes(chunks, stage_metrics):
+    for chunk in chunks:
+        stage_metrics.count('endpoint_bytes', len(chunk))
+        yield chunk
+
+
+def iter_bindings(chunks, encoding='utf-8', response=None):
+    """
+    Parses a SPARQL JSON result incrementally and yields the bindings of results.bindings one after another.
+    The chunks (bytes) are only read as far as needed to yield the next binding, such that the memory needed is independent
+    of the size of the result and a slow consumer slows down the download.
+    If the result has no bindings (e.g. the result of an ASK query), the complete result is parsed.
+    The given response dictionary is updated with the parsed keys of the result apart from the bindings.
+    """
+    response = response if response is not None else {}
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    chunks = iter(chunks)
+    buffer = ''
+    start = None
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        start = BINDINGS_PATTERN.search(buffer)
+        if start is not None:
+            break
+    if start is None:
+        buffer += text_decoder.decode(b'', final=True)
+        if buffer.strip():
+            response.update(json.loads(buffer))
+        return
+    response['results'] = {'bindings': []}
+    position = start.end()
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                binding, position = decoder.raw_decode(buffer, position)
+                yield binding
+                continue
+            except json.JSONDecodeError:
+                pass  # The binding is not completely downloaded yet.
+        # Read the next chunk; the parsed part of the buffer is dropped.
+        buffer = buffer[position:]
+        position = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError('Incomplete SPARQL result: {}'.format(buffer[:100]))
+        buffer += text_decoder.decode(chunk)
+
+
+def count_results(endpoint, query):
+    """
+    Returns the number of results of the query at the endpoint (using a COUNT query, see :meth:`shaclapi.query.Query.as_count_query`)
+    or None, if the endpoint could not answer the query.
+    """
+    js = 'application/sparql-results+json'
+    try:
+        r = requests.get(endpoint.replace('0.0.0.0', 'localhost'), params={'query': query.as_count_query().query_string, 'format': js},
+                         headers={'Accept': js}, timeout=10)
+        r.raise_for_status()
+        return int(r.json()['results']['bindings'][0]['count']['value'])
+    except Exception as e:
+        logger.warning('Could not estimate the number of results: {}'.format(e))
+        return None
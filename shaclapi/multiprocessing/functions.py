@@ -1,12 +1,23 @@
 import logging
-import time
+from contextlib import closing
 from enum import IntEnum
-from functools import reduce
+from functools import partial, reduce
 
 from rdflib import Namespace, URIRef
 
+from shaclapi import tracing
+from shaclapi.aggregation import ValidationCounts
+from shaclapi.answerTrace import AnswerTrace
+from shaclapi.config import Config
+from shaclapi.joinRecording import LEFT, RIGHT, JoinInputRecorder
+from shaclapi.multiprocessing.CancellationToken import RequestCancelled
+from shaclapi.multiprocessing.contactSource import count_results
+from shaclapi.multiprocessing.WorkerPool import WorkerPool
 from shaclapi.multiprocessing.Xgoptional.Xgoptional import Xgoptional
+from shaclapi.query import Query
 from shaclapi.reduction import prepare_validation
+from shaclapi.reduction.Reduction import Reduction, shard_target_query
+from shaclapi.reduction.ValidationResultTransmitter import ForwardingResultTransmitter, ValidationResultTransmitter
 from shaclapi.triple import TripleE
 
 
@@ -19,7 +30,16 @@ class ValReport(IntEnum):
 logger = logging.getLogger(__name__)
 
 
-def mp_post_processing(joined_result_queue, output_queue, timestamp_queue, variables, target_shape, target_var, collect_all_results = False):
+def drain(queue, item=None):
+    """
+    Discards the remaining items of the queue until 'EOF' is received, such that the sender is never blocked.
+    """
+    while item != 'EOF':
+        item = queue.get()
+
+
+def mp_post_processing(joined_result_queue, output_queue, variables, target_shape, target_var, collect_all_results = False, aggregate=False, group_by=None,
+                       all_target_shapes=False, cancellation_token=None):
     """
     The post-processing collects all the bindings belonging to a SPARQL result mapping.
 
@@ -30,15 +50,45 @@ def mp_post_processing(joined_result_queue, output_queue, timestamp_queue, varia
 
         Output:
             [{'instance': 'http://example.org/testGraph3b#nodeA_0', 'validation': ('ShapeA', True, 'unbound'), 'var': 'x'}, {'var': 'lit', 'instance': 'literal'}], ...
+
+    Mappings discarded by the join ({'id': ..., 'discard': True}, see filter_result_polarity) are never put into the output queue.
+    If all_target_shapes is True, a mapping is only finished once the validation results of all target shapes of its variables arrived,
+    such that a discard caused by any of them is not received after the mapping was put into the output queue.
+
+    If aggregate is True, the validation results of the targets in the finished mappings are only counted (see :class:`shaclapi.aggregation.ValidationCounts`)
+    and a single summary {'summary': ...} is put into the output queue at the end.
     """
     if 'UNDEF' in target_shape and not collect_all_results:
         collect_all_results = True
         logger.warning('Running in blocking mode as the target variable could not be identified!')
 
+    if aggregate:
+        counts = ValidationCounts(group_by, target_shape)
+
+        def put_result(result):
+            counts.add_mapping(result)
+    else:
+        def put_result(result):
+            output_queue.put({'result': result})
+
+    # The bindings a mapping waits for; with all_target_shapes one per target shape of a variable instead of the variable.
+    if all_target_shapes:
+        awaited_bindings = [var for var in variables if var not in target_shape.keys()] \
+            + [(var, shape) for var in variables if var in target_shape.keys() for shape in target_shape[var]]
+    else:
+        awaited_bindings = variables.copy()
+
     table = {}
     finished_set = set()
     item = joined_result_queue.get()
     while item != 'EOF':
+        if cancellation_token is not None and cancellation_token.is_cancelled():
+            logger.info('Post-processing cancelled; dropping {} incomplete results'.format(len(table)))
+            drain(joined_result_queue, item)
+            if aggregate:
+                output_queue.put({'summary': counts.summary()})
+            return
+
         item_id = item['id']
         del item['id']
 
@@ -47,9 +97,15 @@ def mp_post_processing(joined_result_queue, output_queue, timestamp_queue, varia
             item = joined_result_queue.get()
             continue
 
+        if item.get('discard'):
+            table.pop(item_id, None)
+            finished_set.add(item_id)
+            item = joined_result_queue.get()
+            continue
+
         # Initialize Hashtable Entry if necessary
         if item_id not in table:
-            table[item_id] = {'result': [], 'need': variables.copy()}  # TODO: Deal with multiple targets for one variable
+            table[item_id] = {'result': [], 'need': awaited_bindings.copy()}
         
         try:
             if collect_all_results:
@@ -62,7 +118,13 @@ def mp_post_processing(joined_result_queue, output_queue, timestamp_queue, varia
                 #  - a binding with a validation result matching the target_shape
                 binding_var = '?' + item['var']
                 if item['validation'] is None or (binding_var not in target_shape.keys() or item['validation'][0] in target_shape[binding_var]):
-                    table[item_id]['need'].remove('?' + item['var'])
+                    if all_target_shapes and binding_var in target_shape.keys() and item['validation'] is not None:
+                        table[item_id]['need'].remove((binding_var, item['validation'][0]))
+                    elif all_target_shapes and binding_var in target_shape.keys():
+                        # Without validation results (produced by XGoptional), no other result of the variable arrives
+                        table[item_id]['need'] = [binding for binding in table[item_id]['need'] if not (isinstance(binding, tuple) and binding[0] == binding_var)]
+                    else:
+                        table[item_id]['need'].remove(binding_var)
                     table[item_id]['result'].append(item)
                     logger.debug(f'New Mapping matching target shape: {item}')
                 else:
@@ -78,36 +140,213 @@ def mp_post_processing(joined_result_queue, output_queue, timestamp_queue, varia
             final_result_item = table[item_id]
             del table[item_id]
             finished_set.add(item_id)
-            output_queue.put({'result': final_result_item['result']})
-            timestamp_queue.put({'timestamp': time.time()})
+            put_result(final_result_item['result'])
             logger.debug('Finished Result {}'.format(final_result_item['result']))
 
         item = joined_result_queue.get()
     
     if collect_all_results:
         for mapping in table.values():
-            output_queue.put({'result': mapping['result']})
-            timestamp_queue.put({'timestamp': time.time()})
+            put_result(mapping['result'])
             logger.debug('Finished Result {}'.format(mapping['result']))
 
+    if aggregate:
+        output_queue.put({'summary': counts.summary()})
 
-def mp_validate(out_queue, config, query, result_transmitter):
+
+def mp_validate(out_queue, config, query, result_transmitter, target_instance_queue=None, cancellation_token=None):
     """
     Function to be executed with Runner to run the validation process of the backend.
+    If a target_instance_queue is given, the instances of the target shapes are received in chunks from the contactSource.
+    The validation is stopped by the result_transmitter as soon as the request is cancelled.
     """
+    try:
+        validate(config, query, result_transmitter, target_instance_queue)
+    except RequestCancelled:
+        logger.info('Validation cancelled')
+        result_transmitter.done()
+        if target_instance_queue is not None:
+            drain(target_instance_queue)
+
+
+def validate(config, query, result_transmitter, target_instance_queue=None):
+    if target_instance_queue is not None:
+        validate_target_instances(target_instance_queue, config, query, result_transmitter)
+        return
     schema = prepare_validation(config, query, result_transmitter)
+    if config.validate_components_in_parallel and config.prune_shape_network \
+            and not config.start_shape_for_validation and 'UNDEF' not in config.target_shape:
+        target_groups = schema.shapeParser.reachability_index.independent_target_groups(schema.target_shape_list)
+        if len(target_groups) > 1:
+            logger.info('Validating {} independent groups of target shapes in parallel: {}'.format(len(target_groups), target_groups))
+            validate_in_parallel([component_config(config, target_group) for target_group in target_groups], query, result_transmitter)
+            return
+    if config.validation_shards > 1 and config.validation_shard is None and len(schema.target_shape_list) == 1:
+        target_shape = schema.target_shape_list[0]
+        if schema.shapeParser.shape_get_target_query(schema.shapesDict[target_shape]) is not None:
+            shards = shards_with_targets(config, schema.shapeParser, schema.shapesDict[target_shape])
+            logger.info('Validating the instances of {} in {} shards, {} of them with targets'.format(target_shape, config.validation_shards, len(shards)))
+            validate_in_parallel([shard_config(config, shard) for shard in shards], query, result_transmitter,
+                                 deduplicate_shapes=set(schema.shapesDict.keys()) - {target_shape})
+            return
+        logger.warning('Validation is not sharded, since the target shape {} has no target query'.format(target_shape))
     _ = schema.validate(config.start_with_target_shape)  # Validate Schema --> validation results will be put into the out_queue during validation
 
 
-def mp_xjoin(left, right, out_queue, config):
+def validate_target_instances(target_instance_queue, config, query, result_transmitter):
+    """
+    Validates each chunk of target instances received from the target_instance_queue with the target queries restricted to the chunk.
+    The shape schema is prepared once with the first chunk, which also validates all targets of the other shapes. For the following
+    chunks, the target queries of the other shapes are restricted to the instances reachable from the chunk, since only these are needed
+    to validate the chunk. Validation results of the other shapes are only forwarded once to the result_transmitter.
+    """
+    chunk = target_instance_queue.get()
+    if chunk == 'EOF':
+        result_transmitter.done()
+        return
+
+    forwarding_transmitter = ForwardingResultTransmitter(result_transmitter)
+    chunk_config = Config(dict(config.config_dict))
+    chunk_config.target_instances = chunk
+    schema = prepare_validation(chunk_config, query, forwarding_transmitter)
+    parser = schema.shapeParser
+    restricted_targets = parser.reachability_index.independent_targets(schema.target_shape_list)
+    if not restricted_targets:
+        logger.warning('Target instances are not passed to the validation, since all target shapes are reachable from each other!')
+        prepare_validation(config, query, result_transmitter).validate(config.start_with_target_shape)
+        drain(target_instance_queue)
+        return
+
+    forwarding_transmitter.deduplicate_shapes = set(schema.shapesDict.keys()) - set(restricted_targets)
+    reducer = Reduction(parser, parser.reachability_index)
+    while chunk != 'EOF':
+        logger.debug('Validating chunk of {} target instances'.format(sum(len(instances) for instances in chunk.values())))
+        schema.validate(config.start_with_target_shape)
+        chunk = target_instance_queue.get()
+        if chunk != 'EOF':
+            reducer.restrict_target_query_to_instances(schema.shapes, parser.targetShapes, schema.target_shape_list, chunk,
+                                                       config.merge_old_target_query, parser.target_queries)
+            reducer.restrict_target_query_to_reachable_instances(schema.shapes, restricted_targets, chunk, parser.target_queries)
+    result_transmitter.done()
+
+
+def component_config(config, target_group):
+    """
+    Returns a copy of the config restricted to the target shapes in target_group.
+    """
+    config = Config(dict(config.config_dict))
+    config.target_shape = {
+        var: [shape for shape in shapes if shape in target_group]
+        for var, shapes in config.target_shape.items() if any(shape in target_group for shape in shapes)
+    }
+    return config
+
+
+def shard_config(config, shard):
+    """
+    Returns a copy of the config restricted to the given shard of the target shape instances.
+    """
+    config = Config(dict(config.config_dict))
+    config.validation_shard = shard
+    return config
+
+
+def shards_with_targets(config, parser, shape):
+    """
+    Returns the shards of the instances of the shape, which contain at least one target according to a COUNT query sent to the endpoint.
+    Empty shards are skipped, since the backends cannot handle the empty answers of some endpoints to their queries, e.g., rdflib
+    answers aggregate queries without any match with a single row without bindings. Shards, which could not be counted, are kept.
+    """
+    target_query = parser.shape_get_target_query(shape)
+    shards = []
+    for shard in range(config.validation_shards):
+        shard_query = Query(parser.shape_get_prefixes(shape) + shard_target_query(target_query, shard, config.validation_shards))
+        if count_results(config.external_endpoint, shard_query) != 0:
+            shards.append(shard)
+        else:
+            logger.debug('Shard {}/{} has no targets'.format(shard, config.validation_shards))
+    return shards
+
+
+def validate_in_parallel(configs, query, result_transmitter, deduplicate_shapes=None):
+    """
+    Runs the validation for each of the configs in a worker process of VALIDATION_WORKERS. The validation results of all workers are
+    forwarded to the result_transmitter. Validation results of shapes in deduplicate_shapes, which may be validated
+    by more than one worker, are only forwarded once.
+    """
+    forwarding_transmitter = ForwardingResultTransmitter(result_transmitter, deduplicate_shapes)
+    query_string = query.query_string if query is not None else None
+    exceptions = []
+    # If the request is cancelled, closing the results terminates the workers, which are still validating.
+    with closing(VALIDATION_WORKERS.execute([(partition_config, query_string) for partition_config in configs])) as results:
+        for item in results:
+            if 'exception' in item:
+                exceptions.append(item['exception'])
+            else:
+                forwarding_transmitter.send(item['instance'], *item['validation'])
+    result_transmitter.done()
+    if exceptions:
+        raise Exception('Validation of a partition failed: ' + '; '.join(exceptions))
+
+
+def mp_validate_partition(partition_queue, config, query_string):
+    """
+    Validates the reduced shape schema of the target shapes (or shard) given in config; executed in a worker process of VALIDATION_WORKERS.
+    """
+    result_transmitter = ValidationResultTransmitter(output_queue=partition_queue)
+    try:
+        schema = prepare_validation(config, Query(query_string) if query_string is not None else None, result_transmitter)
+        schema.validate(config.start_with_target_shape)
+    except Exception as e:
+        logger.exception(e)
+        partition_queue.put({'exception': repr(e)})
+    finally:
+        partition_queue.put('EOF')
+
+
+# Worker processes validating the partitions of validate_in_parallel; they are started once per process and reused by later requests.
+VALIDATION_WORKERS = WorkerPool(mp_validate_partition)
+
+
+def mp_xjoin(left, right, out_queue, config, recording_file=None, cancellation_token=None):
     """
     Function to be executed with Runner to join the instances of the left with the right queue.
+    If a recording_file is given, the items of both queues are recorded to it (see :class:`shaclapi.joinRecording.JoinInputRecorder`).
+    """
+    if config.result_polarity is not None:
+        result_filter = partial(filter_result_polarity, config.target_shape, config.result_polarity)
+    else:
+        result_filter = None
+    recorder = JoinInputRecorder(recording_file) if recording_file is not None else None
+    if recorder is not None:
+        left, right = recorder.receiver(left, LEFT), recorder.receiver(right, RIGHT)
+    join_instance = Xgoptional(['var', 'instance', 'id'], ['instance', 'validation'], config.memory_size, result_filter)
+    try:
+        join_instance.execute(left, right, out_queue, cancellation_token=cancellation_token)
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+
+def filter_result_polarity(target_shape, polarity, result):
     """
-    join_instance = Xgoptional(['var', 'instance', 'id'], ['instance', 'validation'], config.memory_size)
-    join_instance.execute(left, right, out_queue)
+    Returns the joined result, unless the binding got a validation result of one of the target shapes of its variable with the unwanted polarity.
+    In that case, the whole mapping is discarded, which is signaled to the post-processing with {'id': ..., 'discard': True}.
+    """
+    validation = result.get('validation')
+    if validation and validation[ValReport.IS_VALID] != polarity and validation[ValReport.SHAPE] in target_shape.get('?' + result['var'], []):
+        return {'id': result['id'], 'discard': True}
+    return result
 
 
-def mp_output_completion(input_queue, output_queue, query, target_shape, is_test_output=False):
+def mp_output_completion(input_queue, output_queue, query, target_shape, is_test_output=False, max_results=None, trace_queue=None, cancellation_token=None):
+    """
+    Transforms the collected results into the output format.
+    As soon as max_results results are produced, the request is cancelled and the remaining results are discarded.
+    If the request is cancelled otherwise, the results produced so far are kept.
+    Summaries of the output format 'aggregate' are passed on unchanged.
+    If a trace_queue is given, the time of each answer is recorded (see :class:`shaclapi.answerTrace.AnswerTrace`) and the trace is put into it at the end.
+    """
     target_shape_list = reduce(lambda a, b: a + b, target_shape.values())
     t_path = Namespace('//travshacl_path#')
     query.namespace_manager.bind('ts', t_path)
@@ -117,9 +356,23 @@ def mp_output_completion(input_queue, output_queue, query, target_shape, is_test
     query_triples = query.get_triples(replace_prefixes=False)
 
     test_output = {'validTargets': set(), 'invalidTargets': set(), 'advancedValid': set(), 'advancedInvalid': set()}
-        
+
+    answer_trace = AnswerTrace() if trace_queue is not None else None
+    tracer = tracing.current()
+    number_of_results = 0
     result = input_queue.get()
     while result != 'EOF':
+        if 'summary' in result:
+            output_queue.put(result['summary'])
+            result = input_queue.get()
+            continue
+        if cancellation_token is not None and cancellation_token.is_cancelled():
+            logger.info('Output completion cancelled after {} results'.format(number_of_results))
+            drain(input_queue, result)
+            break
+        number_of_results += 1
+        if number_of_results == 1:
+            tracer.instant('first answer', 'output')
         logger.debug('Result:' + str(result))
         query_result = result['result']
         
@@ -163,6 +416,15 @@ def mp_output_completion(input_queue, output_queue, query, target_shape, is_test
                                 test_output['advancedValid'].add((binding['instance'], binding['validation'][ValReport.REASON]))
                             else:
                                 test_output['advancedInvalid'].add((binding['instance'], binding['validation'][ValReport.REASON]))
+        if answer_trace is not None:
+            answer_trace.record()
+        if max_results is not None and number_of_results >= max_results:
+            logger.info('Produced {} results; cancelling the request'.format(number_of_results))
+            tracer.instant('max results reached', 'output', results=number_of_results)
+            if cancellation_token is not None:
+                cancellation_token.cancel()
+            drain(input_queue)
+            break
         result = input_queue.get()
 
     if is_test_output:
@@ -171,3 +433,6 @@ def mp_output_completion(input_queue, output_queue, query, target_shape, is_test
         test_output['advancedValid'] = list(test_output['advancedValid'])
         test_output['advancedInvalid'] = list(test_output['advancedInvalid'])
         output_queue.put(test_output)
+
+    if answer_trace is not None:
+        answer_trace.ship(trace_queue)
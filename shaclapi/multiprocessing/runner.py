@@ -1,13 +1,24 @@
 import atexit
 import logging
 import multiprocessing as mp
+import queue
+import threading
 import time
+from types import SimpleNamespace
 
-from shaclapi.multiprocessing.PipeAdapter import PipeAdapter, QueueAdapter
+from shaclapi import metrics, tracing
+from shaclapi.multiprocessing.PipeAdapter import ClosableQueue, PipeAdapter, QueueAdapter
+from shaclapi.memoryTracing import MemoryTracer
+from shaclapi.profiling import TaskProfiler
 from shaclapi.query import Query
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait for the thread of a task to stop after its channels were closed (see InProcessRunner.stop_task).
+STOP_TIMEOUT = 1
+
+IN_PROCESS_CONTEXT = SimpleNamespace(Queue=ClosableQueue)
+
 
 class Runner:
     """
@@ -18,6 +29,9 @@ class Runner:
     - FIRST: in_queues (multiprocessing.Queue)
     - SECOND: out_queues (number_of_out_queues specified in constructor of Runner)
     - FINALLY: variable number of parameters needed for the task (These which also needed to be passed to new_task)
+
+    If a cancellation token is passed to new_task, f is called with the additional keyword argument cancellation_token.
+    The task_options passed to new_task turn on the instrumentation of the task (see run_task).
     """
     def __init__(self, function, number_of_out_queues=1):
         self.context = mp.get_context('spawn')
@@ -48,55 +62,184 @@ class Runner:
     def get_new_queue(self):
         return self.manager.Queue()
     
-    def get_new_out_queues(self, use_pipes):
+    def get_new_event(self):
+        return self.manager.Event()
+
+    def get_new_channel(self, use_pipes, capacity=0):
+        """
+        Returns a new channel (sender and receiver). A queue holds at most capacity items (unbounded if capacity is 0),
+        a pipe is bounded by the buffer of the operating system. In both cases, the sender is blocked while the channel is full.
+        """
+        if use_pipes:
+            return PipeAdapter()
+        else:
+            return QueueAdapter(self.manager, capacity)
+
+    def get_new_out_queues(self, use_pipes, capacity=0):
         out_queues = []
         for _ in range(self.number_of_out_queues):
-            if use_pipes:
-                out_queues += [PipeAdapter()]
-            else:
-                out_queues += [QueueAdapter(self.manager)]
+            out_queues += [self.get_new_channel(use_pipes, capacity)]
         out_queues = tuple(out_queues)
         return out_queues
 
-    def new_task(self, in_queues, out_queues, task_description, runner_stats_out_queue, wait_for_finish=False):
+    def new_task(self, in_queues, out_queues, task_description, runner_stats_out_queue, wait_for_finish=False, cancellation_token=None, task_options=None):
         if self.process and self.process_running:
             if wait_for_finish:
                 task_finished_recv, task_finished_send = self.context.Pipe()
-                self.task_queue.put((in_queues, out_queues, runner_stats_out_queue, task_description, task_finished_send))
+                self.task_queue.put((in_queues, out_queues, runner_stats_out_queue, task_description, task_finished_send, cancellation_token, task_options))
                 result = task_finished_recv.recv()
                 task_finished_send.close()
                 task_finished_recv.close()
                 return result
             else:
-                self.task_queue.put((in_queues, out_queues, runner_stats_out_queue, task_description, None))
+                self.task_queue.put((in_queues, out_queues, runner_stats_out_queue, task_description, None, cancellation_token, task_options))
         else:
             raise Exception('Start processes before using /multiprocessing')
 
 
+class InProcessRunner(Runner):
+    """
+    A runner executing each task in a new thread of the calling process instead of a separate process.
+    Its queues and channels are queue.Queue objects, hence, the data passed between the tasks is never pickled.
+    This avoids the overhead of the inter-process communication for small requests (see fused_pipeline in :py:mod:`shaclapi.config`).
+
+    The channels can be closed (see :class:`shaclapi.multiprocessing.PipeAdapter.ClosableQueue`), which allows to stop the task of a
+    cancelled request with stop_task. An exclusive runner executes at most one task at a time; it needs to be reserved before each task.
+    """
+    def __init__(self, function, number_of_out_queues=1, exclusive=False):
+        self.function = function
+        self.number_of_out_queues = number_of_out_queues
+        self.reservation = threading.Lock() if exclusive else None
+        self.tasks = {}  # cancellation token -> (thread, closable channels) of the running tasks
+        self.tasks_lock = threading.Lock()
+
+    def start_process(self):
+        pass
+
+    def stop_process(self):
+        pass
+
+    def get_new_queue(self):
+        return queue.Queue()
+
+    def get_new_event(self):
+        return threading.Event()
+
+    def get_new_channel(self, use_pipes, capacity=0):
+        return QueueAdapter(IN_PROCESS_CONTEXT, capacity)
+
+    def reserve(self, blocking=False):
+        """
+        Reserves an exclusive runner for the next task; returns False if the task of another request is still running (unless blocking).
+        The reservation is released as soon as the thread of the task finished.
+        """
+        return self.reservation is None or self.reservation.acquire(blocking=blocking)
+
+    def release(self):
+        """Releases the reservation of an exclusive runner, which is not used by a task (e.g., as the task could not be started)."""
+        if self.reservation is not None:
+            self.reservation.release()
+
+    def new_task(self, in_queues, out_queues, task_description, runner_stats_out_queue, wait_for_finish=False, cancellation_token=None, task_options=None):
+        channels = [channel for channel in (*in_queues, *out_queues, *task_description) if isinstance(channel, ClosableQueue)]
+        thread = threading.Thread(target=self._run_task, args=(in_queues, out_queues, runner_stats_out_queue, task_description, cancellation_token, task_options),
+                                  name=self.function.__name__, daemon=True)
+        if cancellation_token is not None:
+            with self.tasks_lock:
+                self.tasks[cancellation_token] = (thread, channels)
+        thread.start()
+        if wait_for_finish:
+            thread.join()
+            return 'Done'
+
+    def _run_task(self, in_queues, out_queues, runner_stats_out_queue, task_description, cancellation_token, task_options):
+        try:
+            run_task(self.function, in_queues, out_queues, runner_stats_out_queue, task_description, cancellation_token, task_options)
+        finally:
+            if cancellation_token is not None:
+                with self.tasks_lock:
+                    self.tasks.pop(cancellation_token, None)
+            self.release()
+
+    def stop_task(self, cancellation_token, timeout=STOP_TIMEOUT):
+        """
+        Stops the task of the cancelled request with the given cancellation token by closing its channels, which releases its thread,
+        if it is blocked by one of them. Returns whether the thread stopped within timeout seconds.
+        """
+        with self.tasks_lock:
+            task = self.tasks.get(cancellation_token)
+        if task is None:
+            return True
+        thread, channels = task
+        logger.warning('Task {} did not stop after the request was cancelled; closing its channels!'.format(self.function.__name__))
+        for channel in channels:
+            channel.close()
+        thread.join(timeout)
+        return not thread.is_alive()
+
+
 def mp_function(task_in_queue, function):
     speed_up_query = Query.prepare_query('PREFIX test1:<http://example.org/testGraph1#>\nSELECT DISTINCT ?x WHERE {\n?x a test1:classE.\n?x test1:has ?lit.\n}')
     speed_up_query.namespace_manager.namespaces()
     try:
         active_task = task_in_queue.get()
         while active_task != 'EOF':
-            in_queues, out_queues, runner_stats_out_queue, task_description, task_finished_send = active_task
-
-            # Now one can use logging as normal
-            logger.info(function.__name__ + ' received task!')
-            start_timestamp = time.time()
-            try:
-                function(*in_queues, *out_queues, *task_description)
-            except Exception as e:
-                runner_stats_out_queue.put({'topic': 'Exception', 'location': function.__name__})
-                logger.exception(e)
-            finally:
-                for queue in out_queues:
-                    queue.put('EOF')  # Writing EOF here allows global error handling
-                finished_timestamp = time.time()
-                runner_stats_out_queue.put({'topic': function.__name__, 'time': (start_timestamp, finished_timestamp)})
-                logger.info(function.__name__ + ' finished task; waiting for next one!')
-                if task_finished_send:
-                    task_finished_send.send('Done')
-                active_task = task_in_queue.get()
+            in_queues, out_queues, runner_stats_out_queue, task_description, task_finished_send, cancellation_token, task_options = active_task
+            run_task(function, in_queues, out_queues, runner_stats_out_queue, task_description, cancellation_token, task_options)
+            if task_finished_send:
+                task_finished_send.send('Done')
+            active_task = task_in_queue.get()
     except KeyboardInterrupt:
         pass
+
+
+def run_task(function, in_queues, out_queues, runner_stats_out_queue, task_description, cancellation_token=None, task_options=None):
+    """
+    Executes the function with the given queues and task description and reports its statistics to the runner_stats_out_queue.
+    task_options (dict) turn on the instrumentation of the task:
+
+    - profile: profiles the task (see :class:`shaclapi.profiling.TaskProfiler`)
+    - trace_memory: traces the memory used by the task (see :class:`shaclapi.memoryTracing.MemoryTracer`)
+    - trace: id of the request; records the spans of the task (see :class:`shaclapi.tracing.Tracer`)
+    """
+    task_kwargs = {'cancellation_token': cancellation_token} if cancellation_token is not None else {}
+    task_options = task_options or {}
+
+    # The metrics of the task are collected while the task is executed and shipped together with the other statistics.
+    stage_metrics = metrics.StageMetrics()
+    metrics.activate(stage_metrics)
+    metered_in_queues = tuple(metrics.MeteredReceiver(in_queue, stage_metrics) for in_queue in in_queues)
+    metered_out_queues = tuple(metrics.MeteredSender(out_queue, stage_metrics) for out_queue in out_queues)
+    tracer = tracing.Tracer(task_options['trace']) if task_options.get('trace') else None
+    tracing.activate(tracer)
+
+    # Now one can use logging as normal
+    logger.info(function.__name__ + ' received task!')
+    memory_tracer = MemoryTracer() if task_options.get('trace_memory') else None
+    if memory_tracer is not None:
+        memory_tracer.start()
+    profiler = TaskProfiler() if task_options.get('profile') else None
+    if profiler is not None:
+        profiler.start()
+    start_timestamp = time.time()
+    try:
+        function(*metered_in_queues, *metered_out_queues, *task_description, **task_kwargs)
+    except Exception as e:
+        runner_stats_out_queue.put({'topic': 'Exception', 'location': function.__name__})
+        logger.exception(e)
+    finally:
+        if profiler is not None:
+            runner_stats_out_queue.put({'topic': 'profile', 'stage': function.__name__, 'profile': profiler.stop()})
+        if memory_tracer is not None:
+            runner_stats_out_queue.put({'topic': 'memory', 'stage': function.__name__, 'memory': memory_tracer.stop()})
+        metrics.activate(None)
+        tracing.activate(None)
+        for out_queue in out_queues:
+            out_queue.put('EOF')  # Writing EOF here allows global error handling
+        finished_timestamp = time.time()
+        runner_stats_out_queue.put({'topic': 'metrics', 'stage': function.__name__, 'metrics': stage_metrics.to_dict()})
+        if tracer is not None:
+            tracer.complete(function.__name__, 'stage', start_timestamp, finished_timestamp, request_id=tracer.request_id)
+            tracer.ship(runner_stats_out_queue, function.__name__)
+        runner_stats_out_queue.put({'topic': function.__name__, 'time': (start_timestamp, finished_timestamp)})
+        logger.info(function.__name__ + ' finished task; waiting for next one!')
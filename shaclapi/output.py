@@ -2,8 +2,59 @@ import json
 
 
 class Output:
-    def __init__(self, output):
+    def __init__(self, output, status='finished'):
         self.output = output
+        self.status = status  # 'finished' or 'timeout' (partial output)
+        self.metrics = None  # Summary of the metrics of the request (see shaclapi.metrics.summary)
+        self.profile = None  # Profiles of the steps of the pipeline, if the option profile is turned on (see shaclapi.profiling.report)
+
+    @staticmethod
+    def from_results(results, output_format, status='finished'):
+        """
+        Creates the output from the results produced by the output completion; for the output formats 'test' and
+        'aggregate' that is only the last result, otherwise the list of all results.
+        """
+        if output_format in ('test', 'aggregate'):
+            output = {}
+            for output in results:
+                pass
+        else:
+            output = list(results)
+        return Output(output, status)
 
     def to_json(self):
         return json.dumps(self.output)
+
+    def iter_json(self):
+        """Yields the JSON representation of the output in chunks."""
+        yield self.to_json()
+
+
+class StreamedOutput(Output):
+    """
+    Output whose results are only read while it is serialized, e.g., results replayed from the response cache.
+    """
+
+    def __init__(self, results, output_format, status='finished'):
+        self.results = results
+        self.output_format = output_format
+        self.status = status
+        self.metrics = None
+        self.profile = None
+        self.materialized = None
+
+    @property
+    def output(self):
+        if self.materialized is None:
+            self.materialized = Output.from_results(self.results, self.output_format).output
+        return self.materialized
+
+    def iter_json(self):
+        if self.output_format in ('test', 'aggregate'):
+            yield self.to_json()
+            return
+        separator = '['
+        for result in self.results:
+            yield separator + json.dumps(result)
+            separator = ', '
+        yield '[]' if separator == '[' else ']'
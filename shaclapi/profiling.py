@@ -0,0 +1,99 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+
+
+class TaskProfiler:
+    """
+    Profiles the task executed by the current thread with cProfile and, additionally, samples the stack of the thread
+    every interval seconds, which gives the collapsed stacks used by flame graph tools.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.profiler = cProfile.Profile()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        thread_id = threading.get_ident()
+        self.sampler = threading.Thread(target=self._sample, args=(thread_id, ), daemon=True)
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        """Stops profiling and returns the (picklable) profile: {'pstats': raw cProfile statistics, 'stacks': {collapsed stack: samples}}."""
+        self.profiler.disable()
+        self.stopped.set()
+        self.sampler.join()
+        self.profiler.create_stats()
+        return {'pstats': self.profiler.stats, 'stacks': dict(self.stacks)}
+
+    def _sample(self, thread_id):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class _RawStats:
+    # pstats.Stats accepts any object with create_stats() and stats.
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def to_pstats(raw_stats):
+    return pstats.Stats(_RawStats(dict(raw_stats)))
+
+
+def collapsed_stacks(stacks):
+    """Returns the stacks in the collapsed format of flamegraph.pl ('frame;frame;frame samples' per line)."""
+    return ''.join('{} {}\n'.format(stack, samples) for stack, samples in sorted(stacks.items()))
+
+
+def report(profiles, directory=None, top=30):
+    """
+    Returns per stage (and for all stages merged) the top functions by cumulative time and the collapsed stacks.
+    If a directory is given, the pstats files (<stage>.prof, all.prof) and the collapsed stacks (<stage>.folded, all.folded) are written to it.
+    """
+    result = {}
+    merged_stats = None
+    merged_stacks = Counter()
+    for stage, profile in sorted(profiles.items()):
+        stats = to_pstats(profile['pstats'])
+        result[stage] = _stage_report(stage, stats, profile['stacks'], directory, top)
+        merged_stacks.update({stage + ';' + stack: samples for stack, samples in profile['stacks'].items()})
+        if merged_stats is None:
+            merged_stats = to_pstats(profile['pstats'])
+        else:
+            merged_stats.add(_RawStats(profile['pstats']))
+    if merged_stats is not None:
+        result['all'] = _stage_report('all', merged_stats, merged_stacks, directory, top)
+    return result
+
+
+def _stage_report(name, stats, stacks, directory, top):
+    text = io.StringIO()
+    stats.stream = text
+    stats.sort_stats('cumulative').print_stats(top)
+    stage_report = {'top': text.getvalue(), 'collapsed': collapsed_stacks(stacks)}
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        stats.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.folded'), 'w') as f:
+            f.write(stage_report['collapsed'])
+        stage_report['file'] = os.path.join(directory, name + '.prof')
+    return stage_report
@@ -1,4 +1,5 @@
 import logging
+import threading
 from functools import reduce
 
 import regex as re
@@ -10,6 +11,10 @@ from shaclapi.triple import Triple
 
 logger = logging.getLogger(__name__)
 
+# The SPARQL parser of rdflib (pyparsing) is not thread-safe, but queries are parsed in several threads of the API process,
+# e.g., by concurrent requests and by the tasks of the fused pipeline (see fused_pipeline in shaclapi.config).
+PARSER_LOCK = threading.Lock()
+
 
 class Query:
 
@@ -31,8 +36,9 @@ class Query:
     @property
     def query_object(self):
         if not self.__query_object:
-            self.__query_object = sparql.processor.prepareQuery(
-                self.query_string)
+            with PARSER_LOCK:
+                self.__query_object = sparql.processor.prepareQuery(
+                    self.query_string)
         return self.__query_object
 
     @property
@@ -68,6 +74,14 @@ class Query:
             self.__PV = [var.n3(self.namespace_manager) for var in pv]
         return self.__PV
 
+    @property
+    def limit(self):
+        """The LIMIT of the query or None, if the number of results is not limited."""
+        algebra = self.query_object.algebra.get('p')
+        if algebra is not None and algebra.name == 'Slice':
+            return algebra.get('length')
+        return None
+
     @staticmethod
     def prepare_query(query, namespace_manager=None):
         """Query must be slightly modified to fit the conditions of travshacl, rdflib, ...
@@ -279,6 +293,21 @@ class Query:
             count=1
         ), namespace_manager=self.namespace_manager)
 
+    def as_distinct_query(self, variables):
+        """Creates a query returning the distinct results of the query projected to the given variables."""
+        return Query(re.sub(
+            r'(SELECT\s+(DISTINCT|REDUCED)?).*WHERE',
+            'SELECT DISTINCT {} WHERE'.format(' '.join(variables)),
+            self.query_string,
+            count=1
+        ), namespace_manager=self.namespace_manager)
+
+    def as_count_query(self):
+        """Creates a query counting the results of the query, i.e., the query is wrapped as a subquery of SELECT (COUNT(*) AS ?count)."""
+        select = re.search(r'SELECT', self.query_string, re.IGNORECASE).start()
+        return Query(self.query_string[:select] + 'SELECT (COUNT(*) AS ?count) WHERE {\n' + self.query_string[select:] + '\n}',
+                     namespace_manager=self.namespace_manager)
+
     def _reduce_select(self, query, target_var):
         """
         Reduces the full SELECT part of the target_query to the relevant target var.
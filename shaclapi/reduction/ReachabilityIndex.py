@@ -0,0 +1,198 @@
+from TravSHACL.core.GraphTraversal import GraphTraversal
+
+
+class ReachabilityIndex:
+    """
+    Precomputed reachability of the shapes in a shape schema.
+
+    The shapes are numbered densely and the transitive closure of the dependencies is stored as one bitset
+    (Python int) per shape, i.e., bit i of reachable[j] is set if shape i can be reached from shape j.
+    Reduced shape schemas, their unions and overlaps are bit operations on these bitsets.
+    The index is not modified after its creation (except for the memoized traversal orders),
+    therefore, it can be shared by all requests using the same version of a shape schema.
+    """
+
+    def __init__(self, dependencies):
+        self.shapes = list(dependencies.keys())
+        self.position = {shape: i for i, shape in enumerate(self.shapes)}
+        # References to shapes not included in the schema are ignored.
+        self.successors = [[self.position[ref] for ref in dependencies[shape] if ref in self.position]
+                           for shape in self.shapes]
+        self.reachable = self._transitive_closure()
+        self.traversal_orders = {}
+
+    def _transitive_closure(self):
+        """
+        Computes the strongly connected components with Tarjan's algorithm (iterative to support deep schemas).
+        The components are found in reverse topological order, hence, the bitsets of all successors of a component
+        are known when the component is completed.
+        """
+        n = len(self.shapes)
+        reachable = [0] * n
+        index = [None] * n
+        lowlink = [0] * n
+        on_stack = [False] * n
+        stack = []
+        counter = 0
+        for root in range(n):
+            if index[root] is not None:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, child = work.pop()
+                if child == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = True
+                successors = self.successors[node]
+                while child < len(successors):
+                    successor = successors[child]
+                    child += 1
+                    if index[successor] is None:
+                        work.append((node, child))
+                        work.append((successor, 0))
+                        break
+                    elif on_stack[successor]:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                else:
+                    if lowlink[node] == index[node]:
+                        component = []
+                        bits = 0
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = False
+                            component.append(member)
+                            bits |= 1 << member
+                            if member == node:
+                                break
+                        for member in component:
+                            for successor in self.successors[member]:
+                                bits |= reachable[successor]
+                        for member in component:
+                            reachable[member] = bits
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+        return reachable
+
+    def bitset(self, shapes):
+        """Returns the bitset representing the given shapes."""
+        bits = 0
+        for shape in shapes:
+            bits |= 1 << self.position[shape]
+        return bits
+
+    def shapes_of(self, bits):
+        """Returns the shapes contained in the bitset."""
+        return [shape for i, shape in enumerate(self.shapes) if bits >> i & 1]
+
+    def reachable_from(self, shape):
+        """Returns the bitset of the shapes reachable from the given shape (including the shape itself)."""
+        return self.reachable[self.position[shape]]
+
+    def reduce(self, target_shapes):
+        """Returns the bitset of the reduced shape schema for the given target shapes."""
+        bits = 0
+        for target_shape in target_shapes:
+            bits |= self.reachable_from(target_shape)
+        return bits
+
+    def affected_targets(self, shape, target_shapes):
+        """Returns the target shapes whose reduced shape schema contains the given shape."""
+        bit = 1 << self.position[shape]
+        return [target_shape for target_shape in target_shapes if self.reachable_from(target_shape) & bit]
+
+    def independent_targets(self, target_shapes):
+        """Returns the target shapes, which are not reachable from any of the other target shapes."""
+        return [target_shape for target_shape in target_shapes
+                if not self.affected_targets(target_shape, [other for other in target_shapes if other != target_shape])]
+
+    def independent_target_groups(self, target_shapes):
+        """
+        Partitions the target shapes into groups, such that the reduced shape schemas of different groups are disjoint.
+        Hence, the groups can be validated independently of each other.
+        """
+        groups = []
+        for target_shape in target_shapes:
+            bits = self.reachable_from(target_shape)
+            members = [target_shape]
+            remaining = []
+            for group_bits, group_members in groups:
+                if group_bits & bits:
+                    bits |= group_bits
+                    members = group_members + members
+                else:
+                    remaining.append((group_bits, group_members))
+            groups = remaining + [(bits, members)]
+        return [sorted(members, key=target_shapes.index) for _, members in groups]
+
+    @staticmethod
+    def size(bits):
+        return bin(bits).count('1')
+
+    @staticmethod
+    def overlap(bits_one, bits_two):
+        """
+        The number of shapes in the intersection divided by the number of shapes in the smaller of both bitsets.
+        """
+        min_size = min(ReachabilityIndex.size(bits_one), ReachabilityIndex.size(bits_two))
+        inter_size = ReachabilityIndex.size(bits_one & bits_two)
+        return float(inter_size / min_size) if min_size > 0 else 0
+
+    def traversal_order(self, target_shape, graph_traversal):
+        """
+        Returns the shapes reachable from the target shape in the order visited by the given graph traversal.
+        The result is the same as the one of GraphTraversal.traverse_graph for the reduced edges, i.e., without
+        reversed dependencies and for one connected component; but the traversal runs in linear time.
+        """
+        key = (graph_traversal.name, target_shape)
+        if key not in self.traversal_orders:
+            start = self.position[target_shape]
+            if graph_traversal == GraphTraversal.DFS:
+                visited = self._dfs(start)
+            else:
+                visited = self._bfs(start)
+            self.traversal_orders[key] = [self.shapes[i] for i in visited]
+        return list(self.traversal_orders[key])
+
+    def _dfs(self, start):
+        # Trav-SHACL's DFS also enters already visited nodes (as long as not all nodes of the schema are visited)
+        # and continues with their unvisited successors; this influences the order in case of cycles.
+        n = len(self.shapes)
+        visited = []
+        is_visited = [False] * n
+        work = [(start, None, 0)]  # (node, whether the node was visited for the first time, next successor)
+        while work:
+            node, first_visit, child = work.pop()
+            if first_visit is None:
+                if not is_visited[node]:
+                    visited.append(node)
+                    is_visited[node] = True
+                    first_visit = True
+                elif len(visited) != n:
+                    first_visit = False
+                else:
+                    continue
+            successors = self.successors[node]
+            while child < len(successors):
+                successor = successors[child]
+                child += 1
+                if first_visit or not is_visited[successor]:
+                    work.append((node, first_visit, child))
+                    work.append((successor, None, 0))
+                    break
+        return visited
+
+    def _bfs(self, start):
+        visited = [start]
+        is_visited = [False] * len(self.shapes)
+        is_visited[start] = True
+        position = 0
+        while position < len(visited):
+            for successor in self.successors[visited[position]]:
+                if not is_visited[successor]:
+                    is_visited[successor] = True
+                    visited.append(successor)
+            position += 1
+        return visited
@@ -1,27 +1,85 @@
 import logging
-from functools import reduce
+import re
 
 from shaclapi.query import Query
+from shaclapi.reduction.ReachabilityIndex import ReachabilityIndex
+from shaclapi.reduction.ShapeSchemaCache import REDUCED_SCHEMA_CACHE
 
 logger = logging.getLogger(__name__)
 
+HEX_DIGITS = '0123456789abcdef'
+re_https = re.compile("https?://")
+
+
+def rreplace(s, old, new, occurrence):
+    li = s.rsplit(old, occurrence)
+    return new.join(li)
+
+
+def shard_filter(var, shard, shard_count):
+    """
+    Returns a FILTER clause, which is only satisfied by the instances assigned to the given shard.
+    The instances are assigned to the shards by the first hex digit of the MD5 hash of their IRI.
+    """
+    digits = ', '.join('"{}"'.format(digit) for digit in HEX_DIGITS if int(digit, 16) % shard_count == shard)
+    return 'FILTER(SUBSTR(MD5(STR({})), 1, 1) IN ({}))'.format(var, digits)
+
+
+def shard_target_query(target_query, shard, shard_count):
+    """
+    Returns the target query restricted to the instances (bound to ?x) of the given shard.
+    """
+    return rreplace(target_query, '}', ' ' + shard_filter('?x', shard, shard_count) + ' }', 1)
+
+
+def instances_values(var, instances):
+    """
+    Returns a VALUES clause binding var to the given instances.
+    """
+    if instances:
+        return 'VALUES {} {{'.format(var) + ' '.join('<' + instance + '>' for instance in instances) + '}'
+    return 'FILTER(false)'  # An empty VALUES clause is not supported by all endpoints
+
+
+def sparql_path(path):
+    """
+    Returns the path of a constraint as SPARQL property path, i.e., full IRIs are enclosed in angle brackets.
+    """
+    path = str(path)
+    is_inverse_path = path.startswith('^')
+    path = path[1:] if is_inverse_path else path
+    if re_https.match(path):
+        path = '<' + path + '>'
+    return '^' + path if is_inverse_path else path
+
 
 class Reduction:
-    def __init__(self, parser):
+    def __init__(self, parser, index=None):
         self.parser = parser
         self.involvedShapesPerTarget = {}
+        self.index = index
 
     def reduce_shape_network(self, shapes, target_shape_list):
-        involvedShapes = set()
+        """
+        Reduces the shape network to the shapes reachable from the target shapes.
+        If the shape schema was parsed from a cached directory, the reachability index of the shape schema
+        is shared by all subsequent requests using the same version of the shape schema.
+        """
+        self.index = self.reachability_index(shapes)
         for target_shape in target_shape_list:
-            shapeIds = list(self.parser.graph_traversal.traverse_graph(
-                *self.parser.computeReducedEdges(shapes), target_shape, True))
-            self.involvedShapesPerTarget[target_shape] = shapeIds
-            involvedShapes = involvedShapes.union(shapeIds)
+            self.involvedShapesPerTarget[target_shape] = self.index.traversal_order(target_shape, self.parser.graph_traversal)
         logger.debug('Involved Shapes:' + str(self.involvedShapesPerTarget))
+        involvedShapes = set(self.index.shapes_of(self.index.reduce(target_shape_list)))
         shapes = [s for s in shapes if self.parser.shape_get_id(s) in involvedShapes]
         return shapes
 
+    def reachability_index(self, shapes):
+        if self.parser.schema_key is not None:
+            return REDUCED_SCHEMA_CACHE.get_or_parse(
+                self.parser.schema_key, self.parser.schema_version,
+                lambda: ReachabilityIndex(self.parser.computeReducedEdges(shapes)[0]))
+        return ReachabilityIndex(self.parser.computeReducedEdges(shapes)[0])
+
     def replace_target_query(self, shapes, query, target_shapes, target_shape_list, merge_old_target_query, query_extension_per_target_shape):
         logger.info('Using Shape Schema WITH replaced target query!')
         if query_extension_per_target_shape is None:
@@ -33,11 +91,12 @@ class Reduction:
             for target_shape in target_shapes[var]:
                 target_shapes_to_var[target_shape] = var  # TODO: What is with a target shape occurring more then once?
 
+        independent_targets = self.index.independent_targets(target_shape_list)
         for s in shapes:
             s_id = self.parser.shape_get_id(s)
             if s_id in target_shape_list:
                 # If there isn't a shape based on the target shape, reduce the target definition
-                if len(target_shape_list) == 1 or s_id not in reduce(lambda a, b: a+b, [self.involvedShapesPerTarget[targetShape] for targetShape in target_shape_list if targetShape != s_id]):
+                if s_id in independent_targets:
                     # The Shape already has a target query
                     logger.debug(f'Reducing target definition of {s_id}')
                     logger.debug('Original Query:\n' + query.query_string)
@@ -52,10 +111,6 @@ class Reduction:
                         else:
                             targetQuery = query.query_string
 
-                    def rreplace(s, old, new, occurrence):
-                        li = s.rsplit(old, occurrence)
-                        return new.join(li)
-
                     if s_id in query_extension_per_target_shape:
                         targetQuery = rreplace(targetQuery, '}', f'{query_extension_per_target_shape[s_id]}}}', 1)
                         logger.debug(f'Extended targetQuery with query extension specified!')
@@ -63,6 +118,59 @@ class Reduction:
                     self.parser.replace_target_query(s, targetQuery)
                     logger.debug('New TargetDef:\n' + targetQuery)
     
+    def restrict_target_query_to_instances(self, shapes, target_shapes, target_shape_list, target_instances, merge_old_target_query, target_queries=None):
+        """
+        Restricts the target queries of the target shapes to the given instances (per query variable) using a VALUES clause.
+        Target shapes reachable from other target shapes keep their target query, as the other target shapes depend on all their instances.
+        If target_queries (shape id -> target query) is given, these target queries are restricted instead of the current ones.
+        """
+        logger.info('Using Shape Schema WITH target query restricted to the instances of the query!')
+        independent_targets = self.index.independent_targets(target_shape_list)
+        for var in target_shapes.keys():
+            instances = target_instances.get(var, [])
+            values = instances_values('?x', instances)
+            for s in shapes:
+                s_id = self.parser.shape_get_id(s)
+                if s_id in target_shapes[var] and s_id in independent_targets:
+                    oldTargetQuery = target_queries.get(s_id) if target_queries is not None else self.parser.shape_get_target_query(s)
+                    if oldTargetQuery and merge_old_target_query:
+                        targetQuery = rreplace(oldTargetQuery, '}', ' ' + values + ' }', 1)
+                    else:
+                        targetQuery = 'SELECT ?x WHERE { ' + values + ' }'
+                    self.parser.replace_target_query(s, targetQuery)
+                    logger.debug('New TargetDef of {} restricted to {} instances'.format(s_id, len(instances)))
+
+    def restrict_target_query_to_reachable_instances(self, shapes, excluded_shapes, target_instances, target_queries):
+        """
+        Restricts the target queries (shape id -> target query) of the shapes not in excluded_shapes to the instances reachable from
+        the given instances (per query variable) via the paths of the constraints referencing other shapes. The instances reachable
+        in the data graph are a superset of the instances the validation of the given instances depends on.
+        """
+        paths = sorted({sparql_path(path) for s in shapes for path in self.parser.shape_get_reference_paths(s)})
+        instances = [instance for var_instances in target_instances.values() for instance in var_instances]
+        if paths:
+            reachable = instances_values('?shaclapi_source', instances) + ' ?shaclapi_source (' + '|'.join(paths) + ')+ ?x'
+        else:
+            reachable = 'FILTER(false)'
+        for s in shapes:
+            s_id = self.parser.shape_get_id(s)
+            if s_id not in excluded_shapes and target_queries.get(s_id):
+                self.parser.replace_target_query(s, rreplace(target_queries[s_id], '}', ' ' + reachable + ' }', 1))
+        logger.debug('Target queries of the shapes, which are not excluded, restricted to the instances reachable from {} instances'.format(len(instances)))
+
+    def restrict_target_query_to_shard(self, shapes, target_shape, shard, shard_count):
+        """
+        Restricts the target query of the target shape to the instances of the given shard.
+        """
+        for s in shapes:
+            if self.parser.shape_get_id(s) == target_shape:
+                targetQuery = self.parser.shape_get_target_query(s)
+                if targetQuery is None:
+                    raise Exception('The target shape {} has no target query, which could be sharded'.format(target_shape))
+                targetQuery = shard_target_query(targetQuery, shard, shard_count)
+                self.parser.replace_target_query(s, targetQuery)
+                logger.debug('Target query of shard {}/{}:\n'.format(shard, shard_count) + targetQuery)
+
     def node_order(self, target_shape_list):
         node_order = target_shape_list
         for target_shape in target_shape_list:
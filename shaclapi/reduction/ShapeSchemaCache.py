@@ -0,0 +1,101 @@
+import copy
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def schema_version(path, shape_format):
+    """
+    Computes a fingerprint of the shape files in the given directory.
+    The fingerprint consists of the relative path, the modification time and the size of each shape file.
+    Hence, it changes whenever a shape file is added, removed or modified.
+    """
+    file_extension = '.ttl' if shape_format == 'SHACL' else '.json'
+    stamps = []
+    for root, _, files in os.walk(path):
+        for file in files:
+            if os.path.splitext(file)[1].lower() == file_extension:
+                file_path = os.path.join(root, file)
+                stat = os.stat(file_path)
+                stamps.append((os.path.relpath(file_path, path), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stamps))
+
+
+class ShapeSchemaCache:
+    """
+    Per-process cache of parsed (or reduced) shape schemas.
+
+    Each entry is stored together with the version of the schema directory it was computed from (see :func:`schema_version`).
+    If the version changed since the entry was created, the schema is parsed again on the next access.
+    By default, the cached objects are never handed out directly; a deep copy is returned instead, because the shapes
+    are modified during the reduction and the validation. Immutable objects can be shared by setting copy_values to False.
+    """
+
+    def __init__(self, max_entries=16, copy_values=True):
+        self.max_entries = max_entries
+        self.copy_values = copy_values
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_parse(self, key, version, parse):
+        """
+        Returns a copy of the cached value for key, if it was computed for the given version.
+        Otherwise, parse is called to compute the value, which is then cached and returned.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                logger.debug('Cache hit for {}'.format(key))
+                return copy.deepcopy(entry[1]) if self.copy_values else entry[1]
+
+        logger.debug('Cache miss for {}'.format(key))
+        value = parse()
+        with self.lock:
+            self.entries[key] = (version, copy.deepcopy(value) if self.copy_values else value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+SHAPE_SCHEMA_CACHE = ShapeSchemaCache()
+REDUCED_SCHEMA_CACHE = ShapeSchemaCache(copy_values=False)
+
+
+def constraint_removal_signature(parser):
+    """
+    The constraints removed by the ReducedShapeParser while parsing depend on the target shapes and the predicates of the query.
+    Returns None if no constraints are removed.
+    """
+    if parser.query is not None and parser.config.remove_constraints:
+        return (frozenset(parser.targetShapeList),
+                frozenset(parser.query.get_predicates(replace_prefixes=True, ignore_inv=False)),
+                frozenset(parser.query.get_predicates(replace_prefixes=False, ignore_inv=False)))
+    return None
+
+
+def load_shape_schema(parser, parse_shapes_from_dir, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries):
+    """
+    Returns all shapes in the directory parsed by parse_shapes_from_dir, the parsing method of the backend of the ReducedShapeParser.
+    If the shape schema cache is turned on, the shapes and the constraints removed while parsing are taken from SHAPE_SCHEMA_CACHE
+    and the key and version of the shape schema are stored in the parser.
+    """
+    def parse():
+        shapes = parse_shapes_from_dir(path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+        return shapes, parser.removed_constraints
+
+    if not parser.config.cache_shape_schema:
+        return parse()[0]
+    parser.schema_key = (os.path.abspath(path), shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries,
+                         parser.__class__.__module__, constraint_removal_signature(parser))
+    parser.schema_version = schema_version(path, shapeFormat)
+    all_shapes, parser.removed_constraints = SHAPE_SCHEMA_CACHE.get_or_parse(parser.schema_key, parser.schema_version, parse)
+    return all_shapes
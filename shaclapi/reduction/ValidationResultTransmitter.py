@@ -1,6 +1,9 @@
 import logging
 import time
 
+from shaclapi import metrics
+from shaclapi.multiprocessing.CancellationToken import RequestCancelled
+
 logger = logging.getLogger(__name__)
 
 
@@ -10,12 +13,28 @@ class ValidationResultTransmitter:
     This can be done via an endpoint or using a multiprocessing.Queue.
     """
 
-    def __init__(self, output_queue, first_val_time_queue=None):
+    def __init__(self, output_queue, first_val_time_queue=None, cancellation_token=None, polarity=None, target_shapes=None):
         self.output_queue = output_queue
         self.timestamp_of_first_result_send = False
         self.first_val_time_queue = first_val_time_queue
+        self.cancellation_token = cancellation_token
+        # If a polarity is given, results with the other polarity are dropped except for the target shapes
+        # (these are needed to discard the corresponding query bindings in the join).
+        self.polarity = polarity
+        self.target_shapes = set(target_shapes or [])
+
+    def check_cancelled(self):
+        """
+        Raises RequestCancelled, if the request was cancelled. Besides sending the results, the backend checks the cancellation before
+        each step of the validation, which queries the endpoint.
+        """
+        if self.cancellation_token is not None and self.cancellation_token.is_cancelled():
+            raise RequestCancelled('The request was cancelled during the validation')
 
     def send(self, instance, shape, valid, reason):
+        self.check_cancelled()
+        if self.polarity is not None and valid != self.polarity and shape not in self.target_shapes:
+            return
         logger.debug({'instance': instance, 
                       'validation': (shape, valid, reason)})
         if not self.timestamp_of_first_result_send and self.first_val_time_queue:
@@ -23,7 +42,51 @@ class ValidationResultTransmitter:
             self.first_val_time_queue.put({'topic': 'first_validation_result', 'time': time.time()})
 
         self.output_queue.put({'instance': instance, 'validation': (shape, valid, reason)})
+        metrics.current().count('validation_results')
     
     def done(self):
         if not self.timestamp_of_first_result_send and self.first_val_time_queue:
             self.first_val_time_queue.put({'topic': 'first_validation_result', 'time': None})
+
+
+class ForwardingResultTransmitter(ValidationResultTransmitter):
+    """
+    Forwards the validation results of several validation runs to a single result transmitter.
+    Validation results of the shapes in deduplicate_shapes, which may be validated in more than one run, are only forwarded once.
+    Calling done is left to the owner of the result transmitter.
+    """
+
+    def __init__(self, result_transmitter, deduplicate_shapes=None):
+        super().__init__(output_queue=None)
+        self.result_transmitter = result_transmitter
+        self.deduplicate_shapes = deduplicate_shapes or set()
+        self.forwarded = set()
+
+    def send(self, instance, shape, valid, reason):
+        if shape in self.deduplicate_shapes:
+            if (instance, shape) in self.forwarded:
+                return
+            self.forwarded.add((instance, shape))
+        self.result_transmitter.send(instance, shape, valid, reason)
+
+    def check_cancelled(self):
+        self.result_transmitter.check_cancelled()
+
+    def done(self):
+        pass
+
+
+class CountingResultTransmitter(ValidationResultTransmitter):
+    """
+    Counts the validation results (see :class:`shaclapi.aggregation.ValidationCounts`) instead of transmitting them.
+    """
+
+    def __init__(self, counts):
+        super().__init__(output_queue=None)
+        self.counts = counts
+
+    def send(self, instance, shape, valid, reason):
+        self.counts.add(shape, valid)
+
+    def done(self):
+        pass
@@ -5,6 +5,7 @@ from functools import reduce
 from SHACL2SPARQLpy.ShapeParser import ShapeParser
 
 from shaclapi.reduction.Reduction import Reduction
+from shaclapi.reduction.ShapeSchemaCache import load_shape_schema
 
 logger = logging.getLogger(__name__)
 re_https = re.compile("https?://")
@@ -23,17 +24,22 @@ class ReducedShapeParser(ShapeParser):
         self.involvedShapeIDs = []
         self.graph_traversal = graph_traversal
         self.config = config
+        self.schema_key = None
+        self.schema_version = None
+        self.reachability_index = None
+        self.target_queries = None
 
     def parseShapesFromDir(self, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries):
         """
         Parses shapes from a directory. However, shapes are only relevant if they occur in the query or are
         reachable from shapes occurring in the query. The remaining shapes can be removed.
         """
-        all_shapes = super().parseShapesFromDir(path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+        all_shapes = load_shape_schema(self, super().parseShapesFromDir, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
         reducer = Reduction(self)
 
         # Step 1: Prune not reachable shapes
         reduced_shapes = reducer.reduce_shape_network(all_shapes, self.targetShapeList)
+        self.reachability_index = reducer.index
         if self.config.prune_shape_network:
             shapes = reduced_shapes
         else:
@@ -42,12 +48,21 @@ class ReducedShapeParser(ShapeParser):
 
         logger.debug('Removed Constraints:' + str(self.removed_constraints))
 
+        # The original target queries are kept to restrict them again, e.g., to the next chunk of target instances
+        self.target_queries = {self.shape_get_id(s): self.shape_get_target_query(s) for s in shapes}
+
         # Step 2: Replace appropriate target queries
-        if self.query is not None and self.config.replace_target_query and 'UNDEF' not in self.targetShapes:
+        if self.config.target_instances is not None and 'UNDEF' not in self.targetShapes:
+            reducer.restrict_target_query_to_instances(shapes, self.targetShapes, self.targetShapeList, self.config.target_instances, self.config.merge_old_target_query)
+        elif self.query is not None and self.config.replace_target_query and 'UNDEF' not in self.targetShapes:
             reducer.replace_target_query(shapes, self.query, self.targetShapes, self.targetShapeList, self.config.merge_old_target_query, self.config.query_extension_per_target_shape)
         else:
             logger.warning('Using Shape Schema WITHOUT replaced target query!')
-        
+
+        # Step 3: Restrict the target query of the target shape to the shard to be validated
+        if self.config.validation_shard is not None:
+            reducer.restrict_target_query_to_shard(shapes, self.targetShapeList[0], self.config.validation_shard, self.config.validation_shards)
+
         if self.config.start_with_target_shape:
             return shapes, reducer.node_order(self.targetShapeList), self.targetShapeList
         else:
@@ -59,6 +74,17 @@ class ReducedShapeParser(ShapeParser):
     def shape_get_id(self, shape):
         return shape.getId()
 
+    def shape_get_target_query(self, shape):
+        if shape.targetQuery is not None and shape.targetQuery.startswith(shape.prefix_string):
+            return shape.targetQuery[len(shape.prefix_string):]
+        return shape.targetQuery
+
+    def shape_get_prefixes(self, shape):
+        return shape.prefix_string
+
+    def shape_get_reference_paths(self, shape):
+        return [c.path for c in shape.constraints if c.getShapeRef() is not None]
+
     def parseConstraints(self, shapeName, array, targetDef, constraintsId):
         self.currentShape = constraintsId[:-3]
         self.removed_constraints[self.currentShape] = []
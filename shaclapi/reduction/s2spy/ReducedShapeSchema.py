@@ -44,7 +44,7 @@ class ReducedShapeSchema(ShapeNetwork):
             start = [self.shaclAPIConfig.start_shape_for_validation]
         elif self.node_order is not None:
             logger.info('Using Node Order provided by the shaclapi')
-            node_order = self.node_order
+            node_order = list(self.node_order)  # The node order is consumed by the validation
         elif start_with_target_shape:
             logger.info('Starting with Target Shape')
             start = self.target_shape_list
@@ -6,6 +6,7 @@ import rdflib
 from TravSHACL.core.ShapeParser import ShapeParser
 
 from shaclapi.reduction.Reduction import Reduction
+from shaclapi.reduction.ShapeSchemaCache import load_shape_schema
 
 logger = logging.getLogger(__name__)
 re_https = re.compile("https?://")
@@ -24,20 +25,22 @@ class ReducedShapeParser(ShapeParser):
         self.involvedShapesPerTarget = {}
         self.graph_traversal = graph_traversal
         self.config = config
+        self.schema_key = None
+        self.schema_version = None
+        self.reachability_index = None
+        self.target_queries = None
 
     def parse_shapes(self, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries):
         """
         Parses shapes from a directory or RDFlib graph. However, shapes are only relevant if they occur in the query
         or are reachable from shapes occurring in the query. The remaining shapes can be removed.
         """
-        if isinstance(path, rdflib.Graph):
-            all_shapes = super().parse_ttl(path, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
-        else:
-            all_shapes = super().parse_shapes_from_dir(path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+        all_shapes = self.load_shapes(path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
         reducer = Reduction(self)
 
         # Step 1: Prune not reachable shapes
         reduced_shapes = reducer.reduce_shape_network(all_shapes, self.targetShapeList)
+        self.reachability_index = reducer.index
         if self.config.prune_shape_network:
             shapes = reduced_shapes
         else:
@@ -46,17 +49,48 @@ class ReducedShapeParser(ShapeParser):
 
         logger.debug('Removed Constraints:' + str(self.removed_constraints))
 
+        # The original target queries are kept to restrict them again, e.g., to the next chunk of target instances
+        self.target_queries = {self.shape_get_id(s): self.shape_get_target_query(s) for s in shapes}
+
         # Step 2: Replace appropriate target queries
-        if self.query is not None and self.config.replace_target_query and 'UNDEF' not in self.targetShapes:
+        if self.config.target_instances is not None and 'UNDEF' not in self.targetShapes:
+            reducer.restrict_target_query_to_instances(shapes, self.targetShapes, self.targetShapeList, self.config.target_instances, self.config.merge_old_target_query)
+        elif self.query is not None and self.config.replace_target_query and 'UNDEF' not in self.targetShapes:
             reducer.replace_target_query(shapes, self.query, self.targetShapes, self.targetShapeList, self.config.merge_old_target_query, self.config.query_extension_per_target_shape)
         else:
             logger.warning('Using Shape Schema WITHOUT replaced target query!')
-        
+
+        # Step 3: Restrict the target query of the target shape to the shard to be validated
+        if self.config.validation_shard is not None:
+            reducer.restrict_target_query_to_shard(shapes, self.targetShapeList[0], self.config.validation_shard, self.config.validation_shards)
+
         if self.config.start_with_target_shape:
             return shapes, reducer.node_order(self.targetShapeList), self.targetShapeList
         else:
             return shapes, None, self.targetShapeList
 
+    def parse_reduced_schemas(self, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries):
+        """
+        Parses the shapes once and reduces the shape schema for each of the target shapes separately.
+        If no target shape is given, each shape of the shape schema is used as target shape.
+
+        Returns a dictionary mapping each target shape to the node order of its reduced shape schema
+        and the reachability index of the shape schema.
+        """
+        all_shapes = self.load_shapes(path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+        target_shape_list = self.targetShapeList or [self.shape_get_id(s) for s in all_shapes]
+        reducer = Reduction(self)
+        reducer.reduce_shape_network(all_shapes, target_shape_list)
+        return {target_shape: reducer.node_order([target_shape]) for target_shape in target_shape_list}, reducer.index
+
+    def load_shapes(self, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries):
+        """
+        Returns all shapes of the shape schema; using the shape schema cache if possible.
+        """
+        if isinstance(path, rdflib.Graph):
+            return super().parse_ttl(path, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+        return load_shape_schema(self, super().parse_shapes_from_dir, path, shapeFormat, useSelectiveQueries, maxSplitSize, ORDERBYinQueries)
+
     def replace_target_query(self, shape, query):
         shape.targetQuery = shape.get_prefix_string() + query
         shape.targetQueryNoPref = query
@@ -64,7 +98,16 @@ class ReducedShapeParser(ShapeParser):
     
     def shape_get_id(self, shape):
         return shape.get_id()
+
+    def shape_get_target_query(self, shape):
+        return shape.targetQueryNoPref
+
+    def shape_get_prefixes(self, shape):
+        return shape.get_prefix_string()
    
+    def shape_get_reference_paths(self, shape):
+        return [c.path for c in shape.constraints if c.get_shape_ref() is not None]
+
     def parse_constraints(self, array, targetDef, constraintsId):
         self.currentShape = constraintsId[:-3]
         self.removed_constraints[self.currentShape] = []
@@ -69,7 +69,7 @@ class ReducedShapeSchema(ShapeSchema):
             start = [self.shaclAPIConfig.start_shape_for_validation]
         elif self.node_order is not None:
             logger.info('Using Node Order provided by the shaclapi')
-            node_order = self.node_order
+            node_order = list(self.node_order)  # The node order is consumed by the validation
         elif start_with_target_shape:
             logger.info('Starting with Target Shape')
             start = self.target_shape_list
@@ -84,6 +84,7 @@ class ReducedShapeSchema(ShapeSchema):
 
         for s in self.shapes:
             s.compute_constraint_queries()
+            s.targets = {'valid': set(), 'violated': set()}  # The schema may be validated more than once (see validate_target_instances)
 
         target_shapes = [s for name, s in self.shapesDict.items()
                          if self.shapesDict[name].get_target_query() is not None]
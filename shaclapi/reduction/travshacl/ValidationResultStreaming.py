@@ -1,5 +1,7 @@
 from TravSHACL.rule_based_validation.Validation import Validation
 
+from shaclapi import tracing
+
 
 class ValidationResultStreaming(Validation):
 
@@ -15,6 +17,20 @@ class ValidationResultStreaming(Validation):
         else:
             self.result_transmitter.done()
 
+    def retrieve_next_targets(self, state, next_focus_shape, shapes_state):
+        self.result_transmitter.check_cancelled()
+        with tracing.current().span('retrieve targets', 'validation', shape=next_focus_shape.get_id()):
+            return super().retrieve_next_targets(state, next_focus_shape, shapes_state)
+
+    def eval_constraints_queries(self, state, shape, filtering_shape):
+        self.result_transmitter.check_cancelled()
+        with tracing.current().span('constraint queries', 'validation', shape=shape.get_id()):
+            return super().eval_constraints_queries(state, shape, filtering_shape)
+
+    def saturate_remaining(self, state, shape_name, shapes_state):
+        with tracing.current().span('saturation', 'validation', shape=shape_name):
+            return super().saturate_remaining(state, shape_name, shapes_state)
+
     def register_target(self, t, t_type, invalidating_shape_name, shapes_state):
         super().register_target(t, t_type, invalidating_shape_name, shapes_state)
         self.result_transmitter.send(instance=t[1], shape=t[0], valid=(t_type == 'valid'),
@@ -0,0 +1,121 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from shaclapi.coalescing import canonical_hash
+from shaclapi.reduction.ShapeSchemaCache import schema_version
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    On-disk cache of the results of :func:`shaclapi.api.run_multiprocessing`.
+
+    The key of an entry is the hash of the effective configuration (see :func:`shaclapi.coalescing.canonical_hash`) combined with
+    the version of the shape schema directory (see :func:`shaclapi.reduction.ShapeSchemaCache.schema_version`).
+    Hence, a changed shape file invalidates the entry immediately, while changes of the data behind the SPARQL endpoint
+    are only taken into account once the entry is older than ttl seconds.
+    The results are stored gzip compressed, one JSON object per line. The least recently used entries are removed,
+    if there are more than max_entries entries or their files need more than max_bytes.
+    The entries are restored from the files in the directory on startup; the modification time of a file is used as its creation time.
+    """
+
+    def __init__(self, directory=None, max_entries=256, max_bytes=1 << 30, ttl=3600):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'shaclapi_response_cache')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (creation time, size of the file in bytes)
+        self.lock = threading.Lock()
+        self._restore()
+
+    def key(self, config):
+        version = schema_version(config.schema_directory, config.schema_format)
+        return hashlib.sha256((canonical_hash(config.config_dict) + repr(version)).encode('utf8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.ndjson.gz')
+
+    def get(self, key):
+        """Returns an iterator over the cached results or None, if there is no valid entry for the key."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            # The file stays readable, even if the entry is removed while the results are replayed.
+            file = gzip.open(self.path(key), 'rt', encoding='utf8')
+        logger.debug('Response cache hit for {}'.format(key))
+        return (json.loads(line) for line in file)
+
+    def put(self, key, results):
+        """Stores the results (an iterable of JSON serializable objects) for the key."""
+        os.makedirs(self.directory, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with gzip.open(os.fdopen(file_descriptor, 'wb'), 'wt', encoding='utf8', compresslevel=1) as file:
+            for result in results:
+                file.write(json.dumps(result, separators=(',', ':')) + '\n')
+        size = os.path.getsize(temp_path)
+        with self.lock:
+            os.replace(temp_path, self.path(key))
+            self.entries[key] = (time.time(), size)
+            self.entries.move_to_end(key)
+            self._evict()
+        logger.debug('Cached {} bytes of results for {}'.format(size, key))
+
+    def purge(self):
+        """Removes all entries and returns their number."""
+        with self.lock:
+            number_of_entries = len(self.entries)
+            for key in list(self.entries):
+                self._remove(key)
+        return number_of_entries
+
+    def _restore(self):
+        """Indexes the entries stored in the directory by an earlier process, oldest first, and removes expired and incomplete files."""
+        if not os.path.isdir(self.directory):
+            return
+        files = []
+        for file_name in os.listdir(self.directory):
+            file_path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(file_path)
+                if file_name.endswith('.tmp'):
+                    os.remove(file_path)  # left behind by an interrupted put
+                elif file_name.endswith('.ndjson.gz'):
+                    files.append((stat.st_mtime, file_name[:-len('.ndjson.gz')], stat.st_size))
+            except OSError:
+                pass
+        for creation_time, key, size in sorted(files):
+            self.entries[key] = (creation_time, size)
+            if time.time() - creation_time > self.ttl:
+                self._remove(key)
+        self._evict()
+        logger.debug('Restored {} entries of the response cache in {}'.format(len(self.entries), self.directory))
+
+    def _evict(self):
+        total_bytes = sum(entry[1] for entry in self.entries.values())
+        while len(self.entries) > self.max_entries or (total_bytes > self.max_bytes and len(self.entries) > 1):
+            oldest_key = next(iter(self.entries))
+            total_bytes -= self.entries[oldest_key][1]
+            self._remove(oldest_key)
+
+    def _remove(self, key):
+        del self.entries[key]
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+
+RESPONSE_CACHE = ResponseCache()
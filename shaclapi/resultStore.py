@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """
+    Stores results on disk (one JSON object per line) and makes them accessible via a handle.
+
+    The results of a handle can be read page by page; the cursor of a page is the byte offset of its first result
+    in the file of the handle, hence, every page is read in time proportional to its size.
+    Pages can already be read while the results are still written (at least every flush_interval seconds the written results become visible);
+    in that case, the cursor after the last available result is returned, such that the client can continue reading later.
+    If more than max_handles handles exist, the oldest ones are removed together with their files.
+    """
+
+    HANDLE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+    def __init__(self, directory=None, max_handles=64, flush_interval=0.5):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'shaclapi_results')
+        self.max_handles = max_handles
+        self.flush_interval = flush_interval
+        self.handles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, handle):
+        if not self.HANDLE_PATTERN.match(handle or ''):
+            raise KeyError(handle)
+        return os.path.join(self.directory, handle + '.ndjson')
+
+    def create(self, results, handle=None):
+        """
+        Writes the results (an iterable of JSON serializable objects) to a new file and returns its handle.
+        A handle (32 hexadecimal digits) can be given to make the results accessible before all of them are written.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        handle = handle or uuid.uuid4().hex
+        path = self.path(handle)
+        with self.lock:
+            self.handles[handle] = {'size': 0, 'complete': False}
+            while self.max_handles is not None and len(self.handles) > self.max_handles:
+                self._remove(self.handles.popitem(last=False)[0])
+        number_of_results = 0
+        last_flush = time.monotonic()
+        with open(path, 'w', encoding='utf8') as file:
+            for result in results:
+                file.write(json.dumps(result, separators=(',', ':')) + '\n')
+                number_of_results += 1
+                if time.monotonic() - last_flush >= self.flush_interval:
+                    file.flush()
+                    last_flush = time.monotonic()
+                    self._set_size(handle, number_of_results)
+        self._set_size(handle, number_of_results, complete=True)
+        logger.debug('Stored {} results with handle {}'.format(number_of_results, handle))
+        return handle
+
+    def _set_size(self, handle, number_of_results, complete=False):
+        with self.lock:
+            if handle in self.handles:
+                self.handles[handle] = {'size': number_of_results, 'complete': complete}
+
+    def size(self, handle):
+        """Returns the number of results stored for the handle."""
+        with self.lock:
+            return self.handles[handle]['size']
+
+    def bytes(self, handle):
+        """Returns the size of the file of the handle in bytes."""
+        try:
+            return os.path.getsize(self.path(handle))
+        except OSError:
+            return 0
+
+    def page(self, handle, cursor=0, limit=1000):
+        """
+        Returns the next (at most) limit results starting at the cursor and the cursor of the following page
+        (None, if there are no more results).
+        """
+        with self.lock:
+            complete = self.handles[handle]['complete']
+        path = self.path(handle)
+        cursor = int(cursor or 0)
+        if not 0 <= cursor <= os.path.getsize(path):
+            raise ValueError('Invalid cursor {}'.format(cursor))
+        results = []
+        with open(path, 'rb') as file:
+            file.seek(cursor)
+            while len(results) < limit:
+                line = file.readline()
+                if not line.endswith(b'\n'):
+                    # End of the file or a result, which is not completely written yet.
+                    break
+                results.append(json.loads(line))
+                cursor += len(line)
+            else:
+                if file.readline().endswith(b'\n'):
+                    return results, cursor
+        return results, None if complete else cursor
+
+    def remove(self, handle):
+        with self.lock:
+            self.handles.pop(handle, None)
+        self._remove(handle)
+
+    def _remove(self, handle):
+        try:
+            os.remove(self.path(handle))
+        except OSError:
+            pass
+
+
+VALIDATION_RESULT_STORE = ResultStore()
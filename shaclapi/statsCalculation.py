@@ -1,6 +1,12 @@
 import csv
+import logging
 import os
 import time
+from queue import Empty
+
+from shaclapi.answerTrace import AnswerTrace, trace_metrics
+
+logger = logging.getLogger(__name__)
 
 
 class StatsCalculation:
@@ -26,6 +32,11 @@ class StatsCalculation:
 
         self.first_validation_result_time = None
         self.number_of_results = 'Not Calculated'
+        self.answer_timestamps = []
+        self.stage_metrics = {}
+        self.profiles = {}
+        self.memory = {}
+        self.trace_events = []
 
         self.global_start_time = None
         self.global_end_time = None
@@ -40,45 +51,109 @@ class StatsCalculation:
     def taskCalculationStart(self):
         self.task_start_time = time.time()
 
-    def receive_and_write_trace(self, trace_file, timestamp_queue):
+    def progress(self):
         """
-        This assigns the timestamp of the first and the last result; writes the trace file and counts the number of results.
-        This is done using the path of the trace_file and the timestamp_queue (information from the post-processing step)
+        Returns the state of each step of the pipeline based on the statistics received so far:
+        {step: {'finished': True/False, 'time': execution time of the finished step}, 'first_validation_result': seconds after the start}
         """
-        if trace_file is not None:
-            f, writer = self._open_csv(trace_file, ['test', 'approach', 'answer', 'time'])
-            
-        received_results = 0
-        result = timestamp_queue.get()
-        while result != 'EOF':
-            received_results += 1
-            if trace_file is not None:
-                writer.writerow({
-                    'test': self.test_name,
-                    'approach': self.approach_name,
-                    'answer': received_results,
-                    'time': result['timestamp'] - self.global_start_time
-                })
-            self.last_result_timestamp = result['timestamp']
-            if not self.first_result_timestamp:
-                self.first_result_timestamp = result['timestamp']
-            result = timestamp_queue.get()
-        self.number_of_results = received_results
-        if trace_file is not None:
-            f.close()
+        steps = {'contactSource': (self.query_started_time, self.query_finished_time),
+                 'mp_validate': (self.validation_started_time, self.validation_finished_time),
+                 'mp_xjoin': (self.join_started_time, self.join_finished_time),
+                 'mp_post_processing': (self.post_processing_started_time, self.post_processing_finished_time),
+                 'mp_output_completion': (self.task_start_time, self.global_end_time)}
+        progress = {}
+        for step, (started, finished) in steps.items():
+            if started is not None and finished is not None:
+                progress[step] = {'finished': True, 'time': finished - started}
+            else:
+                progress[step] = {'finished': False, 'time': None}
+        if self.first_validation_result_time is not None and self.task_start_time is not None:
+            progress['first_validation_result'] = self.first_validation_result_time - self.task_start_time
+        else:
+            progress['first_validation_result'] = None
+        return progress
+
+    def stage_times(self):
+        """Returns the execution time of each finished step of the pipeline."""
+        return {step: state['time'] for step, state in self.progress().items() if isinstance(state, dict) and state['finished']}
+
+    def answer_trace(self):
+        """Returns the times of the answers relative to the start of the request (see :class:`shaclapi.answerTrace.AnswerTrace`)."""
+        return [timestamp - self.global_start_time for timestamp in self.answer_timestamps]
+
+    def metrics(self, t=None, k=None):
+        """
+        Returns time to the first answer, throughput, completeness, dief@t and dief@k of the request (see :func:`shaclapi.answerTrace.trace_metrics`).
+        """
+        # Until the request finished, the metrics refer to the time elapsed so far.
+        end_time = self.global_end_time if self.global_end_time is not None else time.time()
+        return trace_metrics(self.answer_trace(), end_time - self.global_start_time, t, k)
+
+    def write_trace(self, trace_file):
+        """
+        Writes the answer trace to the trace_file; one line per answer with the time relative to the start of the request.
+        """
+        f, writer = self._open_csv(trace_file, ['test', 'approach', 'answer', 'time'])
+        for answer, answer_time in enumerate(self.answer_trace(), start=1):
+            writer.writerow({
+                'test': self.test_name,
+                'approach': self.approach_name,
+                'answer': answer,
+                'time': answer_time
+            })
+        f.close()
+
+    def write_memory(self, memory_file):
+        """
+        Writes the peak resident set size, the peak traced memory and the top allocation sites of each step to the memory_file
+        (see :class:`shaclapi.memoryTracing.MemoryTracer`); one line per step.
+        """
+        f, writer = self._open_csv(memory_file, ['test', 'approach', 'stage', 'peak_rss', 'peak_traced', 'top_allocations'])
+        for stage, memory in sorted(self.memory.items()):
+            writer.writerow({
+                'test': self.test_name,
+                'approach': self.approach_name,
+                'stage': stage,
+                'peak_rss': memory['peak_rss'],
+                'peak_traced': memory['peak_traced'],
+                'top_allocations': ';'.join('{}={}'.format(site['site'], site['size']) for site in memory['top_allocations'])
+            })
+        f.close()
 
     @staticmethod
     def _open_csv(file, fields):
+        """
+        Opens the csv file to append rows with the fields. An existing file with other columns (e.g., written by an older version)
+        is renamed to <name>.<modification time>.csv first, such that its rows are kept and a new file with the header is started.
+        """
         mode = 'a' if os.path.isfile(file) else 'w'
+        if mode == 'a':
+            with open(file, 'r', newline='') as f:
+                header = next(csv.reader(f), None)
+            if header is None:
+                mode = 'w'
+            elif header != list(fields):
+                root, extension = os.path.splitext(file)
+                suffix = time.strftime('%Y%m%d%H%M%S', time.localtime(os.path.getmtime(file)))
+                rotated_file = '{}.{}{}'.format(root, suffix, extension)
+                number = 1
+                while os.path.exists(rotated_file):
+                    number += 1
+                    rotated_file = '{}.{}-{}{}'.format(root, suffix, number, extension)
+                os.replace(file, rotated_file)
+                logger.warning('The columns of {} changed; the existing file was moved to {}'.format(file, rotated_file))
+                mode = 'w'
         f = open(file, mode)
         writer = csv.DictWriter(f, fields)
         if mode == 'w':
             writer.writeheader()
         return f, writer
 
-    def receive_global_stats(self, stats_out_queue, using_output_completion_runner=False):
+    def receive_global_stats(self, stats_out_queue, using_output_completion_runner=False, deadline=None):
         """
         Receiving start and stop times of the different steps and also the time  of the first validation result.
+        If a deadline (timestamp) is given, waiting for the statistics stops at the deadline.
+        Returns the steps, which did not finish.
         """
         needed_stats = {'mp_validate': False,
                         'contactSource': False,
@@ -90,7 +165,10 @@ class StatsCalculation:
             needed_stats['mp_output_completion'] = False
 
         while sum(needed_stats.values()) < len(needed_stats.keys()):
-            statistic = stats_out_queue.get()
+            try:
+                statistic = stats_out_queue.get(timeout=max(deadline - time.time(), 0.001) if deadline is not None else None)
+            except Empty:
+                return [topic for topic, received in needed_stats.items() if not received]
             needed_stats[statistic['topic']] = True
             if statistic['topic'] == 'mp_validate':
                 self.validation_started_time, self.validation_finished_time = statistic['time']
@@ -104,13 +182,36 @@ class StatsCalculation:
                 self.first_validation_result_time = statistic['time']
             elif statistic['topic'] == 'mp_output_completion':
                 _, self.global_end_time = statistic['time']
+            elif statistic['topic'] == 'metrics':
+                self.stage_metrics[statistic['stage']] = statistic['metrics']
+            elif statistic['topic'] == 'profile':
+                self.profiles[statistic['stage']] = statistic['profile']
+            elif statistic['topic'] == 'memory':
+                self.memory[statistic['stage']] = statistic['memory']
+            elif statistic['topic'] == 'trace':
+                self.trace_events.extend(statistic['events'])
+            elif statistic['topic'] == AnswerTrace.TOPIC:
+                self.answer_timestamps = statistic['timestamps']
+                self.number_of_results = len(self.answer_timestamps)
+                if self.answer_timestamps:
+                    self.first_result_timestamp = self.answer_timestamps[0]
+                    self.last_result_timestamp = self.answer_timestamps[-1]
             elif statistic['topic'] == 'Exception':
                 raise Exception('An Exception occurred in ' + statistic['location'])
             else:
                 raise Exception('received statistic with unknown topic: {}'.format(statistic['topic']))
+        return []
 
-    def write_matrix_and_stats_files(self, matrix_file, stats_file):
-        total_execution_time = self.global_end_time - self.global_start_time
+    def write_matrix_and_stats_files(self, matrix_file, stats_file, dief_t=None, dief_k=None):
+        """
+        Writes the execution times of the steps and the metrics of the answer trace (see :meth:`metrics`) to the stats_file
+        and time to the first answer, time of the last answer and number of answers to the matrix_file.
+        """
+        # After a timeout some of the steps may not have reported their times.
+        if self.global_start_time is not None and self.global_end_time is not None:
+            total_execution_time = self.global_end_time - self.global_start_time
+        else:
+            total_execution_time = 'NaN'
 
         if self.query_started_time is not None and self.query_finished_time is not None:
             query_time = self.query_finished_time - self.query_started_time
@@ -127,44 +228,39 @@ class StatsCalculation:
 #        else:
 #            post_processing_time = 'NaN'
 
-        # Using the maximum of these timestamps because the later one better describes the 'real' start of the join.
-        if self.first_validation_result_time:
-            approximated_join_start = max(self.join_started_time, self.first_validation_result_time)
-        else: 
-            approximated_join_start = self.join_started_time
-        
         if self.join_started_time is not None and self.join_finished_time is not None:
+            # Using the maximum of these timestamps because the later one better describes the 'real' start of the join.
+            if self.first_validation_result_time:
+                approximated_join_start = max(self.join_started_time, self.first_validation_result_time)
+            else:
+                approximated_join_start = self.join_started_time
             join_time = self.join_finished_time - approximated_join_start
         else:
             join_time = 'NaN'
 
-#        if self.first_result_timestamp:
-#            first_result_time = self.first_result_timestamp - self.global_start_time
-#        else:
-#            first_result_time = 'NaN'
-#
-#        if self.last_result_timestamp:
-#            last_result_time = self.last_result_timestamp - self.global_start_time
-#        else:
-#            last_result_time = 'NaN'
-#
-#        matrix_entry = {'test': self.test_name,
-#                        'approach': self.approach_name,
-#                        'tfft': first_result_time,
-#                        'totaltime': last_result_time,
-#                        'comp': self.number_of_results}
+        metrics = self.metrics(dief_t, dief_k)
+        matrix_entry = {'test': self.test_name,
+                        'approach': self.approach_name,
+                        'tfft': metrics['ttft'] if metrics['ttft'] is not None else 'NaN',
+                        'totaltime': metrics['last_answer_time'] if metrics['last_answer_time'] is not None else 'NaN',
+                        'comp': metrics['completeness']}
         stats_entry = {'test': self.test_name,
                        'approach': self.approach_name,
                        'total_execution_time': total_execution_time,
                        'query_time': query_time,
                        'network_validation_time': network_validation_time,
-                       'join_time': join_time}
-#        if matrix_file is not None:
-#            f, writer = self._open_csv(matrix_file, ['test', 'approach', 'tfft', 'totaltime', 'comp'])
-#            writer.writerow(matrix_entry)
-#            f.close()
+                       'join_time': join_time,
+                       'ttft': matrix_entry['tfft'],
+                       'throughput': metrics['throughput'] if metrics['throughput'] is not None else 'NaN',
+                       'completeness': metrics['completeness'],
+                       'dief@t': metrics['dief@t'],
+                       'dief@k': metrics['dief@k']}
+        if matrix_file is not None:
+            f, writer = self._open_csv(matrix_file, ['test', 'approach', 'tfft', 'totaltime', 'comp'])
+            writer.writerow(matrix_entry)
+            f.close()
 
         if stats_file is not None:
-            f, writer = self._open_csv(stats_file, ['test', 'approach', 'total_execution_time', 'query_time', 'network_validation_time', 'join_time'])
+            f, writer = self._open_csv(stats_file, list(stats_entry.keys()))
             writer.writerow(stats_entry)
             f.close()
@@ -0,0 +1,131 @@
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """Context manager recording the time between entering and leaving it as a complete event of its tracer."""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.tracer.complete(self.name, self.category, self.start, time.time(), **self.args)
+        return False
+
+
+class Tracer:
+    """
+    Records the spans of a single task of a request as events in the Chrome trace event format.
+    The events are collected by the process (or thread) executing the task and shipped once to the main process
+    at the end of the task (see :func:`shaclapi.multiprocessing.runner.run_task`), which writes them to a trace file (see :func:`export`).
+    """
+
+    enabled = True
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.pid = os.getpid()
+        self.tid = threading.get_native_id()
+        self.events = []
+
+    def span(self, name, category='shaclapi', **args):
+        return Span(self, name, category, args)
+
+    def complete(self, name, category, start, end, **args):
+        """Records a span with the given start and end time (seconds since the epoch, as returned by time.time())."""
+        self.events.append({'name': name, 'cat': category, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                            'pid': self.pid, 'tid': self.tid, 'args': args})
+
+    def instant(self, name, category='shaclapi', **args):
+        self.events.append({'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': time.time() * 1e6,
+                            'pid': self.pid, 'tid': self.tid, 'args': args})
+
+    def name_thread(self, name):
+        self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': self.tid, 'args': {'name': name}})
+
+    def ship(self, stats_queue, stage):
+        self.name_thread(stage)
+        stats_queue.put({'topic': 'trace', 'stage': stage, 'events': self.events})
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullTracer:
+    """Used, if tracing is turned off or no task is executed by the current thread; all spans are discarded."""
+
+    enabled = False
+
+    def span(self, name, category='shaclapi', **args):
+        return NULL_SPAN
+
+    def complete(self, name, category, start, end, **args):
+        pass
+
+    def instant(self, name, category='shaclapi', **args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+NULL_TRACER = NullTracer()
+_local = threading.local()
+
+
+def current():
+    """Returns the tracer of the task executed by the current thread."""
+    return getattr(_local, 'tracer', None) or NULL_TRACER
+
+
+def activate(tracer):
+    """Sets the tracer of the task executed by the current thread (None after the task)."""
+    _local.tracer = tracer
+
+
+def traced(name, category='shaclapi'):
+    """Decorator recording each call of the function as a span of the tracer of the current thread."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            tracer = current()
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export(events, trace_file, request_id):
+    """
+    Writes the events of a request to the trace_file in the Chrome trace event format (to be opened with chrome://tracing or Perfetto).
+    The processes are named after the steps of the pipeline they executed.
+    """
+    stages_per_process = {}
+    for event in events:
+        if event['ph'] == 'M' and event['name'] == 'thread_name':
+            stages_per_process.setdefault(event['pid'], []).append(event['args']['name'])
+    process_names = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': ', '.join(sorted(set(stages)))}}
+                     for pid, stages in stages_per_process.items()]
+    os.makedirs(os.path.dirname(trace_file) or '.', exist_ok=True)
+    with open(trace_file, 'w') as f:
+        json.dump({'traceEvents': process_names + events, 'displayTimeUnit': 'ms', 'otherData': {'request_id': request_id}}, f)
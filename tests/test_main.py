@@ -400,3 +400,845 @@ def test_remove_all_but_one_from_or_constraint(params):
     assert c.path == '^<http://example.org/testGraph6#property2>'
     assert c.options is None
     assert c.max == 0
+
+
+def test_shape_schema_cache(tmp_path):
+    import shutil
+    from shaclapi.config import Config
+    from shaclapi.reduction import prepare_validation
+    from shaclapi.reduction.ShapeSchemaCache import SHAPE_SCHEMA_CACHE
+
+    schema_dir = tmp_path / 'shapes'
+    shutil.copytree('./tests/tc6/shapes', schema_dir)
+    params = PARAMS_TC6.copy()
+    params['schemaDir'] = str(schema_dir)
+    params['prune_shape_network'] = False
+    params['remove_constraints'] = False
+
+    SHAPE_SCHEMA_CACHE.clear()
+    first = prepare_validation(Config.from_request_form(params), None, None)
+    second = prepare_validation(Config.from_request_form(params), None, None)
+    assert len(SHAPE_SCHEMA_CACHE.entries) == 1
+    assert len(first.shapes) == len(second.shapes) == 2
+    assert first.shapesDict['<http://example.org/ShapeA>'] is not second.shapesDict['<http://example.org/ShapeA>']
+
+    # Adding a shape file changes the version of the schema directory, i.e., the schema is parsed again.
+    (schema_dir / 'shapeC.ttl').write_text((schema_dir / 'shapeB.ttl').read_text().replace('ShapeB', 'ShapeC'))
+    third = prepare_validation(Config.from_request_form(params), None, None)
+    assert len(SHAPE_SCHEMA_CACHE.entries) == 1
+    assert len(third.shapes) == 3
+
+
+def test_reduced_schema_cache():
+    from shaclapi.config import Config
+    from shaclapi.reduction import prepare_validation
+    from shaclapi.reduction.ShapeSchemaCache import REDUCED_SCHEMA_CACHE
+
+    params = PARAMS_TC6.copy()
+    params['remove_constraints'] = False
+
+    REDUCED_SCHEMA_CACHE.clear()
+    first = prepare_validation(Config.from_request_form(params), None, None)
+    second = prepare_validation(Config.from_request_form(params), None, None)
+    assert len(REDUCED_SCHEMA_CACHE.entries) == 1
+    assert first.node_order == second.node_order == ['<http://example.org/ShapeA>', '<http://example.org/ShapeB>']
+
+
+def test_parse_reduced_schemas():
+    from shaclapi.config import Config
+    from shaclapi.reduction.travshacl.ReducedShapeParser import ReducedShapeParser
+    from TravSHACL.core.GraphTraversal import GraphTraversal
+
+    params = PARAMS_TC6.copy()
+    params['config'] = {k: v for k, v in LUBM_CONFIG_DICT.items() if k not in ['targetShape', 'target_shape']}
+    params['remove_constraints'] = False
+    params.pop('targetShape')
+    config = Config.from_request_form(params)
+    reduced_schemas, index = ReducedShapeParser(None, GraphTraversal.DFS, config).parse_reduced_schemas(
+        config.schema_directory, config.schema_format, True, 256, False)
+    assert reduced_schemas == {
+        '<http://example.org/ShapeA>': ['<http://example.org/ShapeA>', '<http://example.org/ShapeB>'],
+        '<http://example.org/ShapeB>': ['<http://example.org/ShapeB>']
+    }
+    assert index.affected_targets('<http://example.org/ShapeB>', list(reduced_schemas)) == list(reduced_schemas)
+    assert index.overlap(index.reachable_from('<http://example.org/ShapeA>'), index.reachable_from('<http://example.org/ShapeB>')) == 1.0
+
+
+@pytest.mark.parametrize('traversal', ['DFS', 'BFS'])
+def test_reachability_index_traversal_order(traversal):
+    from shaclapi.reduction.ReachabilityIndex import ReachabilityIndex
+    from TravSHACL.core.GraphTraversal import GraphTraversal
+
+    dependencies = {'A': ['B', 'C'], 'B': ['A', 'D'], 'C': ['E'], 'D': ['C'], 'E': [], 'F': ['A']}
+    index = ReachabilityIndex(dependencies)
+    for shape in dependencies:
+        expected = GraphTraversal[traversal].traverse_graph(dependencies, {s: [] for s in dependencies}, shape, True)
+        assert index.traversal_order(shape, GraphTraversal[traversal]) == expected
+        assert set(index.shapes_of(index.reachable_from(shape))) == set(expected)
+
+
+def test_reachability_index_independent_target_groups():
+    from shaclapi.reduction.ReachabilityIndex import ReachabilityIndex
+
+    index = ReachabilityIndex({'A': ['B'], 'B': [], 'C': ['B'], 'D': ['E'], 'E': [], 'F': []})
+    assert index.independent_target_groups(['A', 'D', 'C', 'F']) == [['D'], ['A', 'C'], ['F']]
+
+
+@pytest.mark.parametrize('shard_count', [1, 3, 16])
+def test_shard_filter(shard_count):
+    import rdflib
+    from shaclapi.reduction.Reduction import shard_filter
+
+    graph = rdflib.Graph().parse('tests/tc1/data/tc1.ttl')
+    query = 'PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?x WHERE {{ ?x a test1:classA . {} }}'
+    instances = {row.x for row in graph.query(query.format(''))}
+    shards = [{row.x for row in graph.query(query.format(shard_filter('?x', shard, shard_count)))} for shard in range(shard_count)]
+    assert set().union(*shards) == instances
+    assert sum(len(shard) for shard in shards) == len(instances)
+
+
+def test_target_instance_chunker():
+    from queue import Queue
+    from shaclapi.multiprocessing.contactSource import TargetInstanceChunker
+
+    queue = Queue()
+    chunker = TargetInstanceChunker(queue, ['?x', '?y'], chunk_size=2)
+    for var, instance in [('x', 'a'), ('x', 'a'), ('z', 'c'), ('Y', 'b'), ('x', 'c')]:
+        chunker.add(var, instance)
+    chunker.flush()
+    assert queue.get() == {'?x': ['a'], '?y': ['b']}
+    assert queue.get() == {'?x': ['c'], '?y': []}
+    assert queue.empty()
+
+
+def test_query_limit():
+    from shaclapi.query import Query
+
+    query = 'PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?x WHERE {\n?x a test1:classA .\n}'
+    assert Query.prepare_query(query).limit is None
+    assert Query.prepare_query(query + ' LIMIT 5 OFFSET 2').limit == 5
+
+
+def test_limit_stops_the_pipeline_early(tmp_path):
+    import time
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.generator import generate
+    from benchmarks.scenarios import generated_scenarios
+    from shaclapi.api import run_multiprocessing
+
+    # All targets are invalid, some of them already by the target shape itself, before the six other shapes are validated.
+    generate(str(tmp_path / 'workload'), triples=2000, depth=2, fan_out=2, invalid_ratio=1)
+    scenario = generated_scenarios(str(tmp_path / 'workload'))[0]
+    options = {'output_format': 'simple', 'run_in_serial': 'False', 'timeout': '120'}
+    with LocalSPARQLEndpoint(scenario.data, latency=0.2) as endpoint:
+        def run(request):
+            start, requests_before = time.time(), endpoint.number_of_requests
+            output = run_multiprocessing(request)
+            assert output.status == 'finished'
+            return output.output, time.time() - start, endpoint.number_of_requests - requests_before
+
+        results, seconds, requests = run(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert len(results) == len(scenario.expected['invalidTargets'])
+        for fused_pipeline in ['False', 'True']:
+            limited_results, limited_seconds, limited_requests = run(scenario.request(endpoint.url, dict(options, max_results='1', fused_pipeline=fused_pipeline), str(tmp_path)))
+            assert len(limited_results) == 1 and limited_requests < requests / 2 and limited_seconds < seconds / 2
+
+        # The LIMIT also restricts the targets, the single one left is only invalidated by one of the other shapes.
+        request = scenario.request(endpoint.url, options, str(tmp_path))
+        request['query'] += '\nLIMIT 1'
+        limited_results, limited_seconds, limited_requests = run(request)
+        assert len(limited_results) == 1 and limited_requests < requests and limited_seconds < seconds
+
+
+def test_cancellation_token():
+    import threading
+    from shaclapi.multiprocessing.CancellationToken import CancellationToken
+
+    event = threading.Event()
+    token = CancellationToken(event, check_interval=0)
+    other_token = CancellationToken(event, check_interval=0)
+    assert not token.is_cancelled() and not other_token.is_cancelled()
+    token.cancel()
+    assert token.is_cancelled() and other_token.is_cancelled()
+
+
+def test_receive_global_stats_deadline(tmp_path):
+    import csv
+    import time
+    from queue import Queue
+    from shaclapi.statsCalculation import StatsCalculation
+
+    stats_queue = Queue()
+    stats_queue.put({'topic': 'contactSource', 'time': (0, 1)})
+    stats_queue.put({'topic': 'first_validation_result', 'time': None})
+    unfinished = StatsCalculation('test', 'approach').receive_global_stats(stats_queue, deadline=time.time() + 0.1)
+    assert sorted(unfinished) == ['mp_post_processing', 'mp_validate', 'mp_xjoin']
+
+    # Timeout after the first validation result, while the join did not finish
+    stats = StatsCalculation('test', 'approach')
+    stats.globalCalculationStart()
+    stats_queue.put({'topic': 'contactSource', 'time': (0, 1)})
+    stats_queue.put({'topic': 'first_validation_result', 'time': time.time()})
+    stats_queue.put({'topic': 'mp_validate', 'time': (0, 2)})
+    assert sorted(stats.receive_global_stats(stats_queue, deadline=time.time() + 0.1)) == ['mp_post_processing', 'mp_xjoin']
+    stats.write_matrix_and_stats_files(None, None)
+    stats.globalCalculationFinished()
+    stats_file = os.path.join(str(tmp_path), 'stats.csv')
+    stats.write_matrix_and_stats_files(None, stats_file)
+    with open(stats_file) as f:
+        row = next(csv.DictReader(f))
+    assert row['join_time'] == 'NaN' and row['network_validation_time'] == '2' and float(row['total_execution_time']) >= 0
+
+
+def test_timeout_returns_partial_results(tmp_path):
+    import time
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.generator import generate
+    from benchmarks.scenarios import generated_scenarios
+    from shaclapi.api import run_multiprocessing
+
+    # Validating all targets takes about 15 seconds, the first invalid targets are known after about 2 seconds.
+    generate(str(tmp_path / 'workload'), triples=2000, depth=2, fan_out=2, invalid_ratio=1)
+    scenario = generated_scenarios(str(tmp_path / 'workload'))[0]
+    expected = {target for target, _ in scenario.expected['invalidTargets']}
+    with LocalSPARQLEndpoint(scenario.data, latency=0.5) as endpoint:
+        for fused_pipeline in ['False', 'True']:
+            options = {'output_format': 'simple', 'run_in_serial': 'False', 'timeout': '3', 'fused_pipeline': fused_pipeline}
+            start = time.time()
+            output = run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+            assert output.status == 'timeout' and time.time() - start < 3 + 2
+            targets = {result[0]['?x'][1:-1] for result in output.output}
+            assert 0 < len(targets) < len(expected) and targets <= expected
+
+
+def test_stats_file_with_other_columns(tmp_path):
+    import csv
+    from shaclapi.statsCalculation import StatsCalculation
+
+    stats_file = os.path.join(str(tmp_path), 'stats.csv')
+    old_rows = 'test,approach,total_execution_time,query_time,network_validation_time,join_time\nold,approach,1,1,1,1\n'
+    with open(stats_file, 'w') as f:
+        f.write(old_rows)
+    stats = StatsCalculation('new', 'approach')
+    stats.globalCalculationStart()
+    stats.globalCalculationFinished()
+    stats.write_matrix_and_stats_files(None, stats_file)
+    stats.write_matrix_and_stats_files(None, stats_file)
+
+    rotated = glob(os.path.join(str(tmp_path), 'stats.*.csv'))
+    assert len(rotated) == 1
+    with open(rotated[0]) as f:
+        assert f.read() == old_rows
+    with open(stats_file) as f:
+        rows = list(csv.DictReader(f))
+    assert [row['test'] for row in rows] == ['new', 'new'] and 'dief@t' in rows[0]
+
+
+def test_sharded_validation_reuses_workers(tmp_path):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+    from shaclapi.multiprocessing.functions import VALIDATION_WORKERS
+
+    # With the fused pipeline, the shards are validated by the workers of the calling process.
+    scenario = find_scenarios(['tests/tc1/test1'])[0]
+    options = {'validation_shards': '2', 'fused_pipeline': 'True', 'timeout': '60'}
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        output = run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert output.status == 'finished' and scenario.check(output.output)
+        workers = {worker.process.pid for worker in VALIDATION_WORKERS.idle_workers}
+        assert len(workers) == 2
+        output = run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert output.status == 'finished' and scenario.check(output.output)
+        assert {worker.process.pid for worker in VALIDATION_WORKERS.idle_workers} == workers
+
+
+def test_sharded_validation_skips_empty_shards(tmp_path):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+
+    # The last of the three shards has no FullProfessor; the targets of FullProfessor are filtered by the validated University and Department.
+    scenario = find_scenarios(['examples/lubm'])[0]
+    options = {'output_format': 'test', 'timeout': '60'}
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        expected = run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert expected.status == 'finished' and expected.output['validTargets'] and expected.output['invalidTargets']
+        output = run_multiprocessing(scenario.request(endpoint.url, dict(options, validation_shards='3'), str(tmp_path)))
+        assert output.status == 'finished'
+        for key in ('validTargets', 'invalidTargets'):
+            assert sorted(output.output[key]) == sorted(expected.output[key])
+
+
+def test_sideways_information_passing_prepares_validation_once(tmp_path, monkeypatch):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+    from shaclapi.multiprocessing import functions
+
+    schemas = []
+    prepare_validation = functions.prepare_validation
+
+    def counting_prepare_validation(*args):
+        schemas.append(prepare_validation(*args))
+        return schemas[-1]
+
+    monkeypatch.setattr(functions, 'prepare_validation', counting_prepare_validation)
+
+    # Each target instance is validated in its own chunk; ShapeA is referenced by the target shape and has a target definition.
+    scenario = find_scenarios(['tests/tc1/test4'])[0]
+    options = {'sideways_information_passing': 'True', 'target_instance_chunk_size': '1', 'fused_pipeline': 'True', 'timeout': '60'}
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        output = run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+    assert output.status == 'finished' and scenario.check(output.output)
+    assert len(schemas) == 1
+    target_query = schemas[0].shapeParser.shape_get_target_query(schemas[0].shapesDict['<http://example.org/ShapeA>'])
+    assert '?shaclapi_source' in target_query
+
+
+def test_filter_result_polarity():
+    from shaclapi.multiprocessing.functions import filter_result_polarity
+
+    target_shape = {'?x': ['<http://example.org/ShapeA>']}
+    valid = {'id': 1, 'var': 'x', 'instance': 'a', 'validation': ('<http://example.org/ShapeA>', True, 'a')}
+    invalid = {'id': 2, 'var': 'x', 'instance': 'b', 'validation': ('<http://example.org/ShapeA>', False, 'b')}
+    other_shape = {'id': 3, 'var': 'x', 'instance': 'c', 'validation': ('<http://example.org/ShapeB>', False, 'c')}
+    assert filter_result_polarity(target_shape, True, valid) == valid
+    assert filter_result_polarity(target_shape, True, invalid) == {'id': 2, 'discard': True}
+    assert filter_result_polarity(target_shape, True, other_shape) == other_shape
+    assert filter_result_polarity(target_shape, False, valid) == {'id': 1, 'discard': True}
+
+
+@pytest.mark.parametrize('fused_pipeline', ['False', 'True'])
+@pytest.mark.parametrize('constraint, expected_valid, expected_invalid', [
+    ({'path': 'ub:email', 'max': 0}, [], [':Prof3', ':Prof5']),
+    ({'path': 'ub:email', 'min': 1}, [':Prof0', ':Prof1', ':Prof2', ':Prof4'], [])
+])
+def test_result_polarity_with_two_target_shapes(tmp_path, fused_pipeline, constraint, expected_valid, expected_invalid):
+    import shutil
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+
+    # All professors violate (or satisfy) the second target shape of ?prof; Prof3 and Prof5 violate FullProfessor.
+    # The mappings only bind ?prof, so one of both finishes with its first validation result, if the other one of ?prof is not awaited.
+    shutil.copytree('examples/lubm/shapes', str(tmp_path / 'shapes'))
+    with open(str(tmp_path / 'shapes' / 'Contact.json'), 'w') as f:
+        json.dump({'name': 'Contact', 'targetDef': {'query': 'SELECT ?x WHERE {?x a ub:FullProfessor}', 'class': 'ub:FullProfessor'},
+                   'prefix': {'ub': '<http://swat.cse.lehigh.edu/onto/univ-bench.owl#>'},
+                   'constraintDef': {'conjunctions': [[constraint]]}}, f)
+    scenario = find_scenarios(['examples/lubm'])[0]
+    options = {'output_format': 'simple', 'run_in_serial': 'False', 'fused_pipeline': fused_pipeline, 'timeout': '60',
+               'schemaDir': str(tmp_path / 'shapes'), 'targetShape': {'?prof': ['FullProfessor', 'Contact']},
+               'query': 'PREFIX ub:<http://swat.cse.lehigh.edu/onto/univ-bench.owl#>\nPREFIX :<http://example.com/>\n'
+                        'SELECT ?prof WHERE {\n  ?prof a ub:FullProfessor .\n  ?prof ub:worksFor :Dept0\n}'}
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        for polarity, expected in [('only_valid', expected_valid), ('only_invalid', expected_invalid)]:
+            output = run_multiprocessing(scenario.request(endpoint.url, dict(options, **{polarity: 'True'}), str(tmp_path)))
+            assert output.status == 'finished'
+            assert sorted(result[0]['?prof'] for result in output.output) == expected
+
+
+@pytest.mark.parametrize('group_by', [None, '?x'])
+def test_validation_counts(group_by):
+    from shaclapi.aggregation import ValidationCounts
+
+    counts = ValidationCounts(group_by, {'?x': ['ShapeA']})
+    counts.add_mapping([{'instance': 'a', 'var': 'x', 'validation': ('ShapeA', True, 'a')}, {'instance': 'l', 'var': 'lit', 'validation': None}])
+    # The binding of the variable y, which is no target variable, is not counted.
+    counts.add_mapping([{'instance': 'b', 'var': 'x', 'validation': ('ShapeA', False, 'b')}, {'instance': 'c', 'var': 'y', 'validation': ('ShapeB', False, 'c')}])
+    if group_by is None:
+        assert counts.summary() == {'ShapeA': {'valid': 1, 'invalid': 1}}
+    else:
+        assert counts.summary() == {'ShapeA': {'a': {'valid': 1, 'invalid': 0}, 'b': {'valid': 0, 'invalid': 1}}}
+
+    undefined = ValidationCounts(target_shape={'UNDEF': ['ShapeB']})
+    undefined.add_mapping([{'instance': 'a', 'var': 'x', 'validation': ('ShapeA', True, 'a')}, {'instance': 'c', 'var': 'y', 'validation': ('ShapeB', False, 'c')}])
+    assert undefined.summary() == {'ShapeB': {'valid': 0, 'invalid': 1}}
+
+
+def test_aggregate_counts_each_target_once(tmp_path):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from shaclapi.api import run_multiprocessing
+
+    # The query has 10 results, 4 of the 6 targets occur in two results (one per value of ?lit).
+    params = {'query': 'PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?v0 ?lit WHERE {\n?v0 a test1:classE .\n?v0 test1:has ?lit .\n}',
+              'targetShape': '<http://example.org/ShapeE>', 'schemaDir': './tests/tc1/shapes/test1_2_3', 'config': 'tests/configs/lubm_config.json',
+              'output_format': 'aggregate', 'outputDirectory': str(tmp_path)}
+    with LocalSPARQLEndpoint(['./tests/tc1/data/tc1.ttl']) as endpoint:
+        output = run_multiprocessing(dict(params, external_endpoint=endpoint.url))
+    assert output.status == 'finished' and output.output == {'<http://example.org/ShapeE>': {'valid': 4, 'invalid': 2}}
+
+    # Grouped by the target variable, each group holds a single target.
+    with LocalSPARQLEndpoint(['./tests/tc1/data/tc1.ttl']) as endpoint:
+        output = run_multiprocessing(dict(params, external_endpoint=endpoint.url, aggregate_group_by='?v0'))
+    counts = output.output['<http://example.org/ShapeE>']
+    assert len(counts) == 6 and all(sum(group.values()) == 1 for group in counts.values())
+
+
+def test_result_store_pagination(tmp_path):
+    from shaclapi.resultStore import ResultStore
+
+    store = ResultStore(directory=str(tmp_path), max_handles=2)
+    handle = store.create({'instance': i} for i in range(25))
+    assert store.size(handle) == 25
+    instances, cursor, pages = [], None, 0
+    while pages == 0 or cursor is not None:
+        results, cursor = store.page(handle, cursor, limit=10)
+        instances += [result['instance'] for result in results]
+        pages += 1
+    assert instances == list(range(25)) and pages == 3
+    with pytest.raises(KeyError):
+        store.page('../' + handle)
+
+    store.create([])
+    store.create([])
+    with pytest.raises(KeyError):
+        store.page(handle)
+
+
+def test_job_manager(tmp_path):
+    import threading
+    import time
+    from queue import Queue
+    from shaclapi.jobs import JobManager, JobNotFinished
+    from shaclapi.output import Output
+    from shaclapi.resultStore import ResultStore
+
+    def new_result_queue():
+        queue = Queue()
+        return Namespace(sender=queue, receiver=queue)
+
+    proceed = threading.Event()
+
+    def run(pre_config, result_queue, stats_callback=None):
+        if pre_config.get('wait'):
+            proceed.wait()
+        for i in range(int(pre_config['results'])):
+            result_queue.sender.put({'result': i})
+        result_queue.sender.put('EOF')
+        return Output(None, 'finished')
+
+    manager = JobManager(store=ResultStore(directory=str(tmp_path), max_handles=None), max_age=0.5, run=run, new_result_queue=new_result_queue)
+    job = manager.submit({'results': 5})
+    assert [result['result'] for result in manager.stream(job.id)] == list(range(5))
+    assert manager.status(job.id)['status'] == 'finished' and manager.status(job.id)['results'] == 5
+    assert len(manager.result(job.id)) == 5
+
+    time.sleep(0.6)
+    manager.evict()
+    with pytest.raises(KeyError):
+        manager.status(job.id)
+    assert not os.listdir(str(tmp_path))
+
+    job = manager.submit({'results': 1, 'wait': True})
+    with pytest.raises(JobNotFinished):
+        manager.result(job.id)
+    proceed.set()
+    assert list(manager.stream(job.id)) == [{'result': 0}]
+    assert manager.result(job.id) == [{'result': 0}]
+
+
+def test_request_coalescer():
+    import threading
+    from shaclapi.coalescing import RequestCoalescer, canonical_hash
+    from shaclapi.output import Output
+
+    assert canonical_hash({'a': 1, 'b': [2]}) == canonical_hash({'b': [2], 'a': 1})
+
+    executions = []
+    proceed = threading.Event()
+
+    def run(pre_config):
+        executions.append(pre_config['query'])
+        proceed.wait()
+        return Output([{'result': pre_config['query']}], 'finished')
+
+    coalescer = RequestCoalescer(run=run)
+    outputs = []
+    requests = [{'query': 'A', 'config': {}}, {'config': {}, 'query': 'A'}, {'query': 'B', 'config': {}}]
+    threads = [threading.Thread(target=lambda r=r: outputs.append(coalescer.run_multiprocessing(r))) for r in requests]
+    for thread in threads:
+        thread.start()
+    while len(executions) < 2:
+        proceed.wait(0.01)
+    proceed.set()
+    for thread in threads:
+        thread.join()
+    assert sorted(executions) == ['A', 'B']
+    assert sorted(output.output[0]['result'] for output in outputs) == ['A', 'A', 'B']
+    assert not coalescer.in_flight
+
+
+def test_request_coalescer_with_response_cache(tmp_path):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.coalescing import RequestCoalescer
+    from shaclapi.output import StreamedOutput
+    from shaclapi.responseCache import ResponseCache
+
+    coalescer = RequestCoalescer(response_cache=ResponseCache(directory=str(tmp_path / 'cache')))
+    scenario = find_scenarios(['tests/tc1/test1'])[0]
+    options = {'fused_pipeline': 'True', 'use_response_cache': 'True', 'timeout': '60'}
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        output = coalescer.run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert output.status == 'finished' and scenario.check(output.output)
+        cached = coalescer.run_multiprocessing(scenario.request(endpoint.url, options, str(tmp_path)))
+        assert isinstance(cached, StreamedOutput) and scenario.check(cached.output)
+
+
+def test_response_cache(tmp_path):
+    import json
+    from shaclapi.output import StreamedOutput
+    from shaclapi.responseCache import ResponseCache
+
+    schema_dir = tmp_path / 'shapes'
+    schema_dir.mkdir()
+    (schema_dir / 'ShapeA.ttl').write_text('')
+    config = Namespace(config_dict={'query': 'A'}, schema_directory=str(schema_dir), schema_format='SHACL')
+    cache = ResponseCache(directory=str(tmp_path / 'cache'), max_entries=2)
+    key = cache.key(config)
+    assert cache.get(key) is None
+    cache.put(key, [{'result': 1}, {'result': 2}])
+    assert list(cache.get(key)) == [{'result': 1}, {'result': 2}]
+    assert json.loads(''.join(StreamedOutput(cache.get(key), 'simple').iter_json())) == [{'result': 1}, {'result': 2}]
+    assert json.loads(''.join(StreamedOutput(iter([]), 'simple').iter_json())) == []
+
+    # Changing the shape schema changes the key
+    (schema_dir / 'ShapeB.ttl').write_text('')
+    assert cache.key(config) != key
+
+    cache.put('b' * 64, [])
+    cache.put('c' * 64, [])
+    assert cache.get(key) is None  # least recently used
+
+    # A restarted process finds the entries of the directory and removes the least recently used ones
+    restarted_cache = ResponseCache(directory=str(tmp_path / 'cache'), max_entries=1)
+    assert list(restarted_cache.entries) == ['c' * 64] and not os.path.exists(restarted_cache.path('b' * 64))
+    assert list(restarted_cache.get('c' * 64)) == []
+    assert not ResponseCache(directory=str(tmp_path / 'cache'), ttl=-1).entries
+    assert not os.listdir(str(tmp_path / 'cache'))
+    cache.put('c' * 64, [])
+    assert cache.purge() == 2 and cache.get('c' * 64) is None
+
+
+def test_in_process_runner():
+    from shaclapi.multiprocessing.runner import InProcessRunner
+    from shaclapi.query import Query
+
+    def double(in_queue, out_queue):
+        for item in iter(in_queue.get, 'EOF'):
+            out_queue.put(2 * item)
+
+    runner = InProcessRunner(double, number_of_out_queues=1)
+    in_queue = runner.get_new_channel(False)
+    out_queue = runner.get_new_out_queues(False)[0]
+    stats_queue = runner.get_new_queue()
+    for item in (1, 2, 'EOF'):
+        in_queue.sender.put(item)
+    runner.new_task((in_queue.receiver, ), (out_queue.sender, ), (), stats_queue, wait_for_finish=True)
+    assert list(iter(out_queue.receiver.get, 'EOF')) == [2, 4]
+    assert [stats_queue.get()['topic'] for _ in range(2)] == ['metrics', 'double']
+
+    query = Query.prepare_query('PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?x WHERE {\n?x a test1:classA .\n} LIMIT 5')
+    assert 'SELECT (COUNT(*) AS ?count) WHERE {\nSELECT ?x' in query.as_count_query().query_string
+
+
+def test_in_process_runner_stops_cancelled_task():
+    from shaclapi.multiprocessing.CancellationToken import CancellationToken
+    from shaclapi.multiprocessing.runner import InProcessRunner
+
+    def forward(in_queue, out_queue, cancellation_token=None):
+        for item in iter(in_queue.get, 'EOF'):
+            out_queue.put(item)
+
+    runner = InProcessRunner(forward, number_of_out_queues=1, exclusive=True)
+    in_queue = runner.get_new_channel(False)
+    out_queue = runner.get_new_out_queues(False, 1)[0]
+    cancellation_token = CancellationToken(runner.get_new_event())
+    for item in (1, 2):
+        in_queue.sender.put(item)
+    assert runner.reserve() and not runner.reserve()
+    runner.new_task((in_queue.receiver, ), (out_queue.sender, ), (), runner.get_new_queue(), cancellation_token=cancellation_token)
+
+    # The task is blocked by the full out queue and waits for the end of the in queue.
+    thread = runner.tasks[cancellation_token][0]
+    thread.join(0.2)
+    assert thread.is_alive()
+    cancellation_token.cancel()
+    assert runner.stop_task(cancellation_token) and not thread.is_alive()
+    assert runner.reserve() and cancellation_token not in runner.tasks
+    assert list(iter(out_queue.receiver.get, 'EOF')) == [1]
+
+
+def test_in_process_validation_is_reserved(tmp_path, monkeypatch):
+    import threading
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi import api
+
+    runner = api.FUSED_RUNNERS['mp_validate']
+    scenario = find_scenarios(['tests/tc1/test1'])[0]
+
+    # A request failing before its validation task is started releases the reservation.
+    def failing_transmitter(*args, **kwargs):
+        raise RuntimeError('setup failed')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(api, 'ValidationResultTransmitter', failing_transmitter)
+        with pytest.raises(RuntimeError):
+            api.run_multiprocessing(scenario.request('http://localhost:1/sparql', {'fused_pipeline': 'True'}, str(tmp_path)))
+    assert runner.reserve()
+
+    # The validation of /validation waits for the reservation, since it is executed in this process as well.
+    outputs = []
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        thread = threading.Thread(target=lambda: outputs.append(api.validation_and_statistics(scenario.request(endpoint.url))))
+        thread.start()
+        thread.join(0.5)
+        assert thread.is_alive()
+        runner.release()
+        thread.join()
+    assert outputs[0] and runner.reserve()
+    runner.release()
+
+
+def test_bounded_channels_and_incremental_bindings():
+    import json
+    import queue
+    from shaclapi.multiprocessing.PipeAdapter import QueueAdapter
+    from shaclapi.multiprocessing.contactSource import iter_bindings
+
+    channel = QueueAdapter(queue, maxsize=2)
+    channel.sender.put(1)
+    channel.sender.put(2)
+    with pytest.raises(queue.Full):
+        channel.sender.put(3, timeout=0.01)
+
+    bindings = [{'x': {'type': 'uri', 'value': 'http://example.org/{}"]ä'.format(i)}} for i in range(20)]
+    raw = json.dumps({'head': {'vars': ['x']}, 'results': {'bindings': bindings}}).encode('utf8')
+    for size in (1, 7, len(raw)):
+        assert list(iter_bindings(raw[i:i + size] for i in range(0, len(raw), size))) == bindings
+    response = {}
+    assert list(iter_bindings([b'{"head": {}, "boolean": true}'], response=response)) == [] and response['boolean'] is True
+    with pytest.raises(ValueError):
+        list(iter_bindings([raw[:-10]]))
+
+
+def test_serial_mode_with_bounded_queues(tmp_path):
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+    from shaclapi.config import Config
+
+    assert Config.from_request_form({'run_in_serial': 'True', 'queue_capacity': '1'}).queue_capacity == 0
+    # The steps are executed one after the other, hence, a bounded queue would never be drained.
+    scenario = find_scenarios(['tests/tc1/test1'])[0]
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        output = run_multiprocessing(scenario.request(endpoint.url, {'run_in_serial': 'True', 'use_pipes': 'False', 'queue_capacity': '1', 'timeout': '30'},
+                                                      str(tmp_path)))
+    assert output.status == 'finished' and scenario.check(output.output)
+
+
+def test_answer_trace_metrics():
+    from shaclapi.answerTrace import dief_at_k, dief_at_t, trace_metrics
+
+    trace = [1.0, 2.0, 4.0]
+    # Points (1, 1), (2, 2), (4, 3) and (5, 3) at t=5
+    assert dief_at_t(trace, 5) == pytest.approx(1.5 + 5 + 3)
+    assert dief_at_t(trace, 0.5) == 0
+    # Points (1, 1), (2, 2), (3, 4)
+    assert dief_at_k(trace, 3) == pytest.approx(1.5 + 3)
+    assert dief_at_k(trace, 1) == 0
+    metrics = trace_metrics(trace, 5.0)
+    assert metrics['ttft'] == 1.0 and metrics['completeness'] == 3 and metrics['throughput'] == pytest.approx(0.6)
+    assert trace_metrics([], 1.0)['ttft'] is None
+
+
+def test_stage_metrics():
+    import queue
+    from shaclapi.metrics import MeteredReceiver, MeteredSender, MetricsRegistry, StageMetrics, summary
+
+    stage_metrics = StageMetrics()
+    receiver = MeteredReceiver(queue.Queue(), stage_metrics)
+    sender = MeteredSender(receiver.receiver, stage_metrics)
+    for item in (1, 2, 'EOF'):
+        sender.put(item)
+    assert list(iter(receiver.get, 'EOF')) == [1, 2]
+    stage_metrics.count('join_spills')
+    shipped = stage_metrics.to_dict()
+    assert shipped['counters'] == {'items_in': 2, 'items_out': 2, 'join_spills': 1}
+    assert shipped['histograms']['item_seconds']['count'] == 2 and shipped['histograms']['queue_depth']['count'] == 1
+
+    assert summary({'mp_xjoin': shipped}, {'mp_xjoin': 0.5})['mp_xjoin']['seconds'] == 0.5
+    registry = MetricsRegistry()
+    registry.add_request('finished', 0.2, {'mp_xjoin': shipped}, {'mp_xjoin': 0.5})
+    registry.add_request('finished', 0.3, {'mp_xjoin': shipped}, {'mp_xjoin': 0.5})
+    text = registry.prometheus()
+    assert 'shaclapi_items_in_total{stage="mp_xjoin"} 4' in text
+    assert 'shaclapi_requests_total{status="finished"} 2' in text
+    assert 'shaclapi_stage_seconds_bucket{stage="mp_xjoin",le="+Inf"} 2' in text
+    assert 'shaclapi_request_seconds_count 2' in text
+
+
+def test_profiling(tmp_path):
+    import time
+    from shaclapi.profiling import TaskProfiler, report
+
+    def busy():
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+
+    profiles = {}
+    for stage in ('mp_validate', 'mp_xjoin'):
+        profiler = TaskProfiler(interval=0.001)
+        profiler.start()
+        busy()
+        profiles[stage] = profiler.stop()
+    assert profiles['mp_xjoin']['stacks'] and any('busy' in stack for stack in profiles['mp_xjoin']['stacks'])
+
+    result = report(profiles, str(tmp_path), top=5)
+    assert set(result) == {'mp_validate', 'mp_xjoin', 'all'}
+    assert 'busy' in result['all']['top']
+    assert all(line.startswith(('mp_validate;', 'mp_xjoin;')) for line in result['all']['collapsed'].splitlines())
+    assert sorted(os.listdir(str(tmp_path))) == sorted(name + suffix for name in result for suffix in ('.prof', '.folded'))
+
+
+def test_memory_tracer():
+    import time
+    import tracemalloc
+    from shaclapi.memoryTracing import MemoryTracer
+
+    tracer = MemoryTracer(top=3, interval=0.001)
+    tracer.start()
+    table = [bytes(1000) for _ in range(2000)]
+    time.sleep(0.05)
+    del table
+    memory = tracer.stop()
+    assert not tracemalloc.is_tracing()
+    assert memory['peak_traced'] >= 2000 * 1000 and memory['peak_rss'] > 0
+    assert len(memory['top_allocations']) <= 3
+    assert memory['top_allocations'][0]['site'].startswith(__file__) and memory['top_allocations'][0]['count'] >= 2000
+
+
+def test_memory_tracer_without_resource(monkeypatch):
+    from shaclapi import memoryTracing
+
+    def no_proc(*args, **kwargs):
+        raise OSError()
+
+    # Windows has neither the resource module nor /proc.
+    monkeypatch.setattr(memoryTracing, 'resource', None)
+    monkeypatch.setattr(memoryTracing, 'open', no_proc, raising=False)
+    tracer = memoryTracing.MemoryTracer()
+    tracer.start()
+    memory = tracer.stop()
+    assert memory['peak_rss'] is None and memory['peak_traced'] > 0
+
+
+def test_tracing(tmp_path):
+    import queue
+    from shaclapi import tracing
+
+    @tracing.traced('work', 'test')
+    def work():
+        tracing.current().instant('inside')
+        return 42
+
+    assert tracing.current() is tracing.NULL_TRACER and work() == 42
+    tracer = tracing.Tracer('request')
+    tracing.activate(tracer)
+    try:
+        assert work() == 42
+        with tracing.current().span('outer', 'test', shape='ShapeA'):
+            pass
+    finally:
+        tracing.activate(None)
+    stats_queue = queue.Queue()
+    tracer.ship(stats_queue, 'mp_xjoin')
+    events = stats_queue.get()['events']
+    assert [(event['ph'], event['name']) for event in events] == [('i', 'inside'), ('X', 'work'), ('X', 'outer'), ('M', 'thread_name')]
+    assert events[2]['args'] == {'shape': 'ShapeA'} and events[1]['dur'] >= 0
+
+    trace_file = os.path.join(str(tmp_path), 'traces', 'request.json')
+    tracing.export(events, trace_file, 'request')
+    with open(trace_file) as f:
+        trace = json.load(f)
+    assert trace['otherData'] == {'request_id': 'request'}
+    assert trace['traceEvents'][0]['name'] == 'process_name' and trace['traceEvents'][0]['args'] == {'name': 'mp_xjoin'}
+
+
+def test_benchmark_endpoint():
+    import time
+    from SPARQLWrapper import JSON, SPARQLWrapper
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.scenarios import find_scenarios
+
+    with LocalSPARQLEndpoint(['./tests/tc1/data/tc1.ttl'], latency=0.05) as endpoint:
+        sparql = SPARQLWrapper(endpoint.url)
+        sparql.setReturnFormat(JSON)
+        sparql.setQuery('PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?x WHERE { ?x a test1:classE . }')
+        start = time.perf_counter()
+        bindings = sparql.query().convert()['results']['bindings']
+        assert time.perf_counter() - start >= 0.05
+        assert len(bindings) == 7 and endpoint.number_of_requests == 1
+        # Constraint query of Trav-SHACL counting the values of an OPTIONAL
+        sparql.setQuery('PREFIX test1: <http://example.org/testGraph1#>\nSELECT ?x (COUNT(DISTINCT ?y) AS ?cnt) WHERE { ?x a test1:classE OPTIONAL { ?x test1:unknown ?y } } GROUP BY ?x')
+        assert {binding['cnt']['value'] for binding in sparql.query().convert()['results']['bindings']} == {'0'}
+
+    scenarios = find_scenarios(['tests/tc1/test1', 'examples/*'])
+    assert [scenario.name for scenario in scenarios] == ['examples/dbpedia', 'examples/lubm', 'examples/lubm_extended', 'tests/tc1/test1']
+    assert scenarios[0].data is None and os.path.isabs(scenarios[3].params['schemaDir'])
+    request = scenarios[3].request('http://localhost/sparql', {'fused_pipeline': 'True'})
+    assert request['external_endpoint'] == 'http://localhost/sparql' and request['config']['output_format'] == 'test'
+    assert scenarios[3].check(scenarios[3].expected) and not scenarios[3].check({'validTargets': [], 'invalidTargets': []})
+
+
+def test_data_generator(tmp_path):
+    import json
+    from rdflib import Graph
+    from benchmarks.generator import generate
+    from benchmarks.harness import run_benchmark
+    from benchmarks.scenarios import find_scenarios
+
+    summary = generate(str(tmp_path / 'generated'), triples=240, depth=1, fan_out=2, links=2, invalid_ratio=0.25, arms=2)
+    assert summary['targets'] == 12 and summary['invalid_targets'] == 3 and summary['shapes'] == 3
+    graph = Graph().parse(str(tmp_path / 'generated' / 'data.nt'))
+    assert len(graph) == summary['triples']
+    assert len(Graph().parse(str(tmp_path / 'generated' / 'shapes' / 'ttl' / 'FullProfessor.ttl'))) > 0
+    with open(str(tmp_path / 'generated' / 'shapes' / 'json' / 'FullProfessor.json')) as f:
+        assert [c.get('shape') for c in json.load(f)['constraintDef']['conjunctions'][0]] == [None, None, None, 'Department_1', 'Department_2']
+
+    scenarios = find_scenarios(['generated/*/*_q2'], [str(tmp_path / 'generated')])
+    assert [scenario.name for scenario in scenarios] == ['generated/generated/json_q2', 'generated/generated/ttl_q2']
+    rows = run_benchmark(scenarios, repetitions=1, warmup=0, measure_memory=False, output_directory=str(tmp_path / 'output'))
+    assert [(row['status'], row['correct']) for row in rows] == [('finished', True)] * 2
+
+
+def test_join_replay(tmp_path):
+    from glob import glob
+    from benchmarks.endpoint import LocalSPARQLEndpoint
+    from benchmarks.replay import replay, run_replays, summarize
+    from benchmarks.scenarios import find_scenarios
+    from shaclapi.api import run_multiprocessing
+    from shaclapi.joinRecording import LEFT, RIGHT, read_recording
+
+    scenario = find_scenarios(['tests/tc1/test1'])[0]
+    with LocalSPARQLEndpoint(scenario.data) as endpoint:
+        output = run_multiprocessing(scenario.request(endpoint.url, {'record_join_inputs': 'True'}, str(tmp_path)))
+    assert output.status == 'finished' and scenario.check(output.output)
+    recordings = glob(os.path.join(str(tmp_path), 'recordings', '*.ndjson.gz'))
+    assert len(recordings) == 1
+    items = read_recording(recordings[0])
+    assert sorted(stream for stream, _, item in items if item == 'EOF') == [LEFT, RIGHT]
+    assert [seconds for _, seconds, _ in items] == sorted(seconds for _, seconds, _ in items)
+
+    result = replay(items, 'xgoptional', speed=0.5)
+    assert result['inputs'] == len(items) - 2 and result['outputs'] > 0
+    assert result['wall_time'] >= items[-1][1] / 0.5 and result['latency_max'] >= result['latency_median'] >= 0
+    assert result['peak_rss'] > 0
+    assert replay(items, 'xgjoin', speed=0, measure_memory=False)['outputs'] == result['outputs']
+
+    summary = summarize(run_replays(recordings, ['xgoptional', 'xgjoin'], [0], repetitions=2, measure_memory=False))
+    assert [(entry['join'], entry['repetitions'], entry['outputs']) for entry in summary] == [('xgoptional', 2, result['outputs']), ('xgjoin', 2, result['outputs'])]